@@ -0,0 +1,395 @@
+"""
+asyncio send engine for MERCI RAYMOND Email Automation.
+
+Everything a campaign needs runs in one event loop: async SMTP sessions,
+awaitable pacing timers, MIME building offloaded to an executor and
+cancellation. Several engines (campaigns or Gmail accounts) can share the
+same loop without a thread per sleeping sender.
+"""
+
+import asyncio
+import base64
+import re
+import smtplib
+import ssl
+import time
+from concurrent.futures import Executor
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Tuple
+
+from domain_scheduler import DomainPacer, recipient_domain
+from smtp_policy import CANCELLED_ERROR, AIMDController, Pacer, is_temporary_failure, is_throttling_reply
+
+if TYPE_CHECKING:
+    from campaign_metrics import CampaignMetrics
+
+# Normalize any line ending to CRLF, then escape lines starting with a dot
+_LINE_ENDINGS = re.compile(r'(?:\r\n|\n|\r(?!\n))')
+_LEADING_DOT = re.compile(r'(?m)^\.')
+
+# End of the items, returned by next() in the executor
+_EXHAUSTED = object()
+
+
+class AsyncSMTPSession:
+    """Minimal SMTP client on asyncio streams (EHLO, STARTTLS, AUTH PLAIN, MAIL/RCPT/DATA)."""
+
+    def __init__(self, host: str, port: int, timeout: float = 60):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def _read_reply(self) -> Tuple[int, str]:
+        lines = []
+        while True:
+            line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+            if not line:
+                raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+            text = line.decode('utf-8', 'replace').rstrip('\r\n')
+            lines.append(text[4:])
+            if text[3:4] != '-':
+                return int(text[:3]), '\n'.join(lines)
+
+    async def command(self, line: str) -> Tuple[int, str]:
+        """Send one SMTP command and return (code, message)."""
+        if self._writer is None:
+            raise smtplib.SMTPServerDisconnected("Not connected")
+        self._writer.write(f"{line}\r\n".encode('utf-8'))
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def connect(self, use_starttls: bool = True, username: Optional[str] = None,
+                      password: Optional[str] = None) -> 'AsyncSMTPSession':
+        """Open the connection, upgrade to TLS and authenticate if requested."""
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout)
+        code, message = await self._read_reply()
+        if code != 220:
+            await self.close()
+            raise smtplib.SMTPConnectError(code, message)
+
+        await self._ehlo()
+        if use_starttls:
+            code, message = await self.command('STARTTLS')
+            if code != 220:
+                raise smtplib.SMTPNotSupportedError(f"STARTTLS refusé: {code} {message}")
+            await self._writer.start_tls(ssl.create_default_context(), server_hostname=self.host)
+            await self._ehlo()
+        if username:
+            credentials = base64.b64encode(f"\0{username}\0{password}".encode('utf-8')).decode('ascii')
+            code, message = await self.command(f'AUTH PLAIN {credentials}')
+            if code != 235:
+                raise smtplib.SMTPAuthenticationError(code, message)
+        return self
+
+    async def _ehlo(self):
+        code, message = await self.command('EHLO localhost')
+        if code != 250:
+            raise smtplib.SMTPHeloError(code, message)
+
+    async def sendmail(self, from_addr: str, recipients: List[str], message) -> Dict[str, Tuple[int, str]]:
+        """Send one message. Raises smtplib exceptions like smtplib.SMTP.sendmail."""
+        if isinstance(message, bytes):
+            message = message.decode('utf-8')
+
+        code, reply = await self.command(f'MAIL FROM:<{from_addr}>')
+        if code != 250:
+            await self._reset()
+            raise smtplib.SMTPSenderRefused(code, reply, from_addr)
+
+        refused = {}
+        for recipient in recipients:
+            code, reply = await self.command(f'RCPT TO:<{recipient}>')
+            if code not in (250, 251):
+                refused[recipient] = (code, reply)
+        if len(refused) == len(recipients):
+            await self._reset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        code, reply = await self.command('DATA')
+        if code != 354:
+            await self._reset()
+            raise smtplib.SMTPDataError(code, reply)
+
+        data = _LEADING_DOT.sub('..', _LINE_ENDINGS.sub('\r\n', message))
+        if not data.endswith('\r\n'):
+            data += '\r\n'
+        self._writer.write(data.encode('utf-8') + b'.\r\n')
+        await self._writer.drain()
+        code, reply = await self._read_reply()
+        if code != 250:
+            await self._reset()
+            raise smtplib.SMTPDataError(code, reply)
+        return refused
+
+    async def _reset(self):
+        try:
+            await self.command('RSET')
+        except Exception:
+            pass
+
+    async def close(self):
+        """Say QUIT if possible and close the stream."""
+        if self._writer is None:
+            return
+        try:
+            await self.command('QUIT')
+        except Exception:
+            pass
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except Exception:
+            pass
+        self._writer = None
+
+
+class AsyncSendEngine:
+    """
+    Concurrent campaign sender on one event loop.
+
+    Items are turned into send jobs by `build_job` (run in an executor,
+    off the event loop). A job is a dict with 'from_addr', 'recipients'
+    and 'message'. Concurrency follows the AIMD rule of smtp_policy, and
+    pacing is a shared awaitable timer, followed by the per-domain spacing
+    of the recipient. With `metrics`, pacing waits,
+    SMTP round trips and delivered bytes are recorded in the CampaignMetrics.
+    """
+
+    def __init__(self, host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 max_connections: int = 4, initial_connections: int = 1, pacer: Optional[Pacer] = None,
+                 use_starttls: bool = True, latency_target: float = 2.0, max_retries: int = 2,
+                 timeout: float = 60, executor: Optional[Executor] = None, domain_spacing: float = 0,
+                 metrics: Optional['CampaignMetrics'] = None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_connections = max(1, max_connections)
+        self.pacer = pacer or Pacer()
+        self.use_starttls = use_starttls
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.executor = executor
+        self.domain_pacer = DomainPacer(domain_spacing)
+        self.metrics = metrics
+        self.controller = AIMDController(initial=initial_connections, maximum=self.max_connections,
+                                         latency_target=latency_target)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._cancelled: Optional[asyncio.Event] = None
+        self._resumed: Optional[asyncio.Event] = None
+        self._paused = False
+        self._cancel_requested = False
+
+    async def open_session(self) -> AsyncSMTPSession:
+        """Open one authenticated SMTP session."""
+        session = AsyncSMTPSession(self.host, self.port, self.timeout)
+        return await session.connect(self.use_starttls, self.username, self.password)
+
+    def cancel(self):
+        """Stop the campaign after the sends in flight. Safe to call from another thread."""
+        self._cancel_requested = True
+        if self._loop is not None and self._cancelled is not None:
+            self._loop.call_soon_threadsafe(self._cancelled.set)
+
+    @property
+    def paused(self) -> bool:
+        """True while new sends are held."""
+        return self._paused
+
+    def pause(self):
+        """Hold new sends once those in flight are done. Safe to call from another thread."""
+        self._paused = True
+        if self._loop is not None and self._resumed is not None:
+            self._loop.call_soon_threadsafe(self._resumed.clear)
+
+    def resume(self):
+        """Resume a paused campaign. Safe to call from another thread."""
+        self._paused = False
+        if self._loop is not None and self._resumed is not None:
+            self._loop.call_soon_threadsafe(self._resumed.set)
+
+    async def _until_resumed(self) -> bool:
+        """Wait while the campaign is paused. False if cancelled meanwhile."""
+        if not self._resumed.is_set():
+            waits = [asyncio.ensure_future(self._resumed.wait()), asyncio.ensure_future(self._cancelled.wait())]
+            await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+            for wait in waits:
+                wait.cancel()
+        return not self._cancelled.is_set()
+
+    async def _pace(self, job: Dict) -> bool:
+        """
+        Wait for the next global send slot, then for the recipient domain slot,
+        without blocking the loop. False if cancelled.
+        """
+        if not await self._until_resumed() or not await self._wait(self.pacer.reserve()):
+            return False
+        if not await self._wait(self.domain_pacer.reserve(recipient_domain(job['recipients'][0]))):
+            return False
+        # Paused while waiting for the slot
+        return await self._until_resumed()
+
+    async def _wait(self, delay: float) -> bool:
+        if delay <= 0:
+            return not self._cancelled.is_set()
+        try:
+            await asyncio.wait_for(self._cancelled.wait(), delay)
+            return False
+        except asyncio.TimeoutError:
+            return True
+
+    async def run(self, items: Iterable, build_job: Optional[Callable[[object], Dict]] = None,
+                  on_result: Optional[Callable[[Dict], None]] = None) -> Dict[str, object]:
+        """
+        Send every item and call on_result(result) on the event loop thread.
+        Items are pulled and built in the executor. A result holds the item,
+        its job, success, error, latency and attempts; an item whose build_job
+        raised is reported failed with job None, one it returned None for is
+        left out without a result.
+        Returns a summary with sent/failed counts, elapsed time, whether it was
+        cancelled and the number of on_result calls that raised.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._cancelled = asyncio.Event()
+        self._resumed = asyncio.Event()
+        if not self._paused:
+            self._resumed.set()
+        # Cancelled before the loop was running
+        if self._cancel_requested:
+            self._cancelled.set()
+        jobs: asyncio.Queue = asyncio.Queue()
+        summary = {'sent': 0, 'failed': 0, 'cancelled': False, 'elapsed': 0.0, 'callback_errors': 0}
+        state = {'outstanding': 0, 'produced_all': False}
+        finished = asyncio.Event()
+        start = time.monotonic()
+
+        def report(result):
+            summary['sent' if result['success'] else 'failed'] += 1
+            if self.metrics is not None and result['error'] != CANCELLED_ERROR:
+                self.metrics.record_result(result['success'],
+                                           len(result['job']['message']) if result['job'] is not None else 0)
+            state['outstanding'] -= 1
+            try:
+                if on_result is not None:
+                    on_result(result)
+            except Exception:
+                # A failing callback must not stop the workers nor the completion count
+                summary['callback_errors'] += 1
+            finally:
+                if state['produced_all'] and state['outstanding'] == 0:
+                    finished.set()
+
+        async def produce():
+            remaining = iter(items)
+            while not self._cancelled.is_set():
+                # Keep only a short backlog of built messages
+                while state['outstanding'] >= self.max_connections * 2 and not self._cancelled.is_set():
+                    await asyncio.sleep(0.01)
+                # A lazy iterable may read or filter many rows before its next item: off the loop too
+                item = await self._loop.run_in_executor(self.executor, next, remaining, _EXHAUSTED)
+                if item is _EXHAUSTED or self._cancelled.is_set():
+                    break
+                state['outstanding'] += 1
+                if build_job is None:
+                    jobs.put_nowait((item, item, 1))
+                    continue
+                try:
+                    job = await self._loop.run_in_executor(self.executor, build_job, item)
+                except Exception as e:
+                    # One message that cannot be built fails alone
+                    report({'item': item, 'job': None, 'success': False, 'error': e, 'latency': 0.0,
+                            'attempts': 0})
+                    continue
+                if job is None:
+                    state['outstanding'] -= 1
+                    continue
+                jobs.put_nowait((item, job, 1))
+            state['produced_all'] = True
+            if state['outstanding'] == 0:
+                finished.set()
+
+        async def work(slot: int, session: Optional[AsyncSMTPSession]):
+            try:
+                while not self._cancelled.is_set():
+                    # Sessions above the current AIMD limit stay idle
+                    if slot >= self.controller.concurrency:
+                        await asyncio.sleep(0.05)
+                        continue
+                    entry = await jobs.get()
+                    if entry is None:
+                        break
+                    item, job, attempt = entry
+                    session = await self._send_job(session, item, job, attempt, jobs, report)
+            finally:
+                if session is not None:
+                    await session.close()
+
+        # The first session validates the credentials before anything is queued
+        first_session = await self.open_session()
+        tasks = [asyncio.create_task(work(0, first_session))]
+        tasks += [asyncio.create_task(work(slot, None)) for slot in range(1, self.max_connections)]
+        producer = asyncio.create_task(produce())
+        cancelled_wait = asyncio.create_task(self._cancelled.wait())
+
+        try:
+            await asyncio.wait([asyncio.create_task(finished.wait()), cancelled_wait],
+                               return_when=asyncio.FIRST_COMPLETED)
+            summary['cancelled'] = self._cancelled.is_set()
+        finally:
+            self._cancelled.set()
+            producer.cancel()
+            # Wake idle sessions so they can say QUIT
+            for _ in tasks:
+                jobs.put_nowait(None)
+            await asyncio.gather(*tasks, producer, cancelled_wait, return_exceptions=True)
+            summary['elapsed'] = time.monotonic() - start
+
+        return summary
+
+    async def _send_job(self, session, item, job: Dict, attempt: int, jobs: asyncio.Queue, report):
+        paced_at = time.perf_counter()
+        paced = await self._pace(job)
+        if self.metrics is not None:
+            self.metrics.observe('pacing', time.perf_counter() - paced_at)
+        if not paced:
+            report({'item': item, 'job': job, 'success': False, 'error': CANCELLED_ERROR, 'latency': 0.0, 'attempts': attempt})
+            return session
+
+        start = time.monotonic()
+        try:
+            if session is None:
+                session = await self.open_session()
+            await session.sendmail(job['from_addr'], job['recipients'], job['message'])
+            latency = time.monotonic() - start
+            if self.metrics is not None:
+                self.metrics.observe('smtp', latency)
+            self.controller.on_success(latency)
+            self.pacer.on_success()
+            report({'item': item, 'job': job, 'success': True, 'error': None, 'latency': latency, 'attempts': attempt})
+            return session
+
+        except Exception as e:
+            latency = time.monotonic() - start
+            if self.metrics is not None:
+                self.metrics.observe('smtp', latency)
+            retryable = is_temporary_failure(e)
+            if retryable:
+                self.controller.on_congestion()
+            if is_throttling_reply(e):
+                self.pacer.on_throttled(e)
+            disconnected = isinstance(e, (smtplib.SMTPServerDisconnected, asyncio.TimeoutError)) or (
+                isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException))
+            if disconnected:
+                # Dropped or idle-closed session: reopen on the next job
+                if session is not None:
+                    await session.close()
+                session = None
+                retryable = True
+
+            if retryable and attempt <= self.max_retries:
+                jobs.put_nowait((item, job, attempt + 1))
+            else:
+                report({'item': item, 'job': job, 'success': False, 'error': e, 'latency': latency, 'attempts': attempt})
+            return session
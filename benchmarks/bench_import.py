@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for MERCI RAYMOND Email Automation.
+
+Each module is imported in a fresh interpreter several times; the median
+wall time is reported along with the heavy dependencies it pulled in.
+The side-effect-free core must not load Streamlit, pandas, Pillow or
+html2text.
+
+Usage:
+    python benchmarks/bench_import.py [--repeat 7] [--max-core-ms 150]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ['email_core', 'campaign_cli', 'email_automation_app']
+HEAVY_MODULES = ['streamlit', 'pandas', 'PIL', 'html2text']
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ','.join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def time_import(module: str, repeat: int):
+    """Median import time in milliseconds and the heavy modules loaded."""
+    timings = []
+    loaded = ''
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        elapsed, loaded = result.stdout.strip().splitlines()[-1].partition(' ')[::2]
+        timings.append(float(elapsed) * 1000)
+    return statistics.median(timings), [m for m in loaded.split(',') if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps d'import des modules")
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--max-core-ms', type=float, help="Échoue si l'import du coeur dépasse ce temps")
+    args = parser.parse_args()
+
+    results = {}
+    for module in MODULES:
+        median_ms, heavy = time_import(module, args.repeat)
+        results[module] = {'median_ms': round(median_ms, 1), 'heavy_modules': heavy}
+        print(f"{module:<24} {median_ms:8.1f} ms   {', '.join(heavy) or '-'}")
+
+    print(json.dumps(results))
+
+    core = results['email_core']
+    if core['heavy_modules']:
+        sys.exit(f"email_core imports heavy modules: {core['heavy_modules']}")
+    if args.max_core_ms is not None and core['median_ms'] > args.max_core_ms:
+        sys.exit(f"email_core import took {core['median_ms']} ms (> {args.max_core_ms} ms)")
+
+
+if __name__ == "__main__":
+    main()
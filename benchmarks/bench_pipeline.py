@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Pipeline benchmark for MERCI RAYMOND Email Automation.
+
+Synthetic workbooks (French column names, a few invalid and duplicate
+addresses, like a real export) are generated once per size and cached.
+Each stage of a campaign is then timed on them:
+
+    parse        read_contacts (default engine for .xlsx)
+    mapping      detect_column_mapping
+    extraction   get_valid_emails_from_df
+    personalize  personalize_email for every contact
+    mime         build_send_job on the campaign skeleton
+    send         AsyncSendEngine to the local SMTP sink (--send-limit contacts)
+
+The median of --repeat runs is kept, and each stage is run once more under
+tracemalloc for its peak memory. Results are written as JSON with the git
+commit, so two runs can be compared: --compare fails when a stage got
+slower than --max-regression.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--sizes 1000 10000 100000] [--repeat 3]
+        [--output results.json] [--compare baseline.json --max-regression 0.25]
+"""
+
+import argparse
+import asyncio
+import gc
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import unicodedata
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from async_sender import AsyncSendEngine  # noqa: E402
+from email_core import (EmailAutomation, CompressedImageFile, build_message_skeleton,  # noqa: E402
+                        build_send_job)
+from ingestion import read_contacts  # noqa: E402
+from smtp_policy import Pacer  # noqa: E402
+from smtp_sink import SMTPSink  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'merci_raymond_bench')
+STAGES = ['parse', 'mapping', 'extraction', 'personalize', 'mime', 'send']
+
+# Bump when the generated workbooks change, so cached files are regenerated
+WORKBOOK_VERSION = 2
+
+COLUMNS = ['Nom du contact', 'Adresse mail', 'Société', 'Site', 'Adresse du site', 'Code postal',
+           'Ville', 'Téléphone', 'Date dernier entretien', 'Commentaire']
+
+FIRST_NAMES = ['Camille', 'Léa', 'Hugo', 'Chloé', 'Louis', 'Manon', 'Gabriel', 'Inès', 'Arthur', 'Zoé',
+               'Jules', 'Émilie', 'Théo', 'Anaïs', 'Raphaël', 'Mélanie', 'Noé', 'Hélène', 'François', 'Agnès']
+LAST_NAMES = ['Martin', 'Bernard', 'Dubois', 'Thomas', 'Robert', 'Petit', 'Durand', 'Leroy', 'Moreau',
+              'Lefèvre', 'Girard', 'Fournier', 'Mercier', 'Bonnet', 'Faure', 'Rousseau', 'Blanc', 'Guérin']
+COMPANIES = ['Hestia-im', 'Adyen', 'Groupe Lumière', 'Atelier Vert', 'Foncière Rivoli', 'Cabinet Moreau & Fils',
+             'Maison Bréguet', 'Société Générale des Eaux', 'Les Jardins de Sèvres', 'Caisse d’Épargne']
+STREETS = ['Avenue Victor Hugo', 'Rue de Rivoli', 'Boulevard Haussmann', 'Quai de Valmy', 'Rue Lafayette',
+           'Place de la République', 'Rue du Faubourg Saint-Honoré', 'Allée des Tilleuls']
+CITIES = [('Paris', '75008'), ('Lyon', '69002'), ('Bordeaux', '33000'), ('Nantes', '44000'),
+          ('Lille', '59000'), ('Boulogne-Billancourt', '92100'), ('Marseille', '13001')]
+DOMAINS = ['gmail.com', 'orange.fr', 'free.fr', 'wanadoo.fr', 'hestia-im.fr', 'adyen.com', 'laposte.net']
+
+TEMPLATE = """Lorsque l'été touche à sa fin et l'hiver arrive à pas feutrés…
+
+Les Raymonds vous proposent une large palette de sapins, décorations et animations pour votre site {Site} ({Ville}) !
+
+🎁 **Pour l'occasion**, {Société} bénéficie d'une **réduction spéciale de 10%** sur notre catalogue de Noël."""
+
+RENDER_SETTINGS = {
+    'email_content': TEMPLATE,
+    'use_html': True,
+    'header_content': "Bonjour {Nom du contact_first},",
+    'footer_content': "En vous souhaitant une bonne journée,\n\nL'équipe MERCI RAYMOND",
+}
+
+
+def _ascii(text: str) -> str:
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode().lower()
+
+
+def synthetic_rows(rows: int, seed: int = 42):
+    """Contact rows: ~2% invalid or missing addresses, ~1% duplicates, some blank cells."""
+    rng = random.Random(seed)
+    data = []
+    for i in range(rows):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        local = f"{_ascii(first)}.{_ascii(last)}"
+        city, postcode = rng.choice(CITIES)
+        roll = rng.random()
+        if roll < 0.01:
+            email = None
+        elif roll < 0.02:
+            email = f"{local} at {rng.choice(DOMAINS)}"
+        elif roll < 0.03 and data:
+            email = rng.choice(data)[1]
+        else:
+            email = f"{local}{i}@{rng.choice(DOMAINS)}"
+        data.append((
+            f"{first} {last.upper()}",
+            email,
+            rng.choice(COMPANIES),
+            f"{rng.randint(1, 250)} {rng.choice(STREETS)}",
+            f"{rng.randint(1, 250)} {rng.choice(STREETS)}, {postcode} {city}",
+            postcode,
+            city,
+            f"0{rng.randint(1, 9)} {rng.randint(10, 99)} {rng.randint(10, 99)} {rng.randint(10, 99)} {rng.randint(10, 99)}",
+            f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            '' if rng.random() < 0.7 else 'Rappeler en septembre, préfère les sapins Nordmann',
+        ))
+    return data
+
+
+def synthetic_workbook(rows: int, cache_dir: str = DEFAULT_CACHE_DIR, seed: int = 42) -> str:
+    """Path of a cached .xlsx contact list of the given size, generated if missing."""
+    import openpyxl
+
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"contacts_v{WORKBOOK_VERSION}_{rows}_{seed}.xlsx")
+    if os.path.exists(path):
+        return path
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Contacts')
+    sheet.append(COLUMNS)
+    for row in synthetic_rows(rows, seed):
+        sheet.append(row)
+    partial = path + '.tmp'
+    workbook.save(partial)
+    os.replace(partial, path)
+    return path
+
+
+def sample_logo() -> CompressedImageFile:
+    """A small PNG logo, so the MIME stage carries an inline image like a real campaign."""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (400, 160), (46, 125, 50)).save(buffer, format='PNG')
+    return CompressedImageFile(buffer.getvalue(), 'logo.png')
+
+
+def git_commit() -> str:
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, check=True)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return result.stdout.strip() + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+# Stages -------------------------------------------------------------------
+# Each stage takes the state of the previous ones and returns (result, items processed)
+
+def stage_parse(state):
+    df, _ = read_contacts(state['path'])
+    return df, len(df)
+
+
+def stage_mapping(state):
+    return state['automation'].detect_column_mapping(state['parse']), len(state['parse'].columns)
+
+
+def stage_extraction(state):
+    contacts = state['automation'].get_valid_emails_from_df(state['parse'])
+    return contacts, len(contacts)
+
+
+def stage_personalize(state):
+    automation = state['automation']
+    settings = state['render_settings']
+    emails = [automation.personalize_email(contact, **settings) for contact in state['extraction']]
+    return emails, len(emails)
+
+
+def stage_mime(state):
+    automation = state['automation']
+    settings = state['render_settings']
+    skeleton = state['skeleton']
+    jobs = []
+    for contact, personalized in zip(state['extraction'], state['personalize']):
+        email_data = {**contact, 'personalized_email': personalized,
+                      'plain_text': automation.personalize_plain_text(contact, **settings)}
+        jobs.append(build_send_job(email_data, 'equipe@merciraymond.fr', 'Noël chez les Raymonds', '',
+                                   skeleton))
+    return jobs, len(jobs)
+
+
+def stage_send(state):
+    jobs = state['mime'][:state['send_limit']]
+    engine = AsyncSendEngine(state['sink'].host, state['sink'].port, use_starttls=False, pacer=Pacer(0),
+                             max_connections=state['connections'], initial_connections=state['connections'])
+    summary = asyncio.run(engine.run(jobs))
+    if summary['failed']:
+        raise RuntimeError(f"{summary['failed']} envois en échec vers le serveur local")
+    return summary, summary['sent']
+
+
+STAGE_FUNCTIONS = {
+    'parse': stage_parse,
+    'mapping': stage_mapping,
+    'extraction': stage_extraction,
+    'personalize': stage_personalize,
+    'mime': stage_mime,
+    'send': stage_send,
+}
+
+
+def measure(stage: str, state, repeat: int):
+    """Median wall time, throughput and peak traced memory of one stage."""
+    function = STAGE_FUNCTIONS[stage]
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result, items = function(state)
+        timings.append(time.perf_counter() - start)
+        if stage == 'send':
+            state['sink'].messages.clear()
+
+    # Separate run for memory: tracemalloc slows allocations down too much to time them
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    if stage == 'send':
+        state['sink'].messages.clear()
+
+    seconds = statistics.median(timings)
+    return result, {
+        'seconds': round(seconds, 4),
+        'items': items,
+        'items_per_second': round(items / seconds, 1) if seconds > 0 else 0.0,
+        'peak_mb': round(peak / 1e6, 2),
+    }
+
+
+def run_benchmark(rows: int, repeat: int = 3, stages=STAGES, cache_dir: str = DEFAULT_CACHE_DIR,
+                  send_limit: int = 1000, connections: int = 4):
+    """Time every stage on a synthetic workbook of this size. Returns {stage: measures}."""
+    state = {
+        'path': synthetic_workbook(rows, cache_dir),
+        'automation': EmailAutomation(),
+        'send_limit': send_limit,
+        'connections': connections,
+    }
+    logo = sample_logo()
+    state['render_settings'] = {**RENDER_SETTINGS, 'logo_file': logo, 'decorative_image_file': None}
+    state['skeleton'], _ = build_message_skeleton(state['automation'], logo_file=logo)
+
+    results = {}
+    with SMTPSink() as sink:
+        state['sink'] = sink
+        # Later stages need the output of the earlier ones, even when not reported
+        last = max(STAGES.index(stage) for stage in stages)
+        for stage in STAGES[:last + 1]:
+            if stage in stages:
+                state[stage], results[stage] = measure(stage, state, repeat)
+            else:
+                state[stage] = STAGE_FUNCTIONS[stage](state)[0]
+    return results
+
+
+def compare(results, baseline, max_regression: float):
+    """Stages slower than the baseline by more than max_regression (a ratio)."""
+    regressions = []
+    for size, stages in results['sizes'].items():
+        for stage, measures in stages.items():
+            reference = baseline.get('sizes', {}).get(size, {}).get(stage)
+            if not reference or not reference['seconds']:
+                continue
+            ratio = measures['seconds'] / reference['seconds'] - 1
+            if ratio > max_regression:
+                regressions.append(f"{size} lignes / {stage}: {reference['seconds']}s -> "
+                                   f"{measures['seconds']}s (+{ratio:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps de traitement d'une campagne par étape")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--send-limit', type=int, default=1000, help="Nombre d'emails envoyés au serveur local")
+    parser.add_argument('--connections', type=int, default=4)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="Dossier des classeurs générés")
+    parser.add_argument('--output', help="Fichier JSON des résultats")
+    parser.add_argument('--compare', help="Résultats de référence (JSON) à comparer")
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help="Ralentissement toléré par étape avant échec (0.25 = +25%%)")
+    args = parser.parse_args()
+
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'send_limit': args.send_limit,
+        'sizes': {},
+    }
+    for rows in args.sizes:
+        stages = run_benchmark(rows, args.repeat, args.stages, args.cache_dir, args.send_limit, args.connections)
+        results['sizes'][str(rows)] = stages
+        for stage, measures in stages.items():
+            print(f"{rows:>7} {stage:<12} {measures['seconds'] * 1000:10.1f} ms "
+                  f"{measures['items_per_second']:12.0f} /s {measures['peak_mb']:9.1f} MB")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            sys.exit("Regressions vs " + baseline.get('commit', args.compare) + ":\n" + "\n".join(regressions))
+
+
+if __name__ == "__main__":
+    main()
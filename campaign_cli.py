@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Headless campaign runner for MERCI RAYMOND Email Automation.
+
+Runs the same pipeline as the Streamlit app without a browser session:
+workbook -> detect_column_mapping / get_valid_emails_from_df ->
+personalize_email -> verification -> send. Progress is written to stdout
+as JSON lines, followed by the per-stage metrics and a throughput summary.
+
+Example (cron / batch job):
+    SMTP_PASSWORD=... python campaign_cli.py contacts.xlsx \\
+        --template email.txt --subject "MERCI RAYMOND - Noël" \\
+        --sender equipe@merciraymond.fr --delay 10
+"""
+
+import argparse
+import asyncio
+import json
+import mimetypes
+import os
+import sys
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Set
+
+from async_sender import AsyncSendEngine
+from campaign_metrics import CampaignMetrics
+from contact_table import ContactTable, as_contact_table
+from email_core import (DEFAULT_EMAIL_FOOTER, DEFAULT_EMAIL_HEADER, SMTP_PORT, SMTP_SERVER, EmailAutomation,
+                        build_message_skeleton, build_send_job, filter_suppressed)
+from email_index import SuppressionList, normalize_email
+from domain_scheduler import interleave_by_domain, recipient_domain
+from domain_validator import DomainValidator, domain_issue
+from ingestion import read_contacts
+from rate_limiter import DEFAULT_QUOTA_PATH, QuotaLimiter
+from send_journal import SendJournal, campaign_key, contacts_digest, files_digest
+from smtp_policy import Pacer
+
+# Progress lines come from the event loop and from the executor rendering contacts
+_emit_lock = threading.Lock()
+
+
+class LocalFile:
+    """File on disk exposing the same interface as a Streamlit uploaded file"""
+
+    def __init__(self, path: str):
+        self.name = os.path.basename(path)
+        self.type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        with open(path, 'rb') as f:
+            self._data = f.read()
+        self.size = len(self._data)
+
+    def getvalue(self) -> bytes:
+        return self._data
+
+
+def emit(event: str, stream=None, **fields):
+    """Write one machine-readable progress line"""
+    stream = stream or sys.stdout
+    line = json.dumps({'event': event, **fields}, ensure_ascii=False, default=str) + '\n'
+    with _emit_lock:
+        stream.write(line)
+        stream.flush()
+
+
+def read_text(value: Optional[str], path: Optional[str], default: str) -> str:
+    """Text given inline, read from a file, or the default"""
+    if path:
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    return value if value is not None else default
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Envoi d'une campagne MERCI RAYMOND sans Streamlit")
+    parser.add_argument('workbook', help="Fichier des contacts (.xlsx, .xls, .csv ou .parquet)")
+    parser.add_argument('--engine', default='auto',
+                        help="Moteur de lecture: auto, calamine, openpyxl-streaming, openpyxl, xlrd, csv, parquet")
+    parser.add_argument('--template', required=True, help="Fichier texte du corps de l'email (placeholders {colonne})")
+    parser.add_argument('--subject', default='MERCI RAYMOND - Votre service paysagiste', help="Objet de l'email")
+    parser.add_argument('--header', help="En-tête (salutation)")
+    parser.add_argument('--header-file', help="Fichier contenant l'en-tête")
+    parser.add_argument('--footer', help="Signature")
+    parser.add_argument('--footer-file', help="Fichier contenant la signature")
+    parser.add_argument('--logo', help="Logo (image)")
+    parser.add_argument('--image', help="Image décorative")
+    parser.add_argument('--attach', action='append', default=[], help="Pièce jointe (répétable)")
+    parser.add_argument('--cc', default='', help="Adresses en copie, séparées par des virgules")
+    parser.add_argument('--suppression', help="Liste de suppression (désinscriptions): ces adresses sont retirées")
+    parser.add_argument('--check-domains', action='store_true',
+                        help="Résoudre chaque domaine destinataire (MX) et écarter ceux qui ne reçoivent pas d'emails")
+
+    parser.add_argument('--sender', help="Adresse d'expédition (par défaut: --username)")
+    parser.add_argument('--username', help="Identifiant SMTP (adresse Gmail)")
+    parser.add_argument('--password-env', default='SMTP_PASSWORD',
+                        help="Variable d'environnement contenant le mot de passe d'application")
+    parser.add_argument('--smtp-host', default=SMTP_SERVER)
+    parser.add_argument('--smtp-port', type=int, default=SMTP_PORT)
+    parser.add_argument('--no-starttls', action='store_true', help="Ne pas utiliser STARTTLS (serveur local)")
+    parser.add_argument('--connections', type=int, default=1, help="Connexions SMTP simultanées maximum")
+    parser.add_argument('--domain-spacing', type=float, default=0,
+                        help="Délai minimum entre deux emails vers le même domaine (secondes)")
+    parser.add_argument('--no-interleave', action='store_true',
+                        help="Envoyer dans l'ordre du fichier au lieu d'alterner les domaines destinataires")
+
+    parser.add_argument('--delay', type=float, default=10, help="Délai fixe entre emails (secondes)")
+    parser.add_argument('--min-delay', type=int, help="Délai aléatoire minimum (secondes)")
+    parser.add_argument('--max-delay', type=int, help="Délai aléatoire maximum (secondes)")
+    parser.add_argument('--per-minute', type=int, help="Quota d'envoi par minute (remplace les délais)")
+    parser.add_argument('--per-hour', type=int, help="Quota d'envoi par heure")
+    parser.add_argument('--per-day', type=int, help="Quota d'envoi par jour")
+    parser.add_argument('--jitter', type=float, default=0, help="Délai aléatoire ajouté à chaque envoi avec les quotas (secondes)")
+    parser.add_argument('--quota-state', default=DEFAULT_QUOTA_PATH, help="Fichier SQLite des quotas, partagé entre les exécutions")
+    parser.add_argument('--limit', type=int, help="N'envoyer que les N premiers emails valides")
+    parser.add_argument('--dry-run', action='store_true', help="Personnaliser et vérifier sans envoyer")
+    parser.add_argument('--journal', help="Journal SQLite des envois: relancer la commande reprend la campagne")
+    parser.add_argument('--metrics-dir', help="Dossier où écrire les métriques de la campagne (Prometheus et JSON)")
+    return parser
+
+
+def iter_contacts(contacts: ContactTable, counters: Dict[str, int], limit: Optional[int] = None,
+                  skip: Optional[Set[str]] = None, interleave: bool = False) -> Iterator:
+    """
+    Contacts to render, as row views: only cheap filtering here, each one is
+    rendered by render_valid_email(). Normalized addresses in `skip` are left
+    out, and nothing more is yielded once `limit` emails were found valid.
+    With `interleave`, recipient domains are alternated instead of following the file order.
+    """
+    # Row views: no per-contact copy, even when interleaving the whole list
+    remaining = (row for row in as_contact_table(contacts)
+                 if not skip or normalize_email(row['email']) not in skip)
+    if interleave:
+        remaining = interleave_by_domain(remaining)
+    for contact_data in remaining:
+        if limit is not None and counters['valid'] >= limit:
+            return
+        yield contact_data
+
+
+def render_valid_email(automation: EmailAutomation, contact_data, render_settings: Dict,
+                       counters: Dict[str, int], metrics: Optional[CampaignMetrics] = None,
+                       domain_issues: Optional[Dict[str, str]] = None) -> Optional[Dict]:
+    """
+    Render and verify one contact: the email data with its 'position', or None
+    once reported invalid. Contacts of a domain in `domain_issues` (domain -> issue)
+    are invalid. The rendering time is recorded in `metrics` when given.
+    """
+    started = time.perf_counter()
+    personalized, verification = automation.personalize_and_verify(contact_data, **render_settings)
+    if metrics is not None:
+        metrics.observe('render', time.perf_counter() - started)
+    issues = verification['issues']
+    if domain_issues and recipient_domain(contact_data['email']) in domain_issues:
+        issues = issues + [domain_issues[recipient_domain(contact_data['email'])]]
+    if not verification['is_valid'] or len(issues) > len(verification['issues']):
+        counters['invalid'] += 1
+        emit('invalid', index=contact_data['index'], email=contact_data['email'], issues=issues)
+        return None
+    counters['valid'] += 1
+    return {**contact_data, 'position': contact_data.position, 'personalized_email': personalized}
+
+
+def run_campaign(args: argparse.Namespace) -> int:
+    started = time.monotonic()
+    automation = EmailAutomation()
+
+    # Load and map contacts
+    try:
+        df, parse_stats = read_contacts(args.workbook, engine=args.engine)
+    except ValueError as e:
+        emit('error', message=str(e))
+        return 2
+    emit('parsed', engine=parse_stats['engine'], rows=parse_stats['rows'], columns=parse_stats['columns'],
+         seconds=round(parse_stats['seconds'], 3), rows_per_second=round(parse_stats['rows_per_second'], 1))
+    mapping = automation.detect_column_mapping(df)
+    if not mapping['email_column']:
+        emit('error', message="Aucune colonne email détectée")
+        return 2
+    contacts, duplicates_removed = automation.extract_valid_contacts(df)
+    suppressed = 0
+    if args.suppression:
+        try:
+            with SuppressionList(args.suppression) as suppression:
+                contacts, suppressed = filter_suppressed(contacts, suppression)
+        except (OSError, ValueError) as e:
+            emit('error', message=f"Liste de suppression illisible: {e}")
+            return 2
+    emit('loaded', rows=len(df), valid_emails=len(contacts), duplicates_removed=duplicates_removed,
+         suppressed=suppressed,
+         email_column=mapping['email_column'],
+         placeholders=list(mapping['available_placeholders']), seconds=round(time.monotonic() - started, 3))
+
+    logo_file = LocalFile(args.logo) if args.logo else None
+    decorative_image_file = LocalFile(args.image) if args.image else None
+    attachment_files = [LocalFile(path) for path in args.attach]
+
+    render_settings = {
+        'email_content': read_text(None, args.template, ''),
+        'use_html': True,
+        'logo_file': logo_file,
+        'decorative_image_file': decorative_image_file,
+        'header_content': read_text(args.header, args.header_file, DEFAULT_EMAIL_HEADER),
+        'footer_content': read_text(args.footer, args.footer_file, DEFAULT_EMAIL_FOOTER)
+    }
+    counters = {'valid': 0, 'invalid': 0}
+
+    # Each recipient domain is resolved once for the whole list
+    domain_issues = {}
+    if args.check_domains:
+        domain_started = time.monotonic()
+        statuses = DomainValidator().check_domains(recipient_domain(email) for email in contacts.column('email') or [])
+        domain_issues = {domain: domain_issue(domain, status) for domain, status in statuses.items()
+                         if domain_issue(domain, status)}
+        emit('domains', checked=len(statuses), undeliverable=sorted(domain_issues),
+             errors=sum(status == 'error' for status in statuses.values()),
+             seconds=round(time.monotonic() - domain_started, 3))
+
+    if args.dry_run:
+        for contact_data in iter_contacts(contacts, counters, args.limit):
+            email_data = render_valid_email(automation, contact_data, render_settings, counters,
+                                            domain_issues=domain_issues)
+            if email_data is not None:
+                emit('valid', index=email_data['index'], email=email_data['email'])
+        elapsed = time.monotonic() - started
+        emit('summary', dry_run=True, valid=counters['valid'], invalid=counters['invalid'],
+             elapsed=round(elapsed, 3))
+        return 0
+
+    sender_email = args.sender or args.username
+    if not sender_email:
+        emit('error', message="--sender ou --username est requis pour l'envoi")
+        return 2
+    password = os.environ.get(args.password_env) if args.username else None
+
+    journal = SendJournal(args.journal) if args.journal else None
+    try:
+        return send_emails(args, automation, contacts, render_settings, attachment_files, counters,
+                           sender_email, password, journal, started, domain_issues)
+    finally:
+        if journal is not None:
+            journal.close()
+
+
+def send_emails(args: argparse.Namespace, automation: EmailAutomation, contacts: ContactTable,
+                render_settings: Dict, attachment_files: List[LocalFile], counters: Dict[str, int],
+                sender_email: str, password: Optional[str], journal: Optional[SendJournal], started: float,
+                domain_issues: Optional[Dict[str, str]] = None) -> int:
+    """Send the valid emails, skipping the recipients the journal marks as sent"""
+    # Same message -> recipients already reached are skipped; same contacts too -> same campaign, resumed
+    message_key = campaign_key(
+        sender_email, args.subject, args.cc, render_settings['email_content'],
+        render_settings['header_content'], render_settings['footer_content'],
+        files_digest(render_settings['logo_file'], render_settings['decorative_image_file'], *attachment_files)
+    )
+    campaign_id = campaign_key(message_key, contacts_digest(contacts.column('email') or []))
+    metrics = CampaignMetrics(campaign_id)
+    message_ids = {}
+    already_sent = set()
+    if journal is not None:
+        message_ids = journal.open_campaign(
+            campaign_id, [(position, contact['email']) for position, contact in enumerate(contacts)],
+            domain=sender_email.split('@')[-1], message_key=message_key
+        )
+        already_sent = journal.sent_recipients(campaign_id)
+        emit('resume', campaign_id=campaign_id,
+             already_sent=len(already_sent.intersection(contacts.column('email') or [])))
+    # Pulled by the engine off the event loop; contacts are rendered in build_job, in the executor
+    emails = iter_contacts(contacts, counters, args.limit, skip=already_sent, interleave=not args.no_interleave)
+
+    def mark(email_data, state, error=None):
+        if journal is not None:
+            journal.mark(campaign_id, email_data['email'], state, error)
+
+    # Images and attachments are encoded once for the whole campaign
+    skeleton, warnings = build_message_skeleton(automation, render_settings['logo_file'],
+                                                render_settings['decorative_image_file'], attachment_files,
+                                                metrics=metrics)
+    for warning in warnings:
+        emit('warning', message=warning)
+
+    quotas = {'minute': args.per_minute, 'hour': args.per_hour, 'day': args.per_day}
+    if any(quotas.values()):
+        pacer = QuotaLimiter(quotas, account=args.username or sender_email, path=args.quota_state,
+                             jitter=args.jitter)
+    elif args.min_delay is not None and args.max_delay is not None:
+        pacer = Pacer(min_delay=args.min_delay, max_delay=max(args.min_delay, args.max_delay))
+    else:
+        pacer = Pacer(args.delay)
+
+    engine = AsyncSendEngine(
+        args.smtp_host, args.smtp_port, args.username, password,
+        max_connections=args.connections, pacer=pacer, use_starttls=not args.no_starttls,
+        domain_spacing=args.domain_spacing, metrics=metrics
+    )
+
+    def build_job(contact_data):
+        email_data = render_valid_email(automation, contact_data, render_settings, counters, metrics,
+                                        domain_issues)
+        if email_data is None:
+            return None
+        with metrics.timer('render'):
+            email_data['plain_text'] = automation.personalize_plain_text(contact_data, **render_settings)
+        mark(email_data, 'sending')
+        with metrics.timer('mime'):
+            return build_send_job(email_data, sender_email, args.subject, args.cc, skeleton,
+                                  message_id=message_ids.get(normalize_email(email_data['email'])))
+
+    def on_result(result):
+        email_data = result['item']
+        if result['success']:
+            mark(email_data, 'sent')
+            emit('sent', index=email_data['index'], email=email_data['email'],
+                 latency=round(result['latency'], 4), attempts=result['attempts'])
+        else:
+            mark(email_data, 'failed', str(result['error']))
+            emit('failed', index=email_data['index'], email=email_data['email'],
+                 error=str(result['error']), attempts=result['attempts'])
+
+    try:
+        summary = asyncio.run(engine.run(emails, build_job=build_job, on_result=on_result))
+    except Exception as e:
+        emit('error', message=f"Erreur de connexion SMTP: {e}")
+        return 2
+    finally:
+        pacer.close()
+        metrics.finish()
+
+    report = metrics.summary()
+    if args.metrics_dir:
+        prometheus_path, json_path = metrics.write(args.metrics_dir)
+        report.update(prometheus_file=prometheus_path, json_file=json_path)
+    emit('metrics', **report)
+
+    elapsed = time.monotonic() - started
+    emit('summary', sent=summary['sent'], failed=summary['failed'], invalid=counters['invalid'],
+         cancelled=summary['cancelled'], elapsed=round(elapsed, 3),
+         send_seconds=round(summary['elapsed'], 3),
+         messages_per_second=round(summary['sent'] / summary['elapsed'], 3) if summary['elapsed'] else 0.0,
+         bytes_sent=report['bytes_sent'])
+    return 1 if summary['failed'] else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return run_campaign(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
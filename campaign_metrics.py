@@ -0,0 +1,224 @@
+"""
+Per-stage campaign metrics for MERCI RAYMOND Email Automation.
+
+A campaign spends its time in a few stages:
+
+    render          personalizing the template for one contact
+    compress_image  compressing the logo / decorative image (once per campaign)
+    mime            building the wire message on the campaign skeleton
+                    (headers, text parts and their encoding - there is no
+                    separate as_string() step since the skeleton)
+    pacing          waiting for the anti-spam pace, quotas and domain slot
+    smtp            SMTP round trip of one message (MAIL/RCPT/DATA)
+
+Each observation is one perf_counter() difference added to a fixed-bucket
+histogram and kept for exact percentiles, under a lock shared by the
+event loop and the executor threads. At the end of a campaign the metrics
+are written as a Prometheus textfile (for the node_exporter textfile
+collector) and as a JSON summary with messages/sec, bytes/sec and the
+p50/p95/p99 of every stage.
+"""
+
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+STAGES = ('render', 'compress_image', 'mime', 'pacing', 'smtp')
+
+# Histogram upper bounds in seconds, from template rendering to long quota waits
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                   30.0, 60.0, 300.0, 900.0)
+
+PERCENTILES = (50, 95, 99)
+
+METRIC_PREFIX = 'merci_raymond'
+DEFAULT_METRICS_DIR = 'campaign_metrics'
+
+
+def percentile(sorted_values, rank: float) -> float:
+    """Nearest-rank percentile of already sorted values (0.0 if there are none)."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(rank / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def _label_value(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _write_atomic(path: str, text: str):
+    # The textfile collector must never read a half-written file
+    partial = path + '.tmp'
+    with open(partial, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(partial, path)
+
+
+class StageTimer:
+    """Context manager adding its duration to a stage."""
+
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics: 'CampaignMetrics', stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self) -> 'StageTimer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+
+
+class CampaignMetrics:
+    """Timers, histograms and message counters of one campaign. Thread-safe."""
+
+    def __init__(self, campaign_id: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.campaign_id = campaign_id
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._samples: Dict[str, array] = {stage: array('d') for stage in STAGES}
+        self._bucket_counts: Dict[str, list] = {stage: [0] * (len(self.buckets) + 1) for stage in STAGES}
+        self.sent = 0
+        self.failed = 0
+        self.bytes_sent = 0
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def timer(self, stage: str) -> StageTimer:
+        """with metrics.timer('render'): ..."""
+        return StageTimer(self, stage)
+
+    def observe(self, stage: str, seconds: float):
+        """Add one duration to a stage."""
+        with self._lock:
+            if stage not in self._samples:
+                self._samples[stage] = array('d')
+                self._bucket_counts[stage] = [0] * (len(self.buckets) + 1)
+            self._samples[stage].append(seconds)
+            self._bucket_counts[stage][bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def timed(self, iterable: Iterable, stage: str) -> Iterator:
+        """Items of a lazy iterable, the time to produce each one added to the stage."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage, time.perf_counter() - start)
+            yield item
+
+    def record_result(self, success: bool, size: int = 0):
+        """Count one delivered (with its size in bytes) or failed message."""
+        with self._lock:
+            if success:
+                self.sent += 1
+                self.bytes_sent += size
+            else:
+                self.failed += 1
+
+    def start(self):
+        """Start the campaign clock when sending begins (time spent queued is not counted)."""
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def finish(self):
+        """Stop the campaign clock used for the rates."""
+        self.finished_at = time.time()
+
+    # Reports ----------------------------------------------------------
+
+    def summary(self) -> Dict:
+        """Counters, rates and the count/total/mean/max/p50/p95/p99 of every stage, in seconds."""
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+            sent, failed, bytes_sent = self.sent, self.failed, self.bytes_sent
+        elapsed = (self.finished_at or time.time()) - self.started_at
+
+        stages = {}
+        for stage, values in samples.items():
+            total = sum(values)
+            stages[stage] = {
+                'count': len(values),
+                'total_seconds': total,
+                'mean': total / len(values) if values else 0.0,
+                'max': values[-1] if values else 0.0,
+                **{f'p{rank}': percentile(values, rank) for rank in PERCENTILES}
+            }
+        return {
+            'campaign_id': self.campaign_id,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'elapsed': elapsed,
+            'sent': sent,
+            'failed': failed,
+            'bytes_sent': bytes_sent,
+            'messages_per_second': sent / elapsed if elapsed > 0 else 0.0,
+            'bytes_per_second': bytes_sent / elapsed if elapsed > 0 else 0.0,
+            'smtp_latency': {f'p{rank}': stages['smtp'][f'p{rank}'] for rank in PERCENTILES},
+            'stages': stages
+        }
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition of the campaign."""
+        summary = self.summary()
+        with self._lock:
+            bucket_counts = {stage: list(counts) for stage, counts in self._bucket_counts.items()}
+        campaign = f'campaign="{_label_value(self.campaign_id)}"'
+        name = METRIC_PREFIX
+        lines = [
+            f'# HELP {name}_stage_seconds Time spent per campaign stage.',
+            f'# TYPE {name}_stage_seconds histogram',
+        ]
+        for stage, counts in bucket_counts.items():
+            labels = f'{campaign},stage="{_label_value(stage)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = '+Inf' if bound == math.inf else repr(bound)
+                lines.append(f'{name}_stage_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{name}_stage_seconds_sum{{{labels}}} {summary["stages"][stage]["total_seconds"]!r}')
+            lines.append(f'{name}_stage_seconds_count{{{labels}}} {cumulative}')
+
+        smtp = summary['stages']['smtp']
+        lines += [
+            f'# HELP {name}_smtp_latency_seconds SMTP round trip per message.',
+            f'# TYPE {name}_smtp_latency_seconds summary',
+        ]
+        lines += [f'{name}_smtp_latency_seconds{{{campaign},quantile="{rank / 100}"}} {smtp[f"p{rank}"]!r}'
+                  for rank in PERCENTILES]
+        lines += [
+            f'{name}_smtp_latency_seconds_sum{{{campaign}}} {smtp["total_seconds"]!r}',
+            f'{name}_smtp_latency_seconds_count{{{campaign}}} {smtp["count"]}',
+            f'# HELP {name}_messages_total Messages delivered or failed.',
+            f'# TYPE {name}_messages_total counter',
+            f'{name}_messages_total{{{campaign},result="sent"}} {summary["sent"]}',
+            f'{name}_messages_total{{{campaign},result="failed"}} {summary["failed"]}',
+            f'# HELP {name}_sent_bytes_total Size of the delivered messages.',
+            f'# TYPE {name}_sent_bytes_total counter',
+            f'{name}_sent_bytes_total{{{campaign}}} {summary["bytes_sent"]}',
+            f'# HELP {name}_messages_per_second Delivered messages per second over the campaign.',
+            f'# TYPE {name}_messages_per_second gauge',
+            f'{name}_messages_per_second{{{campaign}}} {summary["messages_per_second"]!r}',
+            f'# HELP {name}_bytes_per_second Delivered bytes per second over the campaign.',
+            f'# TYPE {name}_bytes_per_second gauge',
+            f'{name}_bytes_per_second{{{campaign}}} {summary["bytes_per_second"]!r}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, directory: str = DEFAULT_METRICS_DIR) -> Tuple[str, str]:
+        """Write <campaign_id>.prom and <campaign_id>.json in the directory. Returns both paths."""
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.campaign_id)
+        _write_atomic(base + '.prom', self.prometheus())
+        _write_atomic(base + '.json', json.dumps(self.summary(), indent=2))
+        return base + '.prom', base + '.json'
@@ -0,0 +1,149 @@
+"""
+Columnar contact storage for MERCI RAYMOND Email Automation.
+
+One dict per contact repeats every column name and carries a hash table
+per row: with 100k contacts and tens of columns the containers weigh far
+more than the cell values. ContactTable keeps one list per column under a
+shared schema, and hands out ContactRow views: read-only mappings of one
+row, created on access and holding only the table and a position.
+
+A row view behaves like the former contact dict for the renderer, the
+verification and the send loop (`name in row`, `row[name]`, `row.get()`,
+`{**row}`, comparison with a dict). A None cell means the key is absent
+for this contact, like the first/last name of an empty full name.
+"""
+
+from collections.abc import Mapping, Sequence
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+class ContactRow(Mapping):
+    """Read-only mapping view of one row of a ContactTable."""
+
+    __slots__ = ('_table', 'position')
+
+    def __init__(self, table: 'ContactTable', position: int):
+        self._table = table
+        self.position = position
+
+    def __getitem__(self, name: str):
+        table = self._table
+        index = table._indexes.get(name)
+        if index is None:
+            raise KeyError(name)
+        value = table._columns[index][self.position]
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def get(self, name: str, default=None):
+        index = self._table._indexes.get(name)
+        if index is None:
+            return default
+        value = self._table._columns[index][self.position]
+        return default if value is None else value
+
+    def __contains__(self, name) -> bool:
+        index = self._table._indexes.get(name)
+        return index is not None and self._table._columns[index][self.position] is not None
+
+    def __iter__(self) -> Iterator[str]:
+        position = self.position
+        return (name for name, column in zip(self._table.schema, self._table._columns)
+                if column[position] is not None)
+
+    def __len__(self) -> int:
+        position = self.position
+        return sum(column[position] is not None for column in self._table._columns)
+
+    def __reduce__(self):
+        # Pickled (process pool, Streamlit cache) as a plain dict, never with the whole table
+        return dict, (dict(self),)
+
+    def __repr__(self) -> str:
+        return f"ContactRow({dict(self)!r})"
+
+
+class ContactTable(Sequence):
+    """Contacts stored as one list per column, indexed by position."""
+
+    def __init__(self, columns: Dict[str, List]):
+        """columns: column name -> values, all of the same length. The lists are kept, not copied."""
+        self.schema = tuple(columns)
+        self._columns = list(columns.values())
+        self._indexes = {name: index for index, name in enumerate(self.schema)}
+        lengths = {len(values) for values in self._columns}
+        if len(lengths) > 1:
+            raise ValueError(f"Colonnes de longueurs différentes: {sorted(lengths)}")
+        self._length = lengths.pop() if lengths else 0
+
+    @classmethod
+    def from_records(cls, records: Iterable[Mapping]) -> 'ContactTable':
+        """Table of contact dicts; keys missing from a record become absent cells."""
+        records = list(records)
+        schema = list(dict.fromkeys(name for record in records for name in record))
+        return cls({name: [record.get(name) for record in records] for name in schema})
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return ContactTable({name: column[position] for name, column in zip(self.schema, self._columns)})
+        if position < 0:
+            position += self._length
+        if not 0 <= position < self._length:
+            raise IndexError('contact index out of range')
+        return ContactRow(self, position)
+
+    def __iter__(self) -> Iterator[ContactRow]:
+        return (ContactRow(self, position) for position in range(self._length))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(row == record for row, record in zip(self, other))
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"ContactTable({self._length} contacts, colonnes={list(self.schema)})"
+
+    def take(self, positions: List[int]) -> 'ContactTable':
+        """New table with the contacts at these positions, in this order."""
+        return ContactTable({name: [column[position] for position in positions]
+                             for name, column in zip(self.schema, self._columns)})
+
+    def column(self, name: str) -> Optional[List]:
+        """Values of one column (None cells are absent), or None if there is no such column. Do not modify."""
+        index = self._indexes.get(name)
+        return self._columns[index] if index is not None else None
+
+    def project(self, names: List[str]) -> List:
+        """
+        Values of these columns for each contact: a tuple, or a dict of the
+        present values for a contact missing one of them.
+        """
+        if not names:
+            return [()] * self._length
+        columns = [self.column(name) for name in names]
+        if any(column is None for column in columns):
+            return [{name: value for name, value in zip(names, values) if value is not None}
+                    for values in zip(*(column or [None] * self._length for column in columns))]
+        rows = list(zip(*columns))
+        for column in columns:
+            if None in column:
+                for position, value in enumerate(column):
+                    if value is None and type(rows[position]) is tuple:
+                        rows[position] = {name: cell for name, cell in zip(names, rows[position])
+                                          if cell is not None}
+        return rows
+
+    def to_records(self) -> List[Dict]:
+        """The contacts as independent dicts."""
+        return [dict(row) for row in self]
+
+
+def as_contact_table(contacts) -> ContactTable:
+    """The contacts as a ContactTable, converting a list of dicts if needed."""
+    return contacts if isinstance(contacts, ContactTable) else ContactTable.from_records(contacts)
@@ -0,0 +1,80 @@
+"""
+Recipient-domain scheduling for MERCI RAYMOND Email Automation.
+
+A workbook sorted by company sends long runs to the same domain, which
+receiving servers throttle or greylist while other domains sit idle.
+
+interleave_by_domain() reorders the queue with weighted fair queuing: the
+k-th of the n messages for a domain gets the virtual time (k + 1/2) / n,
+and messages are sent by increasing virtual time (a domain is not
+repeated back to back while another one is due). Every domain is then
+spread evenly over the whole campaign, large domains included, while
+keeping the workbook order within each domain.
+
+DomainPacer enforces a minimum gap between two sends to the same domain.
+The engines apply it after the global pace, right before sending, so the
+gap holds whatever the number of connections.
+"""
+
+import heapq
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+def recipient_domain(address: str) -> str:
+    """Lower-cased domain of an email address ('' if there is none)."""
+    return address.rpartition('@')[2].strip().lower() if '@' in address else ''
+
+
+def interleave_by_domain(items: Iterable[Dict], key: Callable[[Dict], str] = lambda item: item['email']) -> List[Dict]:
+    """Items reordered so that each recipient domain is spread evenly over the queue."""
+    queues: Dict[str, List[Dict]] = {}
+    for item in items:
+        queues.setdefault(recipient_domain(key(item)), []).append(item)
+
+    # (virtual time, first appearance of the domain, rank in the domain, item)
+    heap = []
+    for first, domain_items in enumerate(queues.values()):
+        count = len(domain_items)
+        heap.extend(((rank + 0.5) / count, first, rank, item) for rank, item in enumerate(domain_items))
+    heapq.heapify(heap)
+
+    ordered = []
+    last_domain = None
+    while heap:
+        entry = heapq.heappop(heap)
+        # Domains due at the same time: never send the same one twice in a row if another is waiting
+        if entry[1] == last_domain and heap and heap[0][1] != last_domain:
+            entry = heapq.heapreplace(heap, entry)
+        last_domain = entry[1]
+        ordered.append(entry[3])
+    return ordered
+
+
+class DomainPacer:
+    """Minimum spacing between two sends to the same recipient domain. Thread-safe."""
+
+    def __init__(self, min_spacing: float = 0):
+        self.min_spacing = min_spacing
+        self._lock = threading.Lock()
+        self._next_slot: Dict[str, float] = {}
+
+    def reserve(self, domain: str) -> float:
+        """Reserve the next send slot for this domain and return how long to wait for it."""
+        if not self.min_spacing or not domain:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(domain, 0.0))
+            self._next_slot[domain] = slot + self.min_spacing
+            return slot - now
+
+    def wait(self, domain: str, stop_event: Optional[threading.Event] = None) -> bool:
+        """Block until the domain slot. Returns False if stop_event was set meanwhile."""
+        wait_time = self.reserve(domain)
+        if stop_event is not None:
+            return not stop_event.wait(wait_time)
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return True
@@ -0,0 +1,203 @@
+"""
+Recipient domain validation for MERCI RAYMOND Email Automation.
+
+The address pattern accepts any well-formed domain, including typos and
+domains that no longer exist: every such send wastes a quota slot and
+hurts the sender reputation. DomainValidator resolves each distinct
+recipient domain once per campaign (a list of 100k contacts typically has
+a few thousand domains), concurrently, and keeps the answers for a TTL so
+the next campaigns reuse them.
+
+Resolvers are pluggable: any object with resolve(domain) -> status.
+
+    DNSResolver     MX then A/AAAA records (dnspython, used when installed)
+    SystemResolver  A/AAAA through the system resolver (getaddrinfo); cannot
+                    see MX records, so it never reports a domain as undeliverable
+    StubResolver    fixed answers, for tests and offline runs
+
+Statuses:
+    'mx'       the domain has mail servers
+    'a'        no MX but an address: mail goes to it (implicit MX)
+    'null_mx'  the domain declares it accepts no mail (MX "." - RFC 7505)
+    'none'     the domain does not exist or has no record
+    'error'    lookup failed (timeout, no network): the domain is not flagged
+"""
+
+import importlib.util
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+DOMAIN_STATUSES = ('mx', 'a', 'null_mx', 'none', 'error')
+UNDELIVERABLE_STATUSES = ('null_mx', 'none')
+
+DEFAULT_TTL = 3600
+# Failed lookups are retried sooner
+ERROR_TTL = 60
+DEFAULT_WORKERS = 16
+# Domains kept in the cache; the least recently checked ones are dropped first
+DEFAULT_CACHE_SIZE = 50000
+DEFAULT_TIMEOUT = 5.0
+# Must always resolve: when a whole batch comes back 'none', a failing probe
+# means the DNS itself is unusable (offline, filtering resolver), not the domains
+PROBE_DOMAIN = 'gmail.com'
+
+
+def domain_issue(domain: str, status: str) -> Optional[str]:
+    """Verification issue for an undeliverable domain, None otherwise."""
+    if status == 'none':
+        return f"Domaine inexistant ou sans serveur mail: {domain}"
+    if status == 'null_mx':
+        return f"Domaine qui refuse les emails (MX nul): {domain}"
+    return None
+
+
+class DNSResolver:
+    """MX lookup, falling back to A/AAAA, through dnspython."""
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT):
+        import dns.resolver
+
+        self._resolver = dns.resolver.Resolver()
+        self._resolver.lifetime = timeout
+
+    def resolve(self, domain: str) -> str:
+        import dns.exception
+        import dns.resolver
+
+        try:
+            answer = self._resolver.resolve(domain, 'MX')
+            if all(str(record.exchange) in ('.', '') for record in answer):
+                return 'null_mx'
+            return 'mx'
+        except dns.resolver.NXDOMAIN:
+            return 'none'
+        except dns.resolver.NoAnswer:
+            pass
+        except dns.exception.DNSException:
+            return 'error'
+
+        for record_type in ('A', 'AAAA'):
+            try:
+                self._resolver.resolve(domain, record_type)
+                return 'a'
+            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+                continue
+            except dns.exception.DNSException:
+                return 'error'
+        return 'none'
+
+
+class SystemResolver:
+    """
+    Address lookup through the system resolver. It cannot see MX records: a
+    domain with mail servers but no address is valid (RFC 5321), so a missing
+    address is an 'error' (not flagged), never 'none'.
+    """
+
+    def resolve(self, domain: str) -> str:
+        try:
+            socket.getaddrinfo(domain, 25, type=socket.SOCK_STREAM)
+            return 'a'
+        except (OSError, UnicodeError):
+            return 'error'
+
+
+class StubResolver:
+    """Fixed answers per domain; other domains get `default`. Counts the lookups."""
+
+    def __init__(self, records: Optional[Dict[str, str]] = None, default: str = 'mx', delay: float = 0.0):
+        self.records = dict(records or {})
+        self.default = default
+        self.delay = delay
+        self.lookups: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, domain: str) -> str:
+        with self._lock:
+            self.lookups[domain] = self.lookups.get(domain, 0) + 1
+        if self.delay:
+            time.sleep(self.delay)
+        return self.records.get(domain, self.default)
+
+
+def default_resolver():
+    """dnspython when installed (MX records), otherwise the system resolver."""
+    if importlib.util.find_spec('dns') is not None:
+        return DNSResolver()
+    return SystemResolver()
+
+
+class DomainValidator:
+    """
+    Status of recipient domains, resolved concurrently and cached for `ttl`
+    seconds. At most `cache_size` domains are kept (LRU). Thread-safe.
+    """
+
+    def __init__(self, resolver=None, ttl: float = DEFAULT_TTL, error_ttl: float = ERROR_TTL,
+                 max_workers: int = DEFAULT_WORKERS, clock: Callable[[], float] = time.monotonic,
+                 probe_domain: Optional[str] = PROBE_DOMAIN, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.resolver = resolver or default_resolver()
+        self.probe_domain = probe_domain
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.max_workers = max(1, max_workers)
+        self.clock = clock
+        self.cache_size = max(1, cache_size)
+        self._lock = threading.Lock()
+        self._cache: OrderedDict = OrderedDict()
+
+    def _resolve(self, domain: str) -> str:
+        try:
+            status = self.resolver.resolve(domain)
+        except Exception:
+            status = 'error'
+        return status if status in DOMAIN_STATUSES else 'error'
+
+    def check_domains(self, domains: Iterable[str]) -> Dict[str, str]:
+        """Status of each distinct domain: cached answers, the others looked up in parallel."""
+        now = self.clock()
+        statuses = {}
+        missing = []
+        with self._lock:
+            for domain in dict.fromkeys(domains):
+                if not domain:
+                    continue
+                cached = self._cache.get(domain)
+                if cached is not None and cached[1] > now:
+                    statuses[domain] = cached[0]
+                    self._cache.move_to_end(domain)
+                else:
+                    missing.append(domain)
+
+        if missing:
+            workers = min(self.max_workers, len(missing))
+            if workers == 1:
+                resolved = [self._resolve(domain) for domain in missing]
+            else:
+                with ThreadPoolExecutor(workers, thread_name_prefix='dns') as executor:
+                    resolved = list(executor.map(self._resolve, missing))
+            if (self.probe_domain and all(status == 'none' for status in resolved)
+                    and self._resolve(self.probe_domain) in ('none', 'error')):
+                resolved = ['error'] * len(missing)
+            now = self.clock()
+            with self._lock:
+                for domain, status in zip(missing, resolved):
+                    statuses[domain] = status
+                    self._cache[domain] = (status, now + (self.error_ttl if status == 'error' else self.ttl))
+                    self._cache.move_to_end(domain)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return statuses
+
+    def check(self, domain: str) -> str:
+        """Status of one domain."""
+        return self.check_domains([domain]).get(domain, 'none')
+
+    def undeliverable(self, domains: Iterable[str]) -> Dict[str, str]:
+        """Domains that cannot receive mail, with their status."""
+        return {domain: status for domain, status in self.check_domains(domains).items()
+                if status in UNDELIVERABLE_STATUSES}
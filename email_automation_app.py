@@ -1,19 +1,52 @@
 import streamlit as st
 import pandas as pd
-import smtplib
-import re
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.image import MIMEImage
-from email.mime.application import MIMEApplication
 import os
-from typing import Dict, List, Tuple, Optional
+import io
+import hashlib
+import uuid
+from typing import Dict, List
+
+from functools import partial
+
+from smtp_policy import Pacer
+from async_sender import AsyncSendEngine
+from send_journal import DEFAULT_JOURNAL_PATH, campaign_key, contacts_digest, files_digest
+from send_worker import SendWorker
+from campaign_metrics import DEFAULT_METRICS_DIR, CampaignMetrics
+from rate_limiter import DEFAULT_QUOTA_PATH, DEFAULT_QUOTAS
+from domain_scheduler import interleave_by_domain
+from domain_validator import DomainValidator
+from email_index import (
+    DEFAULT_SUPPRESSION_PATH, SuppressionList, iter_addresses, normalize_email, write_suppression_file
+)
+from processed_store import DEFAULT_PROCESSED_STORE_PATH, PAGE_SIZE, ProcessedStore, StoredContacts
+from ingestion import SUPPORTED_EXTENSIONS, available_engines, read_contacts
+from email_core import (
+    SMTP_SERVER, SMTP_PORT, DEFAULT_EMAIL_HEADER, DEFAULT_EMAIL_FOOTER, QUOTA_DELAY_MODE, EmailAutomation,
+    calculate_sending_time, create_pacer, build_message_skeleton, process_contacts, render_processed_email,
+    build_send_job, filter_suppressed
+)
+
+# Parsed uploads kept in the shared cache (by file content hash)
+UPLOAD_CACHE_ENTRIES = 4
+
+# Local record of sent emails, used to resume an interrupted campaign
+SEND_JOURNAL_PATH = os.environ.get('SEND_JOURNAL_PATH', DEFAULT_JOURNAL_PATH)
+
+# Token bucket levels per sending account, shared by every session
+SEND_QUOTA_PATH = os.environ.get('SEND_QUOTA_PATH', DEFAULT_QUOTA_PATH)
 
-import time
-import base64
-import random
-import html2text
-from datetime import datetime, timedelta
+# Unsubscribed / bounced addresses, removed from every contact file
+SUPPRESSION_LIST_PATH = os.environ.get('SUPPRESSION_LIST_PATH', DEFAULT_SUPPRESSION_PATH)
+
+# Prometheus textfile and JSON summary of every campaign
+CAMPAIGN_METRICS_DIR = os.environ.get('CAMPAIGN_METRICS_DIR', DEFAULT_METRICS_DIR)
+
+# Processed contacts of the last runs, reviewed page by page
+PROCESSED_STORE_PATH = os.environ.get('PROCESSED_STORE_PATH', DEFAULT_PROCESSED_STORE_PATH)
+
+# Refresh period of the sending progress (seconds)
+SEND_PROGRESS_REFRESH = 2
 
 # Page configuration
 st.set_page_config(
@@ -71,459 +104,257 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Gmail SMTP Configuration (hardcoded)
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
-
-class EmailAutomation:
-    def __init__(self):
-        # Base email template for TEXT format (includes greetings and signature)
-        self.base_email_content_text = """Bonjour {contact_name},
-
-Lorsque l'été touche à sa fin et l'hiver arrive à pas feutrés…
-
-Les Raymonds vous emmènent dans leur traîneau et vous proposent une large palette de sapins, décorations et animations afin de préparer l'arrivée des fêtes de fin d'année !
-
-Créez une ambiance unique avec des sapins, robustes et élégants, disponibles de 80 à 200 cm, et décorés selon vos préférences. Découvrez également nos guirlandes sur mesure, faites de branchages et personnalisables.
-
-Vous connaissez les Raymonds, ces décorations 100% végétales seront aussi festives que durables ! Matériaux sourcés & Réemploi en intégralité.
-Remplissez la lettre au père noël jointe à ce mail avec vos désirs de couleurs et vos choix de dimensions, et faisons germer ensemble l'esprit de Noël dans votre {site} !
-
-🎁 Pour l'occasion, nous avons le plaisir d'offrir à nos clients du pôle entretien une réduction spéciale de 10 % sur notre catalogue de Noël.
-
-Je reste à votre entière disposition pour tout complément d'information ou pour une offre sur mesure.
-
-En vous souhaitant une bonne journée,
-
-L'équipe MERCI RAYMOND"""
-
-        # Base email template for Gmail-style HTML format
-        self.base_email_content_html = """Lorsque l'été touche à sa fin et l'hiver arrive à pas feutrés…
-
-Les Raymonds vous emmènent dans leur traîneau et vous proposent une large palette de sapins, décorations et animations afin de préparer l'arrivée des fêtes de fin d'année !
-
-Créez une ambiance unique avec des sapins, robustes et élégants, disponibles de 80 à 200 cm, et décorés selon vos préférences. Découvrez également nos guirlandes sur mesure, faites de branchages et personnalisables.
-
-Vous connaissez les Raymonds, ces décorations 100% végétales seront aussi festives que durables ! Matériaux sourcés & Réemploi en intégralité.
-Remplissez la lettre au père noël jointe à ce mail avec vos désirs de couleurs et vos choix de dimensions, et faisons germer ensemble l'esprit de Noël dans votre {site} !
-
-🎁 **Pour l'occasion**, nous avons le plaisir d'offrir à nos clients du pôle entretien une **réduction spéciale de 10%** sur notre catalogue de Noël.
-
-Je reste à votre entière disposition pour tout complément d'information ou pour une offre sur mesure."""
-
-        # Gmail-style HTML template that looks like plain text
-        self.html_template = """<div style="font-family: Arial, Helvetica, sans-serif; font-size: 14px; line-height: 1.4; color: #202124; background: #ffffff; margin: 0; padding: 0;">
-  {header_section}
-
-  <p style="margin: 0 0 16px 0;">
-    {first_paragraph}
-  </p>
-
-  {decorative_image_section}
-
-  <p style="margin: 0 0 16px 0;">
-    {second_paragraph}
-  </p>
-
-  {footer_section}
-
-  {logo_section}
-</div>"""
-        # Get OpenAI API key from secrets
- #       try:
-#            self.openai_api_key = st.secrets["api_key"]
-  ##             self.openai_api_key = None
-    ##   except:
-      #      self.openai_api_key = None
-       #     st.warning("⚠️ Fichier secrets.toml manquant. Personnalisation simple uniquement.")
-
-    def detect_column_mapping(self, df: pd.DataFrame) -> Dict[str, any]:
-        """
-        Dynamically detect all columns and identify email column.
-        Returns email column name and all available placeholders.
-        """
-        columns = df.columns.tolist()
-
-        # Email detection patterns
-        email_patterns = [
-            r'email', r'e-mail', r'mail', r'contact.*client.*1', r'email.*1',
-            r'adresse.*mail', r'contact.*mail', r'email.*address', r'electronic.*mail'
-        ]
-
-        # Full name detection patterns
-        full_name_patterns = [
-            r'name', r'nom', r'full.*name', r'nom.*complet', r'contact.*name',
-            r'client.*name', r'utilisateur', r'user.*name', r'prenom.*nom'
-        ]
-
-        # Find email column
-        email_column = None
-        best_score = 0
-
-        for col in columns:
-            col_lower = col.lower().strip()
-            for pattern in email_patterns:
-                if re.search(pattern, col_lower):
-                    # Score based on pattern match quality
-                    score = len(pattern) / len(col_lower) if col_lower else 0
-                    if score > best_score:
-                        best_score = score
-                        email_column = col
-
-        # Find full name columns
-        full_name_columns = []
-        for col in columns:
-            col_lower = col.lower().strip()
-            for pattern in full_name_patterns:
-                if re.search(pattern, col_lower) and col != email_column:
-                    # Check if column contains full names (has spaces)
-                    sample_values = df[col].dropna().astype(str).head(5)
-                    if any(' ' in str(val) for val in sample_values):
-                        full_name_columns.append(col)
-                        break
-
-        # Create available placeholders (all columns except email)
-        available_placeholders = {}
-        for col in columns:
-            if col != email_column:
-                available_placeholders[col] = col
-
-                # Add first name and last name placeholders for full name columns
-                if col in full_name_columns:
-                    available_placeholders[f"{col}_first"] = f"{col}_first"
-                    available_placeholders[f"{col}_last"] = f"{col}_last"
-
-        return {
-            'email_column': email_column,
-            'available_placeholders': available_placeholders,
-            'full_name_columns': full_name_columns,
-            'all_columns': columns
-        }
+@st.cache_data(max_entries=UPLOAD_CACHE_ENTRIES, show_spinner="Lecture du fichier...")
+def load_contact_file(content_hash: str, filename: str, engine: str, _data: bytes) -> Dict:
+    """
+    Parse, map and extract an uploaded file once per content hash and engine.
+    The raw bytes are not hashed by Streamlit (leading underscore), content_hash is the key.
+    """
+    df, parse_stats = read_contacts(io.BytesIO(_data), filename=filename, engine=engine)
+    automation = EmailAutomation()
+    mapping = automation.detect_column_mapping(df)
+    contacts, duplicates_removed = automation.extract_valid_contacts(df)
+    return {'df': df, 'parse_stats': parse_stats, 'mapping': mapping,
+            'contacts': contacts, 'duplicates_removed': duplicates_removed}
+
+def get_uploaded_contacts(uploaded_file, engine: str) -> Dict:
+    """
+    Loaded contact file for this session. Reruns with the same upload reuse the
+    same objects without hashing or copying anything; a new upload goes
+    through the content-hash cache.
+    """
+    memo_key = (getattr(uploaded_file, 'file_id', None), uploaded_file.name, uploaded_file.size, engine)
+    memo = st.session_state.get('uploaded_contacts')
+    if memo is None or memo[0] != memo_key:
+        data = uploaded_file.getvalue()
+        loaded = load_contact_file(hashlib.sha256(data).hexdigest(), uploaded_file.name, engine, data)
+        memo = (memo_key, loaded)
+        st.session_state.uploaded_contacts = memo
+    return memo[1]
+
+@st.cache_resource
+def get_domain_validator() -> DomainValidator:
+    """Recipient domain checks, cached (TTL) for every session of this server process"""
+    return DomainValidator()
+
+@st.cache_resource(max_entries=1)
+def open_suppression_list(path: str, modified: float) -> SuppressionList:
+    """Memory-mapped suppression list, opened again only when the file changes"""
+    return SuppressionList(path)
+
+def get_suppression_list():
+    """Current suppression list, or None when there is none yet"""
+    if not os.path.exists(SUPPRESSION_LIST_PATH):
+        return None
+    return open_suppression_list(SUPPRESSION_LIST_PATH, os.path.getmtime(SUPPRESSION_LIST_PATH))
+
+def get_deliverable_contacts(loaded: Dict):
+    """Contacts of the loaded file minus the suppression list, and how many were removed (memoized per list version)"""
+    suppression = get_suppression_list()
+    memo_key = (id(loaded['contacts']), suppression and os.path.getmtime(suppression.path))
+    memo = st.session_state.get('deliverable_contacts')
+    if memo is None or memo[0] != memo_key:
+        memo = (memo_key, filter_suppressed(loaded['contacts'], suppression))
+        st.session_state.deliverable_contacts = memo
+    return memo[1]
+
+def get_column_mapping(df: pd.DataFrame) -> Dict:
+    """Column mapping of the loaded file, detected again only for a different dataframe"""
+    mapping = st.session_state.get('column_mapping')
+    if mapping is None or st.session_state.get('column_mapping_df_id') != id(df):
+        mapping = st.session_state.email_automation.detect_column_mapping(df)
+        st.session_state.column_mapping = mapping
+        st.session_state.column_mapping_df_id = id(df)
+    return mapping
+
+@st.cache_resource
+def get_send_worker() -> SendWorker:
+    """Background sender shared by every session of this server process"""
+    return SendWorker(SEND_JOURNAL_PATH)
+
+@st.cache_resource
+def get_processed_store() -> ProcessedStore:
+    """Processed runs on disk, shared by every session of this server process"""
+    return ProcessedStore(PROCESSED_STORE_PATH)
+
+def run_owner() -> str:
+    """
+    Token the processed runs of this page belong to, kept in the URL: reloading
+    the page (e.g. after a restart) finds its runs again, other browsers do not
+    """
+    owner = st.query_params.get('runs')
+    if not owner:
+        owner = uuid.uuid4().hex
+        st.query_params['runs'] = owner
+    return owner
+
+def use_processed_run(run: Dict):
+    """Review and send this stored run; images are those of the current session"""
+    st.session_state.processed_run = run['run_id']
+    st.session_state.processed_contacts = StoredContacts(get_processed_store(), run['run_id'])
+    st.session_state.render_settings = {
+        **run['render_settings'],
+        'logo_file': st.session_state.get('logo_file'),
+        'decorative_image_file': st.session_state.get('decorative_image_file')
+    }
 
-    def extract_contact_info(self, row: pd.Series, email_column: str, available_placeholders: Dict[str, str], full_name_columns: List[str] = None) -> Dict[str, str]:
-        """Extract all contact information from a row dynamically."""
-        info = {}
-
-        # Extract email
-        if email_column and email_column in row.index:
-            email_value = row[email_column]
-            if pd.notna(email_value):
-                info['email'] = str(email_value).strip()
-
-        # Extract all other columns as placeholders
-        for col_name in available_placeholders.keys():
-            if col_name in row.index:
-                value = row[col_name]
-                if pd.notna(value):
-                    info[col_name] = str(value).strip()
-                else:
-                    info[col_name] = ''
-
-        # Extract first name and last name from full name columns
-        if full_name_columns:
-            for full_name_col in full_name_columns:
-                if full_name_col in row.index and pd.notna(row[full_name_col]):
-                    full_name = str(row[full_name_col]).strip()
-                    name_parts = full_name.split()
-
-                    # Add first name (first part)
-                    if len(name_parts) > 0:
-                        info[f"{full_name_col}_first"] = name_parts[0]
-
-                    # Add last name (all parts after first, joined)
-                    if len(name_parts) > 1:
-                        info[f"{full_name_col}_last"] = ' '.join(name_parts[1:])
-                    else:
-                        info[f"{full_name_col}_last"] = ''
-
-        return info
-
-    def get_valid_emails_from_df(self, df: pd.DataFrame) -> List[Dict[str, str]]:
-        """Extract all valid emails from the dataframe with dynamic column detection."""
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-
-        # Detect column mapping
-        mapping = self.detect_column_mapping(df)
-        email_column = mapping['email_column']
-        available_placeholders = mapping['available_placeholders']
-        full_name_columns = mapping['full_name_columns']
-
-        valid_contacts = []
-
-        for idx, row in df.iterrows():
-            contact_info = self.extract_contact_info(row, email_column, available_placeholders, full_name_columns)
-
-            # Check if we have a valid email
-            if contact_info.get('email') and re.search(email_pattern, contact_info['email']):
-                # Create contact with all available data
-                contact_data = {
-                    'index': idx,
-                    'email': contact_info['email']
-                }
-
-                # Add all other fields dynamically
-                for key, value in contact_info.items():
-                    if key != 'email':
-                        contact_data[key] = value
-
-                # Add a default contact name if none exists
-                if not any(key.lower() in ['name', 'nom', 'contact', 'contact_name'] for key in contact_data.keys()):
-                    contact_data['contact_name'] = 'Contact'
-
-                valid_contacts.append(contact_data)
-
-        # Remove duplicates by email address, keeping first occurrence
-        unique_contacts = []
-        seen_emails = set()
-        duplicates_removed = 0
-
-        for contact in valid_contacts:
-            email = contact['email']
-            if email not in seen_emails:
-                unique_contacts.append(contact)
-                seen_emails.add(email)
+def page_offset(total: int, key: str) -> int:
+    """Offset of the page chosen by the user, with a page selector when there is more than one"""
+    pages = (total + PAGE_SIZE - 1) // PAGE_SIZE
+    if pages <= 1:
+        return 0
+    page = st.number_input(f"Page (sur {pages})", min_value=1, max_value=pages, value=1, step=1, key=key)
+    return (int(page) - 1) * PAGE_SIZE
+
+def contact_display_name(email_data: Dict) -> str:
+    return email_data.get('contact_name', email_data.get('Name', email_data.get('Full Name', email_data['email'])))
+
+def start_campaign(emails: List[Dict], sender_email: str, sender_password: str, email_subject: str,
+                   cc_emails: str, smtp_connections: int, pacer: Pacer, interleave_domains: bool = True,
+                   domain_spacing: float = 0, label: str = '', test_mode: bool = False) -> str:
+    """
+    Submit processed emails to the background sender and return the campaign id.
+    Recipient domains are alternated and spaced by at least domain_spacing seconds.
+    Progress is journaled on disk: a recipient already sent the same message
+    (settings, images and attachments) is skipped, even from an edited contact
+    list. Connection/login errors show up in the campaign status.
+    """
+    render_settings = st.session_state.render_settings
+
+    # Same message -> recipients already reached are skipped; same contacts too -> same campaign, resumed
+    message_key = campaign_key(
+        sender_email, email_subject, cc_emails, render_settings['email_content'],
+        render_settings.get('header_content'), render_settings.get('footer_content'),
+        files_digest(st.session_state.get('logo_file'), st.session_state.get('decorative_image_file'),
+                     *(st.session_state.get('attachment_files') or [])),
+        'test' if test_mode else ''
+    )
+    campaign_id = campaign_key(message_key, contacts_digest(entry.get('original_email', entry['email'])
+                                                            for entry in emails))
+    # Copies: the page keeps editing its entries (test mode, corrections) while the campaign runs
+    emails = [dict(entry) for entry in emails]
+    contacts = st.session_state.processed_contacts
+    if isinstance(contacts, StoredContacts):
+        # The stored run may be pruned while the campaign is sent: the worker keeps its own contacts
+        contacts = contacts.snapshot(entry['position'] for entry in emails)
+    if interleave_domains:
+        emails = interleave_by_domain(emails)
+
+    # Images and attachments are encoded once for the whole campaign
+    metrics = CampaignMetrics(campaign_id)
+    skeleton, warnings = build_message_skeleton(
+        st.session_state.email_automation,
+        logo_file=st.session_state.get('logo_file', None),
+        decorative_image_file=st.session_state.get('decorative_image_file', None),
+        attachment_files=st.session_state.get('attachment_files', []),
+        metrics=metrics
+    )
+    for warning in warnings:
+        st.warning(warning)
+
+    campaign = {
+        'campaign_id': campaign_id,
+        'message_key': message_key,
+        'label': label,
+        'emails': emails,
+        # Messages are rendered again from the compiled template, one at a time
+        'render_email': partial(
+            render_processed_email, automation=st.session_state.email_automation,
+            contacts=contacts, render_settings=render_settings
+        ),
+        'build_job': lambda email_data, message_id: build_send_job(
+            email_data, sender_email, email_subject, cc_emails, skeleton, message_id=message_id
+        ),
+        'engine': AsyncSendEngine(
+            SMTP_SERVER, SMTP_PORT, sender_email, sender_password,
+            max_connections=smtp_connections, pacer=pacer, domain_spacing=domain_spacing, metrics=metrics
+        ),
+        'display': contact_display_name,
+        'message_id_domain': sender_email.split('@')[-1],
+        'metrics': metrics,
+        'metrics_dir': CAMPAIGN_METRICS_DIR
+    }
+    campaign_id = get_send_worker().submit(campaign)
+
+    campaign_ids = st.session_state.setdefault('send_campaign_ids', [])
+    if campaign_id not in campaign_ids:
+        campaign_ids.append(campaign_id)
+    return campaign_id
+
+@st.fragment(run_every=SEND_PROGRESS_REFRESH)
+def show_send_progress():
+    """Progress of the campaigns started from this session, refreshed while the rest of the page stays usable"""
+    worker = get_send_worker()
+    for campaign_id in st.session_state.get('send_campaign_ids', []):
+        status = worker.status(campaign_id)
+        if status is None:
+            continue
+
+        st.markdown(f"**📤 {status['label'] or 'Campagne'}**")
+        st.progress(min(status['progress'], 1.0))
+        rate = status['messages_per_second'] * 60
+        details = f"{status['sent']}/{status['total']} envoyés"
+        if status['already_sent']:
+            details += f" ({status['already_sent']} déjà envoyés lors d'un envoi précédent)"
+        if status['failed']:
+            details += f" - {status['failed']} échecs"
+        st.caption(f"{details} - {rate:.1f} emails/min")
+
+        if status['state'] in ('queued', 'running', 'paused'):
+            labels = {'queued': "⏳ En attente d'un autre envoi", 'running': "▶️ Envoi en cours",
+                      'paused': "⏸️ En pause"}
+            st.info(f"{labels[status['state']]} - vous pouvez continuer à utiliser l'application")
+            col1, col2 = st.columns(2)
+            with col1:
+                if status['state'] == 'paused':
+                    if st.button("▶️ Reprendre", key=f"resume_{campaign_id}"):
+                        worker.resume(campaign_id)
+                        st.rerun(scope="fragment")
+                elif st.button("⏸️ Pause", key=f"pause_{campaign_id}"):
+                    worker.pause(campaign_id)
+                    st.rerun(scope="fragment")
+            with col2:
+                if st.button("⏹️ Annuler", key=f"cancel_{campaign_id}"):
+                    worker.cancel(campaign_id)
+                    st.rerun(scope="fragment")
+        elif status['state'] == 'done':
+            if status['sent'] > 0:
+                st.markdown('<div class="success-box">', unsafe_allow_html=True)
+                st.success(f"✅ **{status['sent']} emails envoyés avec succès!** 🎉")
+                st.markdown('</div>', unsafe_allow_html=True)
+                st.markdown("""
+                <div style="text-align: center; margin: 20px 0;">
+                    <div style="font-size: 4rem; color: #4CAF50;">✅</div>
+                    <h3 style="color: #2E7D32; margin: 10px 0;">Envoi Terminé avec Succès!</h3>
+                </div>
+                """, unsafe_allow_html=True)
             else:
-                duplicates_removed += 1
-
-        # Store duplicate count for display
-        st.session_state.duplicates_removed = duplicates_removed
-
-        return unique_contacts
-
-    def encode_image_to_base64(self, image_file) -> Optional[str]:
-        """Convert uploaded image to base64 for embedding in HTML"""
-        try:
-            return base64.b64encode(image_file.getvalue()).decode()
-        except:
-            return None
-
-    def compress_image(self, image_file, max_width=1600, quality=82):
-        """Compress image to reduce file size for email sending"""
-        try:
-            from PIL import Image
-            import io
-
-            # Get original image data
-            original_data = image_file.getvalue()
-            original_image = Image.open(io.BytesIO(original_data))
-
-            # Calculate new dimensions maintaining aspect ratio
-            if original_image.width > max_width:
-                ratio = max_width / original_image.width
-                new_height = int(original_image.height * ratio)
-                original_image = original_image.resize((max_width, new_height), Image.Resampling.LANCZOS)
-
-            # Convert to RGB if necessary (for JPEG)
-            if original_image.mode in ('RGBA', 'LA', 'P'):
-                # Create white background for transparency
-                background = Image.new('RGB', original_image.size, (255, 255, 255))
-                if original_image.mode == 'P':
-                    original_image = original_image.convert('RGBA')
-                background.paste(original_image, mask=original_image.split()[-1] if original_image.mode == 'RGBA' else None)
-                original_image = background
-            elif original_image.mode != 'RGB':
-                original_image = original_image.convert('RGB')
-
-            # Save compressed image to BytesIO
-            compressed_buffer = io.BytesIO()
-            original_image.save(compressed_buffer, format='JPEG', quality=quality, optimize=True)
-            compressed_buffer.seek(0)
-
-            # Create new file-like object with compressed data
-            class CompressedImageFile:
-                def __init__(self, data, name):
-                    self._data = data
-                    self.name = name
-                    self.type = 'image/jpeg'
-
-                def getvalue(self):
-                    return self._data
-
-            return CompressedImageFile(compressed_buffer.getvalue(), image_file.name)
-
-        except Exception as e:
-            # If compression fails, return original file
-            print(f"Image compression failed: {e}")
-            return image_file
-
-    def convert_markdown_to_html(self, text: str) -> str:
-        """Convert markdown-style formatting to HTML for email"""
-        # Convert **bold text** to <strong>bold text</strong>
-        text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', text)
-
-        # Convert *italic text* to <em>italic text</em>
-        text = re.sub(r'\*(.*?)\*', r'<em>\1</em>', text)
-
-        return text
-
-    def personalize_email(self, contact_data: Dict[str, str], email_content: str, use_html: bool = False,
-                         logo_file=None, decorative_image_file=None, attachment_files=None) -> str:
-        """
-        Dynamic personalization with any column placeholders from Excel data
-        """
-        # Safety check for email content - use appropriate template based on format
-        if email_content is None:
-            email_content = self.base_email_content_html if use_html else self.base_email_content_text
-
-        # Start with the email content
-        personalized = email_content
-
-        # Replace all placeholders dynamically
-        for key, value in contact_data.items():
-            if key != 'email' and key != 'index':  # Skip email and index
-                placeholder = f"{{{key}}}"
-                # Replace with actual value or empty string if missing
-                replacement_value = value if value else ""
-                personalized = personalized.replace(placeholder, replacement_value)
-
-        # Handle special case for contact name (extract first name)
-        contact_name = contact_data.get('contact_name', '')
-        if contact_name and len(contact_name.split()) > 1:
-            first_name = contact_name.split()[0]
+                st.success("✅ Envoi terminé!")
+        elif status['state'] == 'cancelled':
+            st.warning(f"⏹️ Envoi annulé - {status['sent']} emails envoyés. Relancez l'envoi pour reprendre là où il s'est arrêté.")
         else:
-            first_name = "Madame/Monsieur"
-
-        # Replace {contact_name} if it exists in the template
-        personalized = personalized.replace('{contact_name}', first_name)
-
-        if use_html:
-            # Prepare logo section - small signature-style image
-            logo_section = ""
-            if logo_file:
-                logo_section = f'<img src="cid:logo" alt="Merci Raymond" style="display:inline-block; height:24px; width:auto; border:0; outline:0; vertical-align:baseline;">'
-
-            # Check if {Image} placeholder exists in content
-            has_image_placeholder = '{Image}' in personalized
-
-            # Prepare decorative image section - only if no {Image} placeholder
-            decorative_image_section = ""
-            if decorative_image_file and not has_image_placeholder:
-                decorative_image_section = f'''
-                <div style="margin: 16px 0;">
-                <img src="cid:decorative_image" alt="Image" style="max-width: 100%; height: auto; border:0; outline:0; display: block;">
-                </div>'''
-
-            # Split content into first and second paragraphs for Gmail-style layout
-            paragraphs = personalized.split('\n\n')
-
-            # First paragraph: everything up to the decorative image
-            first_paragraph = ""
-            second_paragraph = ""
-
-            if len(paragraphs) >= 3:
-                # Split after the first two paragraphs for better balance
-                first_paragraph = paragraphs[0] + "\n\n" + paragraphs[1]
-                second_paragraph = "\n\n".join(paragraphs[2:])
-            elif len(paragraphs) >= 2:
-                # Split after the first paragraph
-                first_paragraph = paragraphs[0]
-                second_paragraph = "\n\n".join(paragraphs[1:])
-            else:
-                # If we can't split naturally, put most content in first paragraph
-                first_paragraph = personalized
-                second_paragraph = ""
-
-            # Clean up the paragraphs and ensure proper line breaks
-            first_paragraph = first_paragraph.strip()
-            second_paragraph = second_paragraph.strip()
-
-            # Convert line breaks to <br> tags for HTML
-            first_paragraph = first_paragraph.replace('\n', '<br>')
-            second_paragraph = second_paragraph.replace('\n', '<br>')
-
-            # Convert markdown-style bold text to HTML
-            first_paragraph = self.convert_markdown_to_html(first_paragraph)
-            second_paragraph = self.convert_markdown_to_html(second_paragraph)
-
-            # Replace {Image} placeholder with actual image HTML if it exists
-            if has_image_placeholder and decorative_image_file:
-                image_html = f'''
-                <div style="margin: 16px 0;">
-                <img src="cid:decorative_image" alt="Image" style="max-width: 100%; height: auto; border:0; outline:0; display: block;">
-                </div>'''
-                first_paragraph = first_paragraph.replace('{Image}', image_html)
-                second_paragraph = second_paragraph.replace('{Image}', image_html)
-
-            # Get custom header and footer from session state
-            header_content = st.session_state.get('email_header', 'Bonjour {contact_name}, j\'espère que vous allez bien.')
-            footer_content = st.session_state.get('email_footer', 'Bien cordialement,\nSalomé Cremona')
-
-            # Process header and footer with placeholders
-            header_processed = header_content
-            footer_processed = footer_content
-
-            # Replace placeholders in header and footer
-            for key, value in contact_data.items():
-                if key != 'email' and key != 'index':
-                    placeholder = f"{{{key}}}"
-                    replacement_value = value if value else ""
-                    header_processed = header_processed.replace(placeholder, replacement_value)
-                    footer_processed = footer_processed.replace(placeholder, replacement_value)
-
-            # Replace {contact_name} in header and footer
-            header_processed = header_processed.replace('{contact_name}', first_name)
-            footer_processed = footer_processed.replace('{contact_name}', first_name)
-
-            # Convert line breaks to <br> tags for HTML
-            header_processed = header_processed.replace('\n', '<br>')
-            footer_processed = footer_processed.replace('\n', '<br>')
-
-            # Convert markdown-style formatting to HTML
-            header_processed = self.convert_markdown_to_html(header_processed)
-            footer_processed = self.convert_markdown_to_html(footer_processed)
-
-            # Wrap header and footer in proper HTML paragraphs
-            header_section = f'<p style="margin: 0 0 16px 0;">{header_processed}</p>'
-            footer_section = f'<p style="margin: 0 0 16px 0;">{footer_processed}</p>'
-
-            # Apply Gmail-style HTML template
-            personalized = self.html_template.format(
-                header_section=header_section,
-                first_paragraph=first_paragraph,
-                second_paragraph=second_paragraph,
-                footer_section=footer_section,
-                logo_section=logo_section,
-                decorative_image_section=decorative_image_section
-            )
-
-        return personalized
-
-    def personalize_email_with_ai(self, contact_data: Dict[str, str], email_content: str, use_html: bool = False,
-                                 logo_file=None, decorative_image_file=None, attachment_files=None) -> str:
-        """AI personalization removed - using simple personalization instead"""
-        return self.personalize_email(contact_data, email_content, use_html, logo_file, decorative_image_file, attachment_files)
-
-    def verify_email_content(self, email_content: str) -> Tuple[bool, List[str]]:
-        """SUPER SIMPLE verification - only check for curly brace placeholders"""
-        issues = []
-
-        # Check for remaining curly brace placeholders - ONLY THESE
-        placeholder_patterns = [
-            r'\{[^}]*\}',         # {placeholder}
-            r'\{,?\}',            # {}, {,}
-        ]
-
-        for pattern in placeholder_patterns:
-            matches = re.findall(pattern, email_content, re.IGNORECASE)
-            if matches:
-                issues.extend([f"Placeholder trouvé: {match}" for match in matches])
-
-        # Basic check - email not empty
-        if not email_content.strip():
-            issues.append("Email vide")
-
-        return len(issues) == 0, issues
-
-def calculate_sending_time(num_emails: int, delay_seconds: int) -> str:
-    """Calculate total sending time"""
-    total_seconds = num_emails * delay_seconds
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-
-    if hours > 0:
-        return f"{hours}h {minutes}min"
-    else:
-        return f"{minutes}min"
+            st.error(f"Erreur de connexion Gmail: {status['error']}")
+            st.info("💡 Vérifiez que vous utilisez un mot de passe d'application Gmail")
+
+        metrics = worker.metrics(campaign_id)
+        if metrics is not None and status['state'] in ('done', 'cancelled'):
+            with st.expander("📊 Performances de l'envoi"):
+                latency = metrics['smtp_latency']
+                st.caption(f"{metrics['messages_per_second'] * 60:.1f} emails/min - "
+                           f"{metrics['bytes_per_second'] / 1024:.1f} Ko/s - latence SMTP p50 "
+                           f"{latency['p50']:.2f} s, p95 {latency['p95']:.2f} s, p99 {latency['p99']:.2f} s")
+                st.dataframe(pd.DataFrame([
+                    {'Étape': stage, 'Nombre': values['count'], 'Total (s)': round(values['total_seconds'], 3),
+                     'p50 (ms)': round(values['p50'] * 1000, 1), 'p95 (ms)': round(values['p95'] * 1000, 1),
+                     'p99 (ms)': round(values['p99'] * 1000, 1)}
+                    for stage, values in metrics['stages'].items()
+                ]), hide_index=True)
+                st.caption(f"Métriques exportées dans {CAMPAIGN_METRICS_DIR}/{campaign_id}.prom et .json")
+
+        if status['errors']:
+            with st.expander(f"❌ {status['failed']} emails ont échoué"):
+                for display_name, error in status['errors']:
+                    st.write(f"- {display_name}: {error}")
 
 def main():
     st.markdown('<h1 class="main-header">🌱 MERCI RAYMOND - Raymographe</h1>', unsafe_allow_html=True)
@@ -533,12 +364,12 @@ def main():
         st.session_state.df = None
     if 'email_automation' not in st.session_state:
         st.session_state.email_automation = EmailAutomation()
-    if 'processed_emails' not in st.session_state:
-        st.session_state.processed_emails = []
-    if 'edited_invalid_emails' not in st.session_state:
-        st.session_state.edited_invalid_emails = {}
-    if 'validated_invalid_emails' not in st.session_state:
-        st.session_state.validated_invalid_emails = []
+    if 'processed_run' not in st.session_state:
+        # The last processing of this page is picked up again after a restart of the server
+        st.session_state.processed_run = None
+        latest_run = get_processed_store().latest_run(run_owner())
+        if latest_run is not None:
+            use_processed_run(latest_run)
 
     # Sidebar for Gmail configuration
     st.sidebar.header("📧 Configuration Gmail")
@@ -589,11 +420,37 @@ def main():
 
     delay_mode = st.sidebar.radio(
         "Mode de délai:",
-        ["Délai fixe", "Délai aléatoire"],
-        help="Choisissez entre un délai fixe ou un délai aléatoire entre deux valeurs"
+        ["Délai fixe", "Délai aléatoire", QUOTA_DELAY_MODE],
+        help="Choisissez entre un délai fixe, un délai aléatoire entre deux valeurs, ou un envoi aussi rapide que les quotas Gmail le permettent"
     )
 
-    if delay_mode == "Délai fixe":
+    min_delay = max_delay = None
+    quotas = None
+    quota_jitter = 0
+    if delay_mode == QUOTA_DELAY_MODE:
+        col1, col2, col3 = st.sidebar.columns(3)
+        with col1:
+            per_minute = st.number_input("Par minute", min_value=0, max_value=1000,
+                                         value=DEFAULT_QUOTAS['minute'], help="0 = pas de limite")
+        with col2:
+            per_hour = st.number_input("Par heure", min_value=0, max_value=10000,
+                                       value=DEFAULT_QUOTAS['hour'], help="0 = pas de limite")
+        with col3:
+            per_day = st.number_input("Par jour", min_value=0, max_value=100000,
+                                      value=DEFAULT_QUOTAS['day'], help="0 = pas de limite")
+        quotas = {'minute': per_minute, 'hour': per_hour, 'day': per_day}
+        quota_jitter = st.sidebar.slider(
+            "Variation aléatoire (secondes)",
+            min_value=0,
+            max_value=60,
+            value=2,
+            help="Délai aléatoire ajouté à chaque envoi. Les quotas sont conservés entre les sessions ; les refus temporaires du serveur (421, 450, 452) suspendent l'envoi avec un délai croissant."
+        )
+        if not any(quotas.values()):
+            st.sidebar.warning("⚠️ Aucun quota défini : les emails partiront sans délai")
+        delay_between_emails = ", ".join(f"{limit}/{label}" for label, limit in
+                                         (("min", per_minute), ("h", per_hour), ("jour", per_day)) if limit)
+    elif delay_mode == "Délai fixe":
         delay_between_emails = st.sidebar.slider(
             "Délai fixe (secondes)",
             min_value=1,
@@ -627,6 +484,27 @@ def main():
 
         delay_between_emails = f"{min_delay}-{max_delay}"  # Store as range for display
 
+    smtp_connections = st.sidebar.slider(
+        "Connexions SMTP simultanées",
+        min_value=1,
+        max_value=8,
+        value=1,
+        help="Nombre maximum de connexions Gmail ouvertes en parallèle. La concurrence s'adapte automatiquement à la latence et aux refus temporaires (4xx) ; le délai anti-spam reste appliqué globalement."
+    )
+
+    interleave_domains = st.sidebar.checkbox(
+        "Alterner les domaines destinataires",
+        value=True,
+        help="Répartit les envois vers un même domaine (ex: toute une entreprise) sur toute la campagne au lieu de les envoyer à la suite"
+    )
+    domain_spacing = st.sidebar.number_input(
+        "Espacement minimum par domaine (secondes)",
+        min_value=0,
+        max_value=600,
+        value=0,
+        help="Délai minimum entre deux emails vers le même domaine, en plus du délai global"
+    )
+
     test_mode = st.sidebar.checkbox(
         "Mode test",
         help="Envoyer 5 emails de test à votre propre adresse (pas aux clients)"
@@ -643,6 +521,20 @@ def main():
     else:
         st.sidebar.info("📋 Aucun CC configuré")
 
+    # Suppression list
+    st.sidebar.subheader("🚫 Liste de suppression")
+    suppression = get_suppression_list()
+    st.sidebar.caption(f"{len(suppression) if suppression else 0:,} adresses désinscrites ou invalides, jamais contactées")
+    unsubscribed_file = st.sidebar.file_uploader(
+        "Ajouter des adresses",
+        type=['csv', 'txt'],
+        help="Une adresse par ligne (ou en première colonne d'un CSV) : désinscriptions, rebonds, refus"
+    )
+    if unsubscribed_file is not None and st.sidebar.button("🚫 Ajouter à la liste de suppression"):
+        lines = unsubscribed_file.getvalue().decode('utf-8-sig', errors='replace').splitlines()
+        count = write_suppression_file(SUPPRESSION_LIST_PATH, iter_addresses(lines))
+        st.sidebar.success(f"✅ Liste de suppression mise à jour: {count:,} adresses")
+
     # Main content
     tab1, tab2, tab3, tab4 = st.tabs(["📁 Upload & Preview", "🎨 Design Email", "✉️ Personnalisation", "🚀 Envoi"])
 
@@ -651,23 +543,33 @@ def main():
 
         uploaded_file = st.file_uploader(
             "Choisissez votre fichier Excel",
-            type=['xlsx', 'xls'],
-            help="Le fichier peut contenir n'importe quelles colonnes - l'app détectera automatiquement les noms, emails, entreprises, etc."
+            type=[extension.lstrip('.') for extension in SUPPORTED_EXTENSIONS],
+            help="Le fichier peut contenir n'importe quelles colonnes - l'app détectera automatiquement les noms, emails, entreprises, etc. Formats CSV et Parquet acceptés pour les gros fichiers."
         )
 
         if uploaded_file is not None:
             try:
-                df = pd.read_excel(uploaded_file)
+                # Parser choice: the fastest installed engine by default
+                ingestion_engine = st.selectbox(
+                    "Moteur de lecture",
+                    ['auto'] + available_engines(uploaded_file.name),
+                    help="auto = moteur le plus rapide disponible (calamine si installé, sinon openpyxl en lecture seule)"
+                )
+                loaded = get_uploaded_contacts(uploaded_file, ingestion_engine)
+                df, parse_stats = loaded['df'], loaded['parse_stats']
                 st.session_state.df = df
+                st.session_state.column_mapping = loaded['mapping']
+                st.session_state.column_mapping_df_id = id(df)
 
                 st.success(f"✅ Fichier chargé avec succès! {len(df)} lignes trouvées.")
+                st.caption(f"⏱️ Lecture: {parse_stats['seconds']:.2f}s - {parse_stats['rows_per_second']:,.0f} lignes/s (moteur {parse_stats['engine']})")
 
                 # Show preview
                 st.subheader("Aperçu des données")
                 st.dataframe(df.head(10))
 
-                # Detect column mapping and show it
-                mapping = st.session_state.email_automation.detect_column_mapping(df)
+                # Detected column mapping (computed once per file content)
+                mapping = loaded['mapping']
                 email_column = mapping['email_column']
                 available_placeholders = mapping['available_placeholders']
                 full_name_columns = mapping['full_name_columns']
@@ -719,7 +621,9 @@ def main():
                         st.write("**Placeholders:** Aucun (seulement email)")
 
                 # Get valid emails using new system
-                valid_contacts = st.session_state.email_automation.get_valid_emails_from_df(df)
+                valid_contacts, suppressed_count = get_deliverable_contacts(loaded)
+                duplicates_removed = loaded['duplicates_removed']
+                st.session_state.duplicates_removed = duplicates_removed
 
                 with col2:
                     st.write("**Statistiques:**")
@@ -729,12 +633,13 @@ def main():
                         st.metric("Taux email", f"{len(valid_contacts)/len(df)*100:.1f}%")
 
                     # Show duplicate removal info
-                    duplicates_removed = st.session_state.get('duplicates_removed', 0)
                     if duplicates_removed > 0:
                         st.metric("Doublons retirés", duplicates_removed)
                         st.info(f"📧 {len(valid_contacts)} emails uniques (dont {duplicates_removed} doublons retirés)")
                     else:
                         st.info(f"📧 {len(valid_contacts)} emails uniques")
+                    if suppressed_count > 0:
+                        st.metric("Désinscrits retirés", suppressed_count)
 
                 # Show user guidance
                 if email_column and available_placeholders:
@@ -812,7 +717,7 @@ def main():
 
             # Show dynamic placeholders if Excel file is uploaded
             if st.session_state.df is not None:
-                mapping = st.session_state.email_automation.detect_column_mapping(st.session_state.df)
+                mapping = get_column_mapping(st.session_state.df)
                 available_placeholders = mapping['available_placeholders']
                 full_name_columns = mapping.get('full_name_columns', [])
 
@@ -891,7 +796,7 @@ def main():
             st.write("**📧 En-tête de l'email:**")
             header_content = st.text_area(
                 "En-tête (salutation):",
-                value=st.session_state.get('email_header', "Bonjour {contact_name}, j'espère que vous allez bien."),
+                value=st.session_state.get('email_header', DEFAULT_EMAIL_HEADER),
                 height=100,
                 help="Utilisez {contact_name} pour le prénom du contact, ou tout autre placeholder disponible.",
                 key="header_input"
@@ -901,7 +806,7 @@ def main():
             st.write("**✍️ Signature de l'email:**")
             footer_content = st.text_area(
                 "Signature (formule de politesse):",
-                value=st.session_state.get('email_footer', "Bien cordialement,\nSalomé Cremona"),
+                value=st.session_state.get('email_footer', DEFAULT_EMAIL_FOOTER),
                 height=100,
                 help="Votre signature personnalisée. Vous pouvez utiliser des placeholders comme {contact_name}.",
                 key="footer_input"
@@ -936,7 +841,7 @@ def main():
 
             # Add dynamic placeholders if Excel file is uploaded
             if st.session_state.df is not None:
-                mapping = st.session_state.email_automation.detect_column_mapping(st.session_state.df)
+                mapping = get_column_mapping(st.session_state.df)
                 available_placeholders = mapping['available_placeholders']
                 full_name_columns = mapping.get('full_name_columns', [])
 
@@ -1040,7 +945,9 @@ def main():
                 sample_contact, email_content, use_html=True,
                 logo_file=st.session_state.logo_file,
             decorative_image_file=st.session_state.decorative_image_file,
-            attachment_files=st.session_state.get('attachment_files', [])
+            attachment_files=st.session_state.get('attachment_files', []),
+            header_content=st.session_state.get('email_header', DEFAULT_EMAIL_HEADER),
+            footer_content=st.session_state.get('email_footer', DEFAULT_EMAIL_FOOTER)
             )
         st.components.v1.html(sample_html, height=500, scrolling=True)
 
@@ -1109,10 +1016,11 @@ def main():
 
                         for format_name, use_html in formats_to_generate:
                             # Always use simple personalization - reliable and bulletproof
-                            personalized_email = st.session_state.email_automation.personalize_email(
+                            personalized_email, verification = st.session_state.email_automation.personalize_and_verify(
                                 selected_contact, email_content, use_html,
                                 logo_file, decorative_image_file,
-                                attachment_files=st.session_state.get('attachment_files', [])
+                                header_content=st.session_state.get('email_header', DEFAULT_EMAIL_HEADER),
+                                footer_content=st.session_state.get('email_footer', DEFAULT_EMAIL_FOOTER)
                             )
 
                             st.markdown("**📧 Aperçu Gmail-style personnalisé:**")
@@ -1120,16 +1028,22 @@ def main():
                             # Always show as HTML for Gmail-style
                             st.components.v1.html(personalized_email, height=500, scrolling=True)
 
-                            # Verification
-                            is_valid, issues = st.session_state.email_automation.verify_email_content(personalized_email)
-
-                            if is_valid:
+                            # Verification (reported by the renderer)
+                            if verification['is_valid']:
                                 st.success("✅ Email Gmail-style validé - Prêt à envoyer")
                             else:
                                 st.warning("⚠️ Problèmes détectés - Vérifiez le contenu")
+                                for issue in verification['issues']:
+                                    st.write(f"- {issue}")
 
                         st.markdown('</div>', unsafe_allow_html=True)
 
+                check_domains = st.checkbox(
+                    "Vérifier les domaines destinataires",
+                    value=False,
+                    help="Chaque domaine est résolu une seule fois (MX, sinon adresse) : les emails vers des domaines inexistants ou qui refusent le courrier sont signalés avant l'envoi"
+                )
+
                 # Process all emails
                 if st.button("🔄 Traiter tous les emails", type="primary"):
                     # Always use Gmail-style HTML
@@ -1138,35 +1052,39 @@ def main():
                     progress_bar = st.progress(0)
                     status_text = st.empty()
 
-                    processed_emails = []
-
-                    for i, contact_data in enumerate(valid_contacts):
-                        # Get a display name for status (use first available field or email)
-                        display_name = contact_data.get('contact_name', contact_data.get('Name', contact_data.get('email', 'Contact')))
-                        status_text.text(f"Traitement: {display_name} ({i+1}/{len(valid_contacts)})")
-
-                        # Always use simple personalization - reliable and bulletproof
-                        personalized = st.session_state.email_automation.personalize_email(
-                            contact_data, email_content, use_html_for_processing,
-                            logo_file, decorative_image_file,
-                            attachment_files=st.session_state.get('attachment_files', [])
-                        )
-
-                        is_valid, issues = st.session_state.email_automation.verify_email_content(personalized)
-
-                        processed_emails.append({
-                            **contact_data,
-                            'personalized_email': personalized,
-                            'is_valid': is_valid,
-                            'issues': issues,
-                            'use_html': use_html_for_processing
-                        })
-
-                        progress_bar.progress((i + 1) / len(valid_contacts))
-                        time.sleep(0.1)  # Small delay to show progress
+                    # Render settings are frozen so that messages can be re-rendered identically later
+                    render_settings = {
+                        'email_content': email_content,
+                        'use_html': use_html_for_processing,
+                        'logo_file': logo_file,
+                        'decorative_image_file': decorative_image_file,
+                        'header_content': st.session_state.get('email_header', DEFAULT_EMAIL_HEADER),
+                        'footer_content': st.session_state.get('email_footer', DEFAULT_EMAIL_FOOTER)
+                    }
+
+                    def show_progress(done, total, rows_per_second):
+                        status_text.text(f"Traitement: {done}/{total} ({rows_per_second:,.0f} emails/s)")
+                        progress_bar.progress(done / total if total else 1.0)
+
+                    # Each email is verified while it is rendered; only a compact status is
+                    # kept per contact, the HTML is rendered again when needed
+                    processed_emails, processing_stats = process_contacts(
+                        st.session_state.email_automation, valid_contacts, render_settings,
+                        on_progress=show_progress,
+                        domain_validator=get_domain_validator() if check_domains else None
+                    )
 
-                    st.session_state.processed_emails = processed_emails
-                    status_text.text("✅ Traitement terminé!")
+                    # Statuses and contacts go to disk: the review page loads one page at a time
+                    run_id = uuid.uuid4().hex[:24]
+                    get_processed_store().save_run(run_id, processed_emails, valid_contacts, render_settings,
+                                                   owner=run_owner())
+                    use_processed_run(get_processed_store().run(run_id))
+                    st.session_state.render_settings = render_settings
+                    status_text.text(
+                        f"✅ Traitement terminé: {processing_stats['rows']} emails en "
+                        f"{processing_stats['seconds']:.2f} s ({processing_stats['rows_per_second']:,.0f} emails/s"
+                        f"{', ' + str(processing_stats['workers']) + ' processus' if processing_stats['workers'] > 1 else ''})"
+                    )
 
                     # Show summary
                     valid_count = sum(1 for email in processed_emails if email['is_valid'])
@@ -1174,6 +1092,12 @@ def main():
 
                     if valid_count < len(processed_emails):
                         st.warning(f"⚠️ {len(processed_emails) - valid_count} emails nécessitent une révision")
+                    if processing_stats['undeliverable_domains']:
+                        st.warning(f"🚫 {processing_stats['undeliverable_domains']} domaines ne peuvent pas recevoir d'emails (voir les emails à réviser)")
+
+                    with_empty_fields = sum(1 for email in processed_emails if email['empty_fields'])
+                    if with_empty_fields:
+                        st.info(f"ℹ️ {with_empty_fields} emails ont des champs vides (remplacés par du texte vide)")
 
             else:
                 st.warning("Aucun email valide trouvé dans le fichier.")
@@ -1183,61 +1107,76 @@ def main():
     with tab4:
         st.markdown('<h2 class="step-header">Étape 4: Envoi des emails</h2>', unsafe_allow_html=True)
 
-        if st.session_state.processed_emails:
-            processed_emails = st.session_state.processed_emails
-            valid_emails = [email for email in processed_emails if email['is_valid']]
-            invalid_emails = [email for email in processed_emails if not email['is_valid']]
+        # Campaigns run in the background; their progress refreshes on its own
+        show_send_progress()
+
+        store = get_processed_store()
+        run_id = st.session_state.processed_run
+        if run_id and store.count(run_id):
+            processed_contacts = st.session_state.processed_contacts
+            # Counted on the indexes; entries are loaded one page at a time
+            valid_count = store.count(run_id, is_valid=True)
+            invalid_count = store.count(run_id, is_valid=False)
+            to_send_count = min(valid_count, 5) if test_mode else valid_count
 
             # Apply test mode filter
             if test_mode:
-                # Take first 5 emails but replace recipient addresses with sender's email
-                valid_emails = valid_emails[:5]
-                for email_data in valid_emails:
-                    if 'original_email' not in email_data:  # Only modify if not already modified
-                        email_data['original_email'] = email_data['email']  # Keep original for reference
-                    email_data['email'] = sender_email  # Replace with sender's email
+                # First 5 emails, sent to the sender's address instead of the recipients
                 st.info(f"🧪 Mode test activé - 5 emails de test seront envoyés à {sender_email}")
                 st.warning("⚠️ Les emails de test seront envoyés à VOTRE adresse, pas aux destinataires réels")
-            else:
-                # Restore original email addresses when test mode is disabled
-                # First, restore emails in the current valid_emails list
-                for email_data in valid_emails:
-                    if 'original_email' in email_data:
-                        email_data['email'] = email_data['original_email']  # Restore original email
-                        del email_data['original_email']  # Clean up
-
-                # Also restore emails in the full processed_emails list to ensure complete restoration
-                for email_data in processed_emails:
-                    if 'original_email' in email_data:
-                        email_data['email'] = email_data['original_email']  # Restore original email
-                        del email_data['original_email']  # Clean up
+
+            def make_pacer():
+                return create_pacer(delay_mode, delay_between_emails, min_delay, max_delay, quotas=quotas,
+                                    jitter=quota_jitter, account=sender_email or 'default',
+                                    quota_path=SEND_QUOTA_PATH)
+
+            def estimate_delay(count):
+                """Average delay per email for the time estimate"""
+                if delay_mode == QUOTA_DELAY_MODE:
+                    # From the quota left on this account
+                    pacer = make_pacer()
+                    try:
+                        return pacer.estimate_seconds(count) / max(count, 1)
+                    finally:
+                        pacer.close()
+                if delay_mode == "Délai fixe":
+                    return delay_between_emails
+                return (min_delay + max_delay) / 2  # Average
+
+            def contact_summary(email_data):
+                """Display name and location of an entry's contact, with fallbacks"""
+                contact = processed_contacts[email_data['position']]
+                display_name = contact.get('contact_name', contact.get('Name', contact.get('Full Name', 'Contact')))
+                location = contact.get('site', contact.get('Site', contact.get('Location', 'N/A')))
+                return display_name, location
 
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Emails prêts", len(valid_contacts))
+                st.metric("Emails prêts", to_send_count)
             with col2:
-                st.metric("Emails avec problèmes", len(invalid_emails))
+                st.metric("Emails avec problèmes", invalid_count)
             with col3:
-                if valid_emails:
+                if valid_count:
                     # Calculate time estimation based on delay mode
-                    if delay_mode == "Délai fixe":
-                        estimated_delay = delay_between_emails
-                    else:  # Délai aléatoire
-                        estimated_delay = (min_delay + max_delay) / 2  # Average
-
-                    sending_time = calculate_sending_time(len(valid_contacts), estimated_delay)
+                    estimated_delay = estimate_delay(to_send_count)
+                    sending_time = calculate_sending_time(to_send_count, estimated_delay)
                     st.metric("Temps d'envoi", sending_time)
 
             # Anti-spam recommendations
-            delay_display = f"{delay_between_emails} secondes" if delay_mode == "Délai fixe" else f"{min_delay}-{max_delay} secondes (aléatoire)"
-            estimated_delay = delay_between_emails if delay_mode == "Délai fixe" else (min_delay + max_delay) / 2
+            if delay_mode == QUOTA_DELAY_MODE:
+                delay_display = f"quotas {delay_between_emails or 'illimités'} (+0-{quota_jitter} s)"
+            elif delay_mode == "Délai fixe":
+                delay_display = f"{delay_between_emails} secondes"
+            else:
+                delay_display = f"{min_delay}-{max_delay} secondes (aléatoire)"
+            estimated_delay = estimate_delay(to_send_count)
 
             st.markdown(f"""
             **🛡️ Configuration anti-spam active :**
             - ⏱️ Délai entre emails : {delay_display}
             - 🧪 Mode test : {'Activé (5 emails max)' if test_mode else 'Désactivé'}
-            - 📧 Emails à envoyer : {len(valid_contacts)}
-            - ⏰ Temps total estimé : {calculate_sending_time(len(valid_contacts), estimated_delay)}
+            - 📧 Emails à envoyer : {to_send_count}
+            - ⏰ Temps total estimé : {calculate_sending_time(to_send_count, estimated_delay)}
             """)
 
             # Add test mode information
@@ -1245,21 +1184,20 @@ def main():
                 st.info(f"📧 Test: Les 5 emails seront envoyés à {sender_email}")
             st.markdown('</div>', unsafe_allow_html=True)
 
-            if invalid_emails:
+            if invalid_count:
                 st.subheader("⚠️ Emails nécessitant une révision")
-                st.info(f"📝 {len(invalid_emails)} emails à corriger avant envoi")
+                st.info(f"📝 {invalid_count} emails à corriger avant envoi")
 
-                for idx, email_data in enumerate(invalid_emails):
-                    email_key = f"{email_data['email']}_{idx}"
+                offset = page_offset(invalid_count, key=f"invalid_page_{run_id}")
+                for email_data in store.page(run_id, is_valid=False, offset=offset):
+                    email_key = f"{run_id}_{email_data['position']}"
 
-                    # Check if this email has been validated
-                    is_validated = email_key in st.session_state.validated_invalid_emails
+                    # Corrections are kept in the store with the entry
+                    is_validated = email_data['corrected']
 
                     # Display toggle/expander with status
                     status_icon = "✅" if is_validated else "❌"
-                    # Get display name and location with fallbacks
-                    display_name = email_data.get('contact_name', email_data.get('Name', email_data.get('Full Name', 'Contact')))
-                    location = email_data.get('site', email_data.get('Site', email_data.get('Location', 'N/A')))
+                    display_name, location = contact_summary(email_data)
                     with st.expander(f"{status_icon} {display_name} - {location}", expanded=not is_validated):
                         st.write("**Problèmes détectés:**")
                         for issue in email_data.get('issues', []):
@@ -1267,11 +1205,11 @@ def main():
 
                         st.divider()
 
-                        # Get current content (edited or original)
-                        if email_key in st.session_state.edited_invalid_emails:
-                            current_content = st.session_state.edited_invalid_emails[email_key]
-                        else:
-                            current_content = email_data['personalized_email']
+                        # Edited content, or rendered again on demand (only the status is stored)
+                        current_content = render_processed_email(
+                            email_data, st.session_state.email_automation,
+                            processed_contacts, st.session_state.render_settings
+                        )['personalized_email']
 
                         # Show editable text area for Gmail-style HTML
                         st.write("**Format:** Gmail-style HTML")
@@ -1296,17 +1234,8 @@ def main():
                                 is_valid, issues = st.session_state.email_automation.verify_email_content(edited_content)
 
                                 if is_valid:
-                                    # Save edited content
-                                    st.session_state.edited_invalid_emails[email_key] = edited_content
-
-                                    # Mark as validated
-                                    if email_key not in st.session_state.validated_invalid_emails:
-                                        st.session_state.validated_invalid_emails.append(email_key)
-
-                                    # Update the email data
-                                    email_data['personalized_email'] = edited_content
-                                    email_data['is_valid'] = True
-                                    email_data['issues'] = []
+                                    # Save edited content, marked as validated
+                                    store.save_correction(run_id, email_data['position'], edited_content)
 
                                     st.success("✅ Email sauvegardé et validé!")
                                     st.rerun()
@@ -1320,25 +1249,14 @@ def main():
                                 st.success("✅ Cet email a été validé et est prêt à être envoyé")
 
                 # Show summary
-                validated_count = len(st.session_state.validated_invalid_emails)
+                validated_count = store.count(run_id, is_valid=False, corrected=True)
                 if validated_count > 0:
-                    st.info(f"📊 Progression: {validated_count}/{len(invalid_emails)} emails corrigés")
+                    st.info(f"📊 Progression: {validated_count}/{invalid_count} emails corrigés")
 
                 # Button to send validated invalid emails
-                if validated_count == len(invalid_emails) and validated_count > 0:
+                if validated_count == invalid_count and validated_count > 0:
                     st.success("🎉 Tous les emails ont été corrigés!")
 
-                    # Prepare validated emails for sending
-                    validated_emails = []
-                    for idx, email_data in enumerate(invalid_emails):
-                        email_key = f"{email_data['email']}_{idx}"
-                        if email_key in st.session_state.validated_invalid_emails:
-                            # Update with edited content
-                            if email_key in st.session_state.edited_invalid_emails:
-                                email_data['personalized_email'] = st.session_state.edited_invalid_emails[email_key]
-                                email_data['is_valid'] = True
-                            validated_emails.append(email_data)
-
                     st.divider()
                     st.subheader("📤 Envoyer les emails corrigés")
 
@@ -1356,11 +1274,10 @@ def main():
                         )
 
                         # Show preview of emails to send
-                        with st.expander(f"Aperçu des {len(validated_emails)} emails corrigés à envoyer"):
-                            for email_data in validated_emails:
-                                # Get display name and location with fallbacks
-                                display_name = email_data.get('contact_name', email_data.get('Name', email_data.get('Full Name', 'Contact')))
-                                location = email_data.get('site', email_data.get('Site', email_data.get('Location', 'N/A')))
+                        with st.expander(f"Aperçu des {validated_count} emails corrigés à envoyer"):
+                            offset = page_offset(validated_count, key=f"corrected_page_{run_id}")
+                            for email_data in store.page(run_id, is_valid=False, corrected=True, offset=offset):
+                                display_name, location = contact_summary(email_data)
                                 st.write(f"**{display_name}** ({email_data['email']}) - {location} - [Gmail-style]")
 
                             # Show CC information
@@ -1370,150 +1287,20 @@ def main():
 
                         # Send button
                         if st.button("📤 Envoyer les emails corrigés", type="primary", key="send_invalid"):
-                            progress_bar_invalid = st.progress(0)
-                            status_text_invalid = st.empty()
-
-                            sent_count = 0
-                            failed_count = 0
-
-                            try:
-                                # Setup SMTP
-                                server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-                                server.starttls()
-                                server.login(sender_email, sender_password)
-
-                                for i, email_data in enumerate(validated_emails):
-                                    try:
-                                        # Get display name with fallbacks
-                                        display_name = email_data.get('contact_name', email_data.get('Name', email_data.get('Full Name', 'Contact')))
-                                        status_text_invalid.text(f"Envoi: {display_name} ({i+1}/{len(validated_emails)})")
-
-                                        # Create email with proper MIME structure
-                                        msg_root = MIMEMultipart('mixed')
-                                        msg_root['From'] = sender_email
-                                        msg_root['To'] = email_data['email']
-                                        msg_root['Subject'] = email_subject_invalid
-
-                                        # Add CC if specified
-                                        if cc_emails and cc_emails.strip():
-                                            msg_root['Cc'] = cc_emails.strip()
-
-                                        # Create alternative container for plain text and HTML
-                                        alt = MIMEMultipart('alternative')
-                                        msg_root.attach(alt)
-
-                                        # Generate plain text version from HTML
-                                        plain_text = html2text.html2text(email_data['personalized_email'])
-                                        alt.attach(MIMEText(plain_text, 'plain', 'utf-8'))
-
-                                        # Create related container for HTML and inline images
-                                        rel = MIMEMultipart('related')
-                                        rel.attach(MIMEText(email_data['personalized_email'], 'html', 'utf-8'))
-                                        alt.attach(rel)
-
-                                        # Add compressed images as inline attachments
-                                        logo_file = st.session_state.get('logo_file', None)
-                                        if logo_file:
-                                            try:
-                                                # Compress logo before attaching
-                                                compressed_logo = st.session_state.email_automation.compress_image(logo_file)
-                                                logo_attachment = MIMEImage(compressed_logo.getvalue())
-                                                logo_attachment.add_header('Content-ID', '<logo>')
-                                                logo_attachment.add_header('Content-Disposition', 'inline', filename='logo.jpg')
-                                                rel.attach(logo_attachment)
-                                            except Exception as e:
-                                                st.warning(f"⚠️ Impossible d'ajouter le logo: {e}")
-
-                                        # Add decorative image as inline attachment
-                                        decorative_image_file = st.session_state.get('decorative_image_file', None)
-                                        if decorative_image_file:
-                                            try:
-                                                # Compress decorative image before attaching
-                                                compressed_decorative = st.session_state.email_automation.compress_image(decorative_image_file)
-                                                image_attachment = MIMEImage(compressed_decorative.getvalue())
-                                                image_attachment.add_header('Content-ID', '<decorative_image>')
-                                                image_attachment.add_header('Content-Disposition', 'inline', filename='decorative_image.jpg')
-                                                rel.attach(image_attachment)
-                                            except Exception as e:
-                                                st.warning(f"⚠️ Impossible d'ajouter l'image décorative: {e}")
-
-                                        # Add regular attachments to root level
-                                        attachment_files = st.session_state.get('attachment_files', [])
-                                        if attachment_files:
-                                            for attachment_file in attachment_files:
-                                                try:
-                                                    if attachment_file.type.startswith('image/'):
-                                                        attachment = MIMEImage(attachment_file.getvalue())
-                                                    else:
-                                                        from email.mime.application import MIMEApplication
-                                                        attachment = MIMEApplication(attachment_file.getvalue())
-
-                                                    attachment.add_header(
-                                                        'Content-Disposition',
-                                                        'attachment',
-                                                        filename=attachment_file.name
-                                                    )
-                                                    msg_root.attach(attachment)
-                                                except Exception as e:
-                                                    st.warning(f"⚠️ Impossible de joindre {attachment_file.name}: {e}")
-
-                                        # Send email
-                                        text = msg_root.as_string()
-
-                                        # Prepare recipient list (TO + CC)
-                                        recipients = [email_data['email']]
-                                        if cc_emails and cc_emails.strip():
-                                            cc_list = [email.strip() for email in cc_emails.split(',') if email.strip()]
-                                            recipients.extend(cc_list)
-
-                                        server.sendmail(sender_email, recipients, text)
-                                        sent_count += 1
-
-                                    except Exception as e:
-                                        # Get display name with fallbacks
-                                        display_name = email_data.get('contact_name', email_data.get('Name', email_data.get('Full Name', 'Contact')))
-                                        st.error(f"Erreur envoi {display_name}: {e}")
-                                        failed_count += 1
-
-                                    progress_bar_invalid.progress((i + 1) / len(validated_emails))
-
-                                    # Anti-spam delay
-                                    if i < len(validated_emails) - 1:
-                                        if delay_mode == "Délai fixe":
-                                            time.sleep(delay_between_emails)
-                                        else:  # Délai aléatoire
-                                            time.sleep(random.randint(min_delay, max_delay))
-
-                                server.quit()
-
-                                # Final status
-                                if sent_count > 0:
-                                    st.markdown('<div class="success-box">', unsafe_allow_html=True)
-                                    st.success(f"✅ **{sent_count} emails corrigés envoyés avec succès!** 🎉")
-                                    st.markdown('</div>', unsafe_allow_html=True)
-
-                                    # Big green tick
-                                    st.markdown("""
-                                    <div style="text-align: center; margin: 20px 0;">
-                                        <div style="font-size: 4rem; color: #4CAF50;">✅</div>
-                                        <h3 style="color: #2E7D32; margin: 10px 0;">Envoi des emails corrigés terminé!</h3>
-                                    </div>
-                                    """, unsafe_allow_html=True)
-
-                                    # Clear validated emails
-                                    st.session_state.validated_invalid_emails = []
-                                    st.session_state.edited_invalid_emails = {}
-
-                                if failed_count > 0:
-                                    st.error(f"❌ {failed_count} emails ont échoué")
-
-                                status_text_invalid.text("✅ Envoi terminé!")
-
-                            except Exception as e:
-                                st.error(f"Erreur de connexion Gmail: {e}")
-                                st.info("💡 Vérifiez que vous utilisez un mot de passe d'application Gmail")
-
-            if valid_emails:
+                            # Loaded only now, with their edited content
+                            validated_emails = [{**email_data, 'is_valid': True} for email_data in
+                                                store.page(run_id, is_valid=False, corrected=True, limit=None)]
+                            # Sent in the background, paced by the anti-spam delay
+                            start_campaign(
+                                validated_emails, sender_email, sender_password, email_subject_invalid, cc_emails,
+                                smtp_connections, make_pacer(), interleave_domains, domain_spacing,
+                                label=f"{len(validated_emails)} emails corrigés"
+                            )
+                            # Submitted: no longer awaiting review, the edited content is kept
+                            store.mark_valid(run_id, [email_data['position'] for email_data in validated_emails])
+                            st.rerun()
+
+            if valid_count:
                 st.subheader("✅ Emails prêts à envoyer")
 
                 # Gmail configuration check
@@ -1529,14 +1316,20 @@ def main():
                     )
 
                     # Show preview of emails to send
-                    with st.expander(f"Aperçu des {len(valid_contacts)} emails à envoyer"):
-                        for email_data in valid_emails[:5]:  # Show first 5
-                            # Get display name and location with fallbacks
-                            display_name = email_data.get('contact_name', email_data.get('Name', email_data.get('Full Name', 'Contact')))
-                            location = email_data.get('site', email_data.get('Site', email_data.get('Location', 'N/A')))
-                            st.write(f"**{display_name}** ({email_data['email']}) - {location} - [Gmail-style]")
-                        if len(valid_contacts) > 5:
-                            st.write(f"... et {len(valid_contacts) - 5} autres")
+                    with st.expander(f"Aperçu des {to_send_count} emails à envoyer"):
+                        searched_email = st.text_input("Rechercher une adresse", key=f"search_{run_id}")
+                        if searched_email:
+                            preview_emails = store.find(run_id, normalize_email(searched_email))
+                            if not preview_emails:
+                                st.write("Aucun contact avec cette adresse.")
+                        else:
+                            offset = page_offset(to_send_count, key=f"valid_page_{run_id}")
+                            preview_emails = store.page(run_id, is_valid=True, offset=offset,
+                                                        limit=min(PAGE_SIZE, to_send_count - offset))
+                        for email_data in preview_emails:
+                            display_name, location = contact_summary(email_data)
+                            status = "" if email_data['is_valid'] else " - ⚠️ à réviser"
+                            st.write(f"**{display_name}** ({email_data['email']}) - {location} - [Gmail-style]{status}")
 
                         # Show CC information
                         if cc_emails and cc_emails.strip():
@@ -1545,149 +1338,20 @@ def main():
 
                     # Send emails - FIXED VERSION
                     if st.button("📤 Envoyer tous les emails", type="primary"):
-                        progress_bar = st.progress(0)
-                        status_text = st.empty()
-
-                        sent_count = 0
-                        failed_count = 0
-
-                        try:
-                            # Setup SMTP with hardcoded Gmail settings
-                            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT)
-                            server.starttls()
-                            server.login(sender_email, sender_password)
-
-                            for i, email_data in enumerate(valid_emails):
-                                try:
-                                    # Get display name with fallbacks
-                                    display_name = email_data.get('contact_name', email_data.get('Name', email_data.get('Full Name', 'Contact')))
-                                    status_text.text(f"Envoi: {display_name} ({i+1}/{len(valid_emails)})")
-
-                                    # Create email with proper MIME structure
-                                    msg_root = MIMEMultipart('mixed')
-                                    msg_root['From'] = sender_email
-                                    msg_root['To'] = email_data['email']
-                                    msg_root['Subject'] = email_subject
-
-                                    # Add CC if specified
-                                    if cc_emails and cc_emails.strip():
-                                        msg_root['Cc'] = cc_emails.strip()
-
-                                    # Create alternative container for plain text and HTML
-                                    alt = MIMEMultipart('alternative')
-                                    msg_root.attach(alt)
-
-                                    # Generate plain text version from HTML
-                                    plain_text = html2text.html2text(email_data['personalized_email'])
-                                    alt.attach(MIMEText(plain_text, 'plain', 'utf-8'))
-
-                                    # Create related container for HTML and inline images
-                                    rel = MIMEMultipart('related')
-                                    rel.attach(MIMEText(email_data['personalized_email'], 'html', 'utf-8'))
-                                    alt.attach(rel)
-
-                                    # Add compressed images as inline attachments
-                                    logo_file = st.session_state.get('logo_file', None)
-                                    if logo_file:
-                                        try:
-                                            # Compress logo before attaching
-                                            compressed_logo = st.session_state.email_automation.compress_image(logo_file)
-                                            logo_attachment = MIMEImage(compressed_logo.getvalue())
-                                            logo_attachment.add_header('Content-ID', '<logo>')
-                                            logo_attachment.add_header('Content-Disposition', 'inline', filename='logo.jpg')
-                                            rel.attach(logo_attachment)
-                                        except Exception as e:
-                                            st.warning(f"⚠️ Impossible d'ajouter le logo: {e}")
-
-                                    # Add decorative image as inline attachment
-                                    decorative_image_file = st.session_state.get('decorative_image_file', None)
-                                    if decorative_image_file:
-                                        try:
-                                            # Compress decorative image before attaching
-                                            compressed_decorative = st.session_state.email_automation.compress_image(decorative_image_file)
-                                            image_attachment = MIMEImage(compressed_decorative.getvalue())
-                                            image_attachment.add_header('Content-ID', '<decorative_image>')
-                                            image_attachment.add_header('Content-Disposition', 'inline', filename='decorative_image.jpg')
-                                            rel.attach(image_attachment)
-                                        except Exception as e:
-                                            st.warning(f"⚠️ Impossible d'ajouter l'image décorative: {e}")
-
-                                    # Add regular attachments to root level
-                                    attachment_files = st.session_state.get('attachment_files', [])
-                                    if attachment_files:
-                                        for attachment_file in attachment_files:
-                                            try:
-                                                # Déterminer le type MIME
-                                                if attachment_file.type.startswith('image/'):
-                                                    attachment = MIMEImage(attachment_file.getvalue())
-                                                else:
-                                                    from email.mime.application import MIMEApplication
-                                                    attachment = MIMEApplication(attachment_file.getvalue())
-
-                                                attachment.add_header(
-                                                    'Content-Disposition',
-                                                    'attachment',
-                                                    filename=attachment_file.name
-                                                )
-                                                msg_root.attach(attachment)
-                                            except Exception as e:
-                                                st.warning(f"⚠️ Impossible de joindre {attachment_file.name}: {e}")
-
-                                    # Send email
-                                    text = msg_root.as_string()
-
-                                    # Prepare recipient list (TO + CC)
-                                    recipients = [email_data['email']]
-                                    if cc_emails and cc_emails.strip():
-                                        cc_list = [email.strip() for email in cc_emails.split(',') if email.strip()]
-                                        recipients.extend(cc_list)
-
-                                    server.sendmail(sender_email, recipients, text)
-                                    sent_count += 1
-
-                                except Exception as e:
-                                    # Get display name with fallbacks
-                                    display_name = email_data.get('contact_name', email_data.get('Name', email_data.get('Full Name', 'Contact')))
-                                    st.error(f"Erreur envoi {display_name}: {e}")
-                                    failed_count += 1
-
-                                progress_bar.progress((i + 1) / len(valid_emails))
-
-                                # Anti-spam delay
-                                if i < len(valid_emails) - 1:  # Don't delay after last email
-                                    if delay_mode == "Délai fixe":
-                                        time.sleep(delay_between_emails)
-                                    else:  # Délai aléatoire
-                                        time.sleep(random.randint(min_delay, max_delay))
-
-                            server.quit()
-
-                            # Final status with prominent green tick
-                            if sent_count > 0:
-                                st.markdown('<div class="success-box">', unsafe_allow_html=True)
-                                st.success(f"✅ **{sent_count} emails envoyés avec succès!** 🎉")
-                                st.markdown('</div>', unsafe_allow_html=True)
-
-                                # Big green tick for visual confirmation
-                                st.markdown("""
-                                <div style="text-align: center; margin: 20px 0;">
-                                    <div style="font-size: 4rem; color: #4CAF50;">✅</div>
-                                    <h3 style="color: #2E7D32; margin: 10px 0;">Envoi Terminé avec Succès!</h3>
-                                </div>
-                                """, unsafe_allow_html=True)
-
-                                if test_mode:
-                                    st.success(f"✅ Mode test utilisé - {sent_count} emails envoyés à {sender_email} (pas aux clients)")
-                                    st.info("💡 Désactivez le mode test pour envoyer aux vrais destinataires")
-
-                            if failed_count > 0:
-                                st.error(f"❌ {failed_count} emails ont échoué")
-
-                            status_text.text("✅ Envoi terminé!")
-
-                        except Exception as e:
-                            st.error(f"Erreur de connexion Gmail: {e}")
-                            st.info("💡 Vérifiez que vous utilisez un mot de passe d'application Gmail")
+                        valid_emails = store.page(run_id, is_valid=True, limit=5 if test_mode else None)
+                        if test_mode:
+                            # Sent to the sender's address; the original recipient is kept for reference
+                            valid_emails = [{**email_data, 'original_email': email_data['email'], 'email': sender_email}
+                                            for email_data in valid_emails]
+                        # Sent in the background, paced by the anti-spam delay
+                        label = (f"Mode test - {len(valid_emails)} emails à {sender_email}" if test_mode
+                                 else f"{len(valid_emails)} emails")
+                        start_campaign(
+                            valid_emails, sender_email, sender_password, email_subject, cc_emails,
+                            smtp_connections, make_pacer(), interleave_domains, domain_spacing, label=label,
+                            test_mode=test_mode
+                        )
+                        st.rerun()
 
             else:
                 st.info("Aucun email valide prêt à envoyer.")
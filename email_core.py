@@ -0,0 +1,964 @@
+"""
+Core of MERCI RAYMOND Email Automation, without any Streamlit dependency.
+
+Importing this module has no side effects (no page configuration, no CSS,
+no session state) and stays fast: pandas, Pillow and html2text are only
+imported by the functions that need them. The Streamlit app, the command
+line runner, workers and tests all share this code.
+"""
+
+import base64
+import hashlib
+import operator
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from email.mime.application import MIMEApplication
+from email.mime.image import MIMEImage
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from contact_table import ContactTable
+from domain_scheduler import recipient_domain
+from domain_validator import DomainValidator, domain_issue
+from email_index import SuppressionList, normalize_email_column
+from mime_skeleton import MessageSkeleton
+from rate_limiter import QuotaLimiter
+from smtp_policy import Pacer
+from template_renderer import RESERVED_KEYS, CompiledTemplate
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from campaign_metrics import CampaignMetrics
+
+# Gmail SMTP Configuration (hardcoded)
+SMTP_SERVER = "smtp.gmail.com"
+SMTP_PORT = 587
+
+# Greeting and signature used when none is configured
+DEFAULT_EMAIL_HEADER = "Bonjour {contact_name}, j'espère que vous allez bien."
+DEFAULT_EMAIL_FOOTER = "Bien cordialement,\nSalomé Cremona"
+
+# {contact_name} falls back to a polite greeting when the contact has no name
+NAME_FALLBACK = {'contact_name': "Madame/Monsieur"}
+
+# Permissive email address check used on the whole email column
+EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+
+# Process-wide cache of compressed images: (sha256, max_width, quality) -> JPEG bytes
+COMPRESSED_IMAGE_CACHE_SIZE = 32
+COMPRESSED_IMAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_compressed_image_cache = OrderedDict()
+_compressed_image_lock = threading.Lock()
+
+# Delay mode drawing sends from the per-minute/hour/day quotas
+QUOTA_DELAY_MODE = "Quotas d'envoi"
+
+# Batch processing: the clock is read once per batch and progress reported
+# at most every PROGRESS_INTERVAL seconds
+PROCESS_BATCH_SIZE = 200
+PROGRESS_INTERVAL = 0.25
+
+# Lists from PARALLEL_MIN_ROWS contacts are rendered by a process pool, in
+# about PARALLEL_CHUNKS_PER_WORKER chunks per worker process
+PARALLEL_MIN_ROWS = 20000
+PARALLEL_CHUNKS_PER_WORKER = 8
+
+class CompressedImageFile:
+    """File-like object with compressed data, mimicking an uploaded file"""
+    def __init__(self, data, name):
+        self._data = data
+        self.name = name
+        self.type = 'image/jpeg'
+
+    def getvalue(self):
+        return self._data
+
+class EmailAutomation:
+    # Number of compiled campaign templates kept per instance
+    TEMPLATE_CACHE_SIZE = 8
+
+    def __init__(self):
+        self._template_cache = OrderedDict()
+
+        # Base email template for TEXT format (includes greetings and signature)
+        self.base_email_content_text = """Bonjour {contact_name},
+
+Lorsque l'été touche à sa fin et l'hiver arrive à pas feutrés…
+
+Les Raymonds vous emmènent dans leur traîneau et vous proposent une large palette de sapins, décorations et animations afin de préparer l'arrivée des fêtes de fin d'année !
+
+Créez une ambiance unique avec des sapins, robustes et élégants, disponibles de 80 à 200 cm, et décorés selon vos préférences. Découvrez également nos guirlandes sur mesure, faites de branchages et personnalisables.
+
+Vous connaissez les Raymonds, ces décorations 100% végétales seront aussi festives que durables ! Matériaux sourcés & Réemploi en intégralité.
+Remplissez la lettre au père noël jointe à ce mail avec vos désirs de couleurs et vos choix de dimensions, et faisons germer ensemble l'esprit de Noël dans votre {site} !
+
+🎁 Pour l'occasion, nous avons le plaisir d'offrir à nos clients du pôle entretien une réduction spéciale de 10 % sur notre catalogue de Noël.
+
+Je reste à votre entière disposition pour tout complément d'information ou pour une offre sur mesure.
+
+En vous souhaitant une bonne journée,
+
+L'équipe MERCI RAYMOND"""
+
+        # Base email template for Gmail-style HTML format
+        self.base_email_content_html = """Lorsque l'été touche à sa fin et l'hiver arrive à pas feutrés…
+
+Les Raymonds vous emmènent dans leur traîneau et vous proposent une large palette de sapins, décorations et animations afin de préparer l'arrivée des fêtes de fin d'année !
+
+Créez une ambiance unique avec des sapins, robustes et élégants, disponibles de 80 à 200 cm, et décorés selon vos préférences. Découvrez également nos guirlandes sur mesure, faites de branchages et personnalisables.
+
+Vous connaissez les Raymonds, ces décorations 100% végétales seront aussi festives que durables ! Matériaux sourcés & Réemploi en intégralité.
+Remplissez la lettre au père noël jointe à ce mail avec vos désirs de couleurs et vos choix de dimensions, et faisons germer ensemble l'esprit de Noël dans votre {site} !
+
+🎁 **Pour l'occasion**, nous avons le plaisir d'offrir à nos clients du pôle entretien une **réduction spéciale de 10%** sur notre catalogue de Noël.
+
+Je reste à votre entière disposition pour tout complément d'information ou pour une offre sur mesure."""
+
+        # Gmail-style HTML template that looks like plain text
+        self.html_template = """<div style="font-family: Arial, Helvetica, sans-serif; font-size: 14px; line-height: 1.4; color: #202124; background: #ffffff; margin: 0; padding: 0;">
+  {header_section}
+
+  <p style="margin: 0 0 16px 0;">
+    {first_paragraph}
+  </p>
+
+  {decorative_image_section}
+
+  <p style="margin: 0 0 16px 0;">
+    {second_paragraph}
+  </p>
+
+  {footer_section}
+
+  {logo_section}
+</div>"""
+        # Get OpenAI API key from secrets
+ #       try:
+#            self.openai_api_key = st.secrets["api_key"]
+  ##             self.openai_api_key = None
+    ##   except:
+      #      self.openai_api_key = None
+       #     st.warning("⚠️ Fichier secrets.toml manquant. Personnalisation simple uniquement.")
+
+    def detect_column_mapping(self, df: 'pd.DataFrame') -> Dict[str, any]:
+        """
+        Dynamically detect all columns and identify email column.
+        Returns email column name and all available placeholders.
+        """
+        columns = df.columns.tolist()
+
+        # Email detection patterns
+        email_patterns = [
+            r'email', r'e-mail', r'mail', r'contact.*client.*1', r'email.*1',
+            r'adresse.*mail', r'contact.*mail', r'email.*address', r'electronic.*mail'
+        ]
+
+        # Full name detection patterns
+        full_name_patterns = [
+            r'name', r'nom', r'full.*name', r'nom.*complet', r'contact.*name',
+            r'client.*name', r'utilisateur', r'user.*name', r'prenom.*nom'
+        ]
+
+        # Find email column
+        email_column = None
+        best_score = 0
+
+        for col in columns:
+            col_lower = col.lower().strip()
+            for pattern in email_patterns:
+                if re.search(pattern, col_lower):
+                    # Score based on pattern match quality
+                    score = len(pattern) / len(col_lower) if col_lower else 0
+                    if score > best_score:
+                        best_score = score
+                        email_column = col
+
+        # Find full name columns
+        full_name_columns = []
+        for col in columns:
+            col_lower = col.lower().strip()
+            for pattern in full_name_patterns:
+                if re.search(pattern, col_lower) and col != email_column:
+                    # Check if column contains full names (has spaces)
+                    sample_values = df[col].dropna().astype(str).head(5)
+                    if any(' ' in str(val) for val in sample_values):
+                        full_name_columns.append(col)
+                        break
+
+        # Create available placeholders (all columns except email)
+        available_placeholders = {}
+        for col in columns:
+            if col != email_column:
+                available_placeholders[col] = col
+
+                # Add first name and last name placeholders for full name columns
+                if col in full_name_columns:
+                    available_placeholders[f"{col}_first"] = f"{col}_first"
+                    available_placeholders[f"{col}_last"] = f"{col}_last"
+
+        return {
+            'email_column': email_column,
+            'available_placeholders': available_placeholders,
+            'full_name_columns': full_name_columns,
+            'all_columns': columns
+        }
+
+    def extract_contact_info(self, row: 'pd.Series', email_column: str, available_placeholders: Dict[str, str], full_name_columns: List[str] = None) -> Dict[str, str]:
+        """Extract all contact information from a row dynamically."""
+        import pandas as pd
+
+        info = {}
+
+        # Extract email
+        if email_column and email_column in row.index:
+            email_value = row[email_column]
+            if pd.notna(email_value):
+                info['email'] = str(email_value).strip()
+
+        # Extract all other columns as placeholders
+        for col_name in available_placeholders.keys():
+            if col_name in row.index:
+                value = row[col_name]
+                if pd.notna(value):
+                    info[col_name] = str(value).strip()
+                else:
+                    info[col_name] = ''
+
+        # Extract first name and last name from full name columns
+        if full_name_columns:
+            for full_name_col in full_name_columns:
+                if full_name_col in row.index and pd.notna(row[full_name_col]):
+                    full_name = str(row[full_name_col]).strip()
+                    name_parts = full_name.split()
+
+                    # Add first name (first part)
+                    if len(name_parts) > 0:
+                        info[f"{full_name_col}_first"] = name_parts[0]
+
+                    # Add last name (all parts after first, joined)
+                    if len(name_parts) > 1:
+                        info[f"{full_name_col}_last"] = ' '.join(name_parts[1:])
+                    else:
+                        info[f"{full_name_col}_last"] = ''
+
+        return info
+
+    @staticmethod
+    def _clean_column(series: 'pd.Series') -> 'pd.Series':
+        """Stringify and strip a whole column, keeping NaN where the cell is empty."""
+        import pandas as pd
+
+        mask = series.notna()
+        present = series[mask]
+        if series.dtype == object:
+            present = present.astype(str)
+        else:
+            present = present.map(str)
+        cleaned = pd.Series(None, index=series.index, dtype=object)
+        if len(present):
+            cleaned[mask] = present.str.strip()
+        return cleaned
+
+    def get_valid_emails_from_df(self, df: 'pd.DataFrame') -> ContactTable:
+        """Extract all valid emails from the dataframe with dynamic column detection."""
+        return self.extract_valid_contacts(df)[0]
+
+    def extract_valid_contacts(self, df: 'pd.DataFrame') -> Tuple[ContactTable, int]:
+        """
+        Valid, deduplicated contacts of the dataframe, with the number of
+        duplicate email addresses that were removed. The contacts are kept
+        column by column; each row reads like a contact dict.
+        """
+        # Detect column mapping
+        mapping = self.detect_column_mapping(df)
+        email_column = mapping['email_column']
+        available_placeholders = mapping['available_placeholders']
+        full_name_columns = mapping['full_name_columns']
+
+        if not email_column:
+            return ContactTable({}), 0
+
+        # Work on a positional index, the original labels are kept for 'index'
+        work = df.reset_index(drop=True)
+        row_labels = df.index
+
+        # Extract email - a placeholder column literally named 'email' overrides it
+        emails = self._clean_column(work[email_column])
+        if 'email' in available_placeholders and 'email' in work.columns:
+            emails = self._clean_column(work['email']).fillna('')
+
+        # Normalized addresses (case, spaces, IDN domain): the same recipient written twice is one contact
+        email_values = emails.fillna('')
+        present = email_values != ''
+        if present.any():
+            email_values[present] = normalize_email_column(email_values[present])
+        emails = email_values
+
+        # Check if we have a valid email
+        valid_mask = (email_values != '') & email_values.str.contains(EMAIL_PATTERN)
+        work = work[valid_mask.to_numpy()]
+        emails = emails[valid_mask]
+        row_labels = row_labels[valid_mask.to_numpy()]
+
+        # Remove duplicates by email address, keeping first occurrence
+        unique_mask = ~emails.duplicated(keep='first')
+        duplicates_removed = int((~unique_mask).sum())
+        work = work[unique_mask.to_numpy()]
+        emails = emails[unique_mask]
+        row_labels = row_labels[unique_mask.to_numpy()]
+
+        # Build every contact field as a whole column, in per-contact key order
+        fields = {'index': row_labels.tolist(), 'email': emails.tolist()}
+        for col_name in available_placeholders.keys():
+            if col_name in work.columns and col_name != 'email':
+                fields[col_name] = self._clean_column(work[col_name]).fillna('').tolist()
+
+        # Extract first name and last name from full name columns
+        sparse_fields = []
+        for full_name_col in full_name_columns or []:
+            if full_name_col not in work.columns:
+                continue
+            name_parts = self._clean_column(work[full_name_col]).str.split()
+            fields[f"{full_name_col}_first"] = name_parts.str[0].tolist()
+            fields[f"{full_name_col}_last"] = name_parts.str[1:].str.join(' ').tolist()
+            sparse_fields.extend([f"{full_name_col}_first", f"{full_name_col}_last"])
+
+        # Add a default contact name if none exists
+        if not any(key.lower() in ['name', 'nom', 'contact', 'contact_name'] for key in fields.keys()):
+            fields['contact_name'] = ['Contact'] * len(emails)
+
+        # Empty full names leave no first/last name key, like the row-by-row extraction
+        for key in sparse_fields:
+            fields[key] = [value if isinstance(value, str) else None for value in fields[key]]
+
+        return ContactTable(fields), duplicates_removed
+
+    def encode_image_to_base64(self, image_file) -> Optional[str]:
+        """Convert uploaded image to base64 for embedding in HTML"""
+        try:
+            return base64.b64encode(image_file.getvalue()).decode()
+        except:
+            return None
+
+    def compress_image(self, image_file, max_width=1600, quality=82):
+        """
+        Compress image to reduce file size for email sending.
+        Results are cached per process by content hash, so the same asset is
+        compressed once per campaign instead of once per recipient.
+        """
+        try:
+            # Get original image data
+            original_data = image_file.getvalue()
+            cache_key = (hashlib.sha256(original_data).hexdigest(), max_width, quality)
+
+            with _compressed_image_lock:
+                compressed_data = _compressed_image_cache.get(cache_key)
+                if compressed_data is not None:
+                    _compressed_image_cache.move_to_end(cache_key)
+                    return CompressedImageFile(compressed_data, image_file.name)
+
+            compressed_data = self._compress_image_data(original_data, max_width, quality)
+
+            with _compressed_image_lock:
+                _compressed_image_cache[cache_key] = compressed_data
+                # Evict least recently used images beyond the entry or byte budget
+                while len(_compressed_image_cache) > 1 and (
+                        len(_compressed_image_cache) > COMPRESSED_IMAGE_CACHE_SIZE
+                        or sum(map(len, _compressed_image_cache.values())) > COMPRESSED_IMAGE_CACHE_MAX_BYTES):
+                    _compressed_image_cache.popitem(last=False)
+
+            return CompressedImageFile(compressed_data, image_file.name)
+
+        except Exception as e:
+            # If compression fails, return original file
+            print(f"Image compression failed: {e}")
+            return image_file
+
+    @staticmethod
+    def _compress_image_data(original_data: bytes, max_width: int, quality: int) -> bytes:
+        """Resize and re-encode image bytes as an optimized JPEG"""
+        from PIL import Image
+        import io
+
+        original_image = Image.open(io.BytesIO(original_data))
+
+        # Calculate new dimensions maintaining aspect ratio
+        if original_image.width > max_width:
+            ratio = max_width / original_image.width
+            new_height = int(original_image.height * ratio)
+            original_image = original_image.resize((max_width, new_height), Image.Resampling.LANCZOS)
+
+        # Convert to RGB if necessary (for JPEG)
+        if original_image.mode in ('RGBA', 'LA', 'P'):
+            # Create white background for transparency
+            background = Image.new('RGB', original_image.size, (255, 255, 255))
+            if original_image.mode == 'P':
+                original_image = original_image.convert('RGBA')
+            background.paste(original_image, mask=original_image.split()[-1] if original_image.mode == 'RGBA' else None)
+            original_image = background
+        elif original_image.mode != 'RGB':
+            original_image = original_image.convert('RGB')
+
+        # Save compressed image to BytesIO
+        compressed_buffer = io.BytesIO()
+        original_image.save(compressed_buffer, format='JPEG', quality=quality, optimize=True)
+        return compressed_buffer.getvalue()
+
+    def convert_markdown_to_html(self, text: str) -> str:
+        """Convert markdown-style formatting to HTML for email"""
+        # Convert **bold text** to <strong>bold text</strong>
+        text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', text)
+
+        # Convert *italic text* to <em>italic text</em>
+        text = re.sub(r'\*(.*?)\*', r'<em>\1</em>', text)
+
+        return text
+
+    def compile_template(self, email_content: str, use_html: bool = False, logo_file=None,
+                         decorative_image_file=None, header_content: str = None,
+                         footer_content: str = None) -> CompiledTemplate:
+        """
+        Build the full email layout once with placeholders left in place,
+        then parse it into a CompiledTemplate reused for every contact.
+        """
+        cache_key = (email_content, use_html, bool(logo_file), bool(decorative_image_file),
+                     header_content, footer_content)
+        compiled = self._template_cache.get(cache_key)
+        if compiled is not None:
+            self._template_cache.move_to_end(cache_key)
+            return compiled
+
+        if not use_html:
+            compiled = CompiledTemplate(email_content)
+        else:
+            # Prepare logo section - small signature-style image
+            logo_section = ""
+            if logo_file:
+                logo_section = f'<img src="cid:logo" alt="Merci Raymond" style="display:inline-block; height:24px; width:auto; border:0; outline:0; vertical-align:baseline;">'
+
+            # Check if {Image} placeholder exists in content
+            has_image_placeholder = '{Image}' in email_content
+
+            # Prepare decorative image section - only if no {Image} placeholder
+            decorative_image_section = ""
+            if decorative_image_file and not has_image_placeholder:
+                decorative_image_section = f'''
+                <div style="margin: 16px 0;">
+                <img src="cid:decorative_image" alt="Image" style="max-width: 100%; height: auto; border:0; outline:0; display: block;">
+                </div>'''
+
+            # Split content into first and second paragraphs for Gmail-style layout
+            paragraphs = email_content.split('\n\n')
+
+            # First paragraph: everything up to the decorative image
+            first_paragraph = ""
+            second_paragraph = ""
+
+            if len(paragraphs) >= 3:
+                # Split after the first two paragraphs for better balance
+                first_paragraph = paragraphs[0] + "\n\n" + paragraphs[1]
+                second_paragraph = "\n\n".join(paragraphs[2:])
+            elif len(paragraphs) >= 2:
+                # Split after the first paragraph
+                first_paragraph = paragraphs[0]
+                second_paragraph = "\n\n".join(paragraphs[1:])
+            else:
+                # If we can't split naturally, put most content in first paragraph
+                first_paragraph = email_content
+                second_paragraph = ""
+
+            # Clean up the paragraphs and ensure proper line breaks
+            first_paragraph = first_paragraph.strip()
+            second_paragraph = second_paragraph.strip()
+
+            # Convert line breaks to <br> tags for HTML
+            first_paragraph = first_paragraph.replace('\n', '<br>')
+            second_paragraph = second_paragraph.replace('\n', '<br>')
+
+            # Convert markdown-style bold text to HTML
+            first_paragraph = self.convert_markdown_to_html(first_paragraph)
+            second_paragraph = self.convert_markdown_to_html(second_paragraph)
+
+            # Replace {Image} placeholder with actual image HTML if it exists
+            if has_image_placeholder and decorative_image_file:
+                image_html = f'''
+                <div style="margin: 16px 0;">
+                <img src="cid:decorative_image" alt="Image" style="max-width: 100%; height: auto; border:0; outline:0; display: block;">
+                </div>'''
+                first_paragraph = first_paragraph.replace('{Image}', image_html)
+                second_paragraph = second_paragraph.replace('{Image}', image_html)
+
+            # Convert line breaks and markdown-style formatting in header and footer
+            header_processed = self.convert_markdown_to_html(header_content.replace('\n', '<br>'))
+            footer_processed = self.convert_markdown_to_html(footer_content.replace('\n', '<br>'))
+
+            # Wrap header and footer in proper HTML paragraphs
+            header_section = f'<p style="margin: 0 0 16px 0;">{header_processed}</p>'
+            footer_section = f'<p style="margin: 0 0 16px 0;">{footer_processed}</p>'
+
+            # Apply Gmail-style HTML template (placeholders stay as slots)
+            layout = self.html_template.format(
+                header_section=header_section,
+                first_paragraph=first_paragraph,
+                second_paragraph=second_paragraph,
+                footer_section=footer_section,
+                logo_section=logo_section,
+                decorative_image_section=decorative_image_section
+            )
+            # Line breaks inside contact values become <br> like the surrounding text
+            compiled = CompiledTemplate(layout, value_filter=lambda value: value.replace('\n', '<br>'))
+
+        self._template_cache[cache_key] = compiled
+        if len(self._template_cache) > self.TEMPLATE_CACHE_SIZE:
+            self._template_cache.popitem(last=False)
+        return compiled
+
+    def compile_plain_template(self, email_content: str, use_html: bool = False, logo_file=None,
+                               decorative_image_file=None, header_content: str = None,
+                               footer_content: str = None) -> Optional[CompiledTemplate]:
+        """
+        text/plain alternative of the campaign template. The HTML layout is
+        converted to text once, with the placeholders still in place, so that
+        each contact only fills the same slots. Returns None if the conversion
+        altered a placeholder (the send path then converts each message).
+        """
+        html_template = self.compile_template(email_content, use_html, logo_file, decorative_image_file,
+                                              header_content, footer_content)
+        if not use_html:
+            return html_template
+
+        cache_key = ('plain', email_content, use_html, bool(logo_file), bool(decorative_image_file),
+                     header_content, footer_content)
+        if cache_key in self._template_cache:
+            self._template_cache.move_to_end(cache_key)
+            return self._template_cache[cache_key]
+
+        import html2text
+
+        converter = html2text.HTML2Text()
+        # No hard wrapping: line lengths would depend on the placeholder names
+        converter.body_width = 0
+        compiled = CompiledTemplate(converter.handle(html_template.source))
+        if sorted(compiled.slots) != sorted(html_template.slots):
+            compiled = None
+
+        self._template_cache[cache_key] = compiled
+        if len(self._template_cache) > self.TEMPLATE_CACHE_SIZE:
+            self._template_cache.popitem(last=False)
+        return compiled
+
+    def _campaign_template(self, email_content: str, use_html: bool, logo_file, decorative_image_file,
+                           header_content: Optional[str], footer_content: Optional[str],
+                           plain_text: bool = False) -> Optional[CompiledTemplate]:
+        """Compiled (HTML or plain-text) template for these settings, with the default content, header and footer"""
+        # Safety check for email content - use appropriate template based on format
+        if email_content is None:
+            email_content = self.base_email_content_html if use_html else self.base_email_content_text
+
+        if use_html:
+            # Default greeting and signature unless given
+            if header_content is None:
+                header_content = DEFAULT_EMAIL_HEADER
+            if footer_content is None:
+                footer_content = DEFAULT_EMAIL_FOOTER
+        else:
+            header_content = footer_content = None
+
+        compile = self.compile_plain_template if plain_text else self.compile_template
+        return compile(email_content, use_html, logo_file, decorative_image_file, header_content, footer_content)
+
+    def personalize_email(self, contact_data: Dict[str, str], email_content: str, use_html: bool = False,
+                         logo_file=None, decorative_image_file=None, attachment_files=None,
+                         header_content: str = None, footer_content: str = None) -> str:
+        """
+        Dynamic personalization with any column placeholders from Excel data
+        """
+        template = self._campaign_template(email_content, use_html, logo_file, decorative_image_file,
+                                           header_content, footer_content)
+        return template.render(contact_data, NAME_FALLBACK)
+
+    def personalize_plain_text(self, contact_data: Dict[str, str], email_content: str, use_html: bool = False,
+                               logo_file=None, decorative_image_file=None, header_content: str = None,
+                               footer_content: str = None) -> Optional[str]:
+        """
+        Plain-text version of personalize_email(), filled from the same slots.
+        None when the template has no plain-text form.
+        """
+        template = self._campaign_template(email_content, use_html, logo_file, decorative_image_file,
+                                           header_content, footer_content, plain_text=True)
+        if template is None:
+            return None
+        return template.render(contact_data, NAME_FALLBACK)
+
+    def personalize_and_verify(self, contact_data: Dict[str, str], email_content: str, use_html: bool = False,
+                               logo_file=None, decorative_image_file=None, header_content: str = None,
+                               footer_content: str = None) -> Tuple[str, Dict]:
+        """
+        Personalize one email and verify it while rendering, without scanning the result.
+        Returns the email and {'is_valid', 'issues', 'empty_fields'}: issues name the
+        missing column of each unresolved placeholder; empty cells are listed in
+        empty_fields but do not make the email invalid.
+        """
+        template = self._campaign_template(email_content, use_html, logo_file, decorative_image_file,
+                                           header_content, footer_content)
+        personalized, report = template.render_with_report(contact_data, NAME_FALLBACK)
+
+        issues = []
+        for name in dict.fromkeys(report['missing']):
+            if not name.strip():
+                issues.append(f"Placeholder trouvé: {{{name}}} (placeholder sans nom)")
+            elif name in RESERVED_KEYS:
+                issues.append(f"Placeholder trouvé: {{{name}}} (champ '{name}' non substituable)")
+            else:
+                issues.append(f"Placeholder trouvé: {{{name}}} (colonne '{name}' absente du fichier)")
+        for name in dict.fromkeys(report['braces']):
+            issues.append(f"Placeholder trouvé dans la colonne '{name}': {contact_data[name]}")
+        for token in dict.fromkeys(report['leftover']):
+            issues.append(f"Placeholder trouvé: {token}")
+        # Basic check - email not empty (isspace stops at the first visible character)
+        if not personalized or personalized.isspace():
+            issues.append("Email vide")
+
+        return personalized, {
+            'is_valid': not issues,
+            'issues': issues,
+            'empty_fields': list(dict.fromkeys(report['empty']))
+        }
+
+    def iter_personalized_emails(self, contacts: Iterable[Dict[str, str]], email_content: str, use_html: bool = False,
+                                 logo_file=None, decorative_image_file=None, header_content: str = None,
+                                 footer_content: str = None) -> Iterator[Tuple[Dict[str, str], str]]:
+        """
+        Lazily yield (contact, personalized email) pairs, one contact at a time.
+        Nothing is kept once a message has been consumed.
+        """
+        for contact_data in contacts:
+            yield contact_data, self.personalize_email(
+                contact_data, email_content, use_html, logo_file, decorative_image_file,
+                header_content=header_content, footer_content=footer_content
+            )
+
+    def iter_verified_emails(self, contacts: Iterable[Dict[str, str]], email_content: str, use_html: bool = False,
+                             logo_file=None, decorative_image_file=None, header_content: str = None,
+                             footer_content: str = None) -> Iterator[Tuple[Dict[str, str], str, Dict]]:
+        """Lazily yield (contact, personalized email, verification) for each contact."""
+        for contact_data in contacts:
+            yield (contact_data,) + self.personalize_and_verify(
+                contact_data, email_content, use_html, logo_file, decorative_image_file,
+                header_content=header_content, footer_content=footer_content
+            )
+
+    def personalize_email_with_ai(self, contact_data: Dict[str, str], email_content: str, use_html: bool = False,
+                                 logo_file=None, decorative_image_file=None, attachment_files=None) -> str:
+        """AI personalization removed - using simple personalization instead"""
+        return self.personalize_email(contact_data, email_content, use_html, logo_file, decorative_image_file, attachment_files)
+
+    def verify_email_content(self, email_content: str) -> Tuple[bool, List[str]]:
+        """SUPER SIMPLE verification - only check for curly brace placeholders"""
+        issues = []
+
+        # Check for remaining curly brace placeholders - ONLY THESE
+        placeholder_patterns = [
+            r'\{[^}]*\}',         # {placeholder}
+            r'\{,?\}',            # {}, {,}
+        ]
+
+        for pattern in placeholder_patterns:
+            matches = re.findall(pattern, email_content, re.IGNORECASE)
+            if matches:
+                issues.extend([f"Placeholder trouvé: {match}" for match in matches])
+
+        # Basic check - email not empty
+        if not email_content.strip():
+            issues.append("Email vide")
+
+        return len(issues) == 0, issues
+
+def filter_suppressed(contacts: ContactTable, suppression: Optional[SuppressionList]) -> Tuple[ContactTable, int]:
+    """Contacts whose address is not in the suppression list, and the number removed."""
+    if suppression is None or not len(suppression) or not len(contacts):
+        return contacts, 0
+    # Extracted addresses are already normalized
+    suppressed = suppression.contains_many(contacts.column('email'), normalized=True)
+    if not any(suppressed):
+        return contacts, 0
+    kept = [position for position, removed in enumerate(suppressed) if not removed]
+    return contacts.take(kept), len(contacts) - len(kept)
+
+def calculate_sending_time(num_emails: int, delay_seconds: int) -> str:
+    """Calculate total sending time"""
+    total_seconds = int(num_emails * delay_seconds)
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+
+    if hours > 0:
+        return f"{hours}h {minutes}min"
+    else:
+        return f"{minutes}min"
+
+def create_pacer(delay_mode: str, delay_between_emails, min_delay: int = None, max_delay: int = None,
+                 quotas: Optional[Dict[str, int]] = None, jitter: float = 0.0, account: str = 'default',
+                 quota_path: str = ':memory:') -> Pacer:
+    """Global anti-spam pacing shared by every SMTP connection"""
+    if delay_mode == QUOTA_DELAY_MODE:
+        return QuotaLimiter(quotas, account=account, path=quota_path, jitter=jitter)
+    if delay_mode == "Délai fixe":
+        return Pacer(delay_between_emails)
+    return Pacer(min_delay=min_delay, max_delay=max_delay)
+
+def build_message_skeleton(automation: 'EmailAutomation', logo_file=None, decorative_image_file=None,
+                           attachment_files=None, metrics: Optional['CampaignMetrics'] = None
+                           ) -> Tuple[MessageSkeleton, List[str]]:
+    """
+    Encode the inline images and attachments once for the whole campaign.
+    Returns the skeleton and the warnings for the parts that could not be added.
+    The image compression time is recorded in `metrics` when given.
+    """
+    def compress(image_file):
+        if metrics is None:
+            return automation.compress_image(image_file)
+        with metrics.timer('compress_image'):
+            return automation.compress_image(image_file)
+
+    warnings = []
+    inline_parts = []
+    attachment_parts = []
+
+    # Add compressed images as inline attachments
+    if logo_file:
+        try:
+            # Compress logo before attaching
+            compressed_logo = compress(logo_file)
+            logo_attachment = MIMEImage(compressed_logo.getvalue())
+            logo_attachment.add_header('Content-ID', '<logo>')
+            logo_attachment.add_header('Content-Disposition', 'inline', filename='logo.jpg')
+            inline_parts.append(logo_attachment)
+        except Exception as e:
+            warnings.append(f"⚠️ Impossible d'ajouter le logo: {e}")
+
+    # Add decorative image as inline attachment
+    if decorative_image_file:
+        try:
+            # Compress decorative image before attaching
+            compressed_decorative = compress(decorative_image_file)
+            image_attachment = MIMEImage(compressed_decorative.getvalue())
+            image_attachment.add_header('Content-ID', '<decorative_image>')
+            image_attachment.add_header('Content-Disposition', 'inline', filename='decorative_image.jpg')
+            inline_parts.append(image_attachment)
+        except Exception as e:
+            warnings.append(f"⚠️ Impossible d'ajouter l'image décorative: {e}")
+
+    # Add regular attachments to root level
+    if attachment_files:
+        for attachment_file in attachment_files:
+            try:
+                # Déterminer le type MIME
+                if attachment_file.type.startswith('image/'):
+                    attachment = MIMEImage(attachment_file.getvalue())
+                else:
+                    attachment = MIMEApplication(attachment_file.getvalue())
+
+                attachment.add_header(
+                    'Content-Disposition',
+                    'attachment',
+                    filename=attachment_file.name
+                )
+                attachment_parts.append(attachment)
+            except Exception as e:
+                warnings.append(f"⚠️ Impossible de joindre {attachment_file.name}: {e}")
+
+    return MessageSkeleton(inline_parts, attachment_parts), warnings
+
+# Render worker state, set once per process by _init_render_worker
+_worker_automation: Optional['EmailAutomation'] = None
+_worker_settings: Optional[Dict] = None
+
+def _init_render_worker(render_settings: Dict):
+    """Process pool initializer: the campaign settings arrive once, the template is compiled once."""
+    global _worker_automation, _worker_settings
+    _worker_automation = EmailAutomation()
+    _worker_settings = render_settings
+
+def _verify_chunk(chunk: Tuple[List[str], List]) -> List[Optional[Tuple[bool, List[str], List[str]]]]:
+    """
+    Verification of a chunk of contacts, given as the template columns and one
+    tuple of values per contact (a dict when a column is missing). Clean
+    contacts give None to keep the results small.
+    """
+    columns, rows = chunk
+    results = []
+    for row in rows:
+        contact_data = dict(zip(columns, row)) if type(row) is tuple else row
+        _, verification = _worker_automation.personalize_and_verify(contact_data, **_worker_settings)
+        if verification['is_valid'] and not verification['empty_fields']:
+            results.append(None)
+        else:
+            results.append((verification['is_valid'], verification['issues'], verification['empty_fields']))
+    return results
+
+def _project_rows(contacts: List[Dict], columns: List[str]) -> List:
+    """Values of the template columns for each contact: a tuple, or a dict if a column is missing."""
+    if isinstance(contacts, ContactTable):
+        return contacts.project(columns)
+    if not columns:
+        return [()] * len(contacts)
+    getter = operator.itemgetter(*columns)
+    single = len(columns) == 1
+    rows = []
+    for contact_data in contacts:
+        try:
+            row = getter(contact_data)
+            rows.append((row,) if single else row)
+        except KeyError:
+            rows.append({name: contact_data[name] for name in columns if name in contact_data})
+    return rows
+
+def _iter_verifications(automation: 'EmailAutomation', contacts: List[Dict], render_settings: Dict,
+                        workers: int) -> Iterator[Optional[Tuple[bool, List[str], List[str]]]]:
+    """
+    (is_valid, issues, empty_fields) of every contact in contact order, or None
+    for a clean one, from this process or a process pool.
+    """
+    if workers <= 1:
+        for _, _, verification in automation.iter_verified_emails(contacts, **render_settings):
+            if verification['is_valid'] and not verification['empty_fields']:
+                yield None
+            else:
+                yield verification['is_valid'], verification['issues'], verification['empty_fields']
+        return
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Uploaded images only matter through their presence in the layout
+    settings = {**render_settings,
+                'logo_file': bool(render_settings.get('logo_file')),
+                'decorative_image_file': bool(render_settings.get('decorative_image_file'))}
+    # Workers only receive the columns the template uses: the render reads nothing else
+    template = automation._campaign_template(
+        render_settings['email_content'], render_settings.get('use_html', False), settings['logo_file'],
+        settings['decorative_image_file'], render_settings.get('header_content'),
+        render_settings.get('footer_content')
+    )
+    columns = [name for name in dict.fromkeys(template.slots) if name not in RESERVED_KEYS]
+    chunk_size = max(PROCESS_BATCH_SIZE, -(-len(contacts) // (workers * PARALLEL_CHUNKS_PER_WORKER)))
+    chunks = ((columns, _project_rows(contacts[i:i + chunk_size], columns))
+              for i in range(0, len(contacts), chunk_size))
+    # spawn: forking the multi-threaded Streamlit server is not safe
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_render_worker, initargs=(settings,)) as executor:
+        # map() keeps the chunk order
+        for results in executor.map(_verify_chunk, chunks):
+            yield from results
+
+def process_contacts(automation: 'EmailAutomation', contacts: List[Dict], render_settings: Dict,
+                     on_progress: Optional[Callable[[int, int, float], None]] = None,
+                     batch_size: int = PROCESS_BATCH_SIZE,
+                     progress_interval: float = PROGRESS_INTERVAL,
+                     workers: Optional[int] = None,
+                     domain_validator: Optional[DomainValidator] = None) -> Tuple[List[Dict], Dict]:
+    """
+    Render and verify every contact, keeping only a compact status per contact.
+    Large lists are split into chunks rendered by `workers` processes (by
+    default one per core from PARALLEL_MIN_ROWS contacts), results in contact order.
+    With a domain_validator, each distinct recipient domain is resolved once
+    and contacts of domains that cannot receive mail are flagged invalid.
+    on_progress(done, total, rows_per_second) is called at most every
+    progress_interval seconds, and once at the end.
+    Returns the processed entries and {'rows', 'seconds', 'rows_per_second', 'workers',
+    'undeliverable_domains'}.
+    """
+    total = len(contacts)
+    if workers is None:
+        workers = (os.cpu_count() or 1) if total >= PARALLEL_MIN_ROWS else 1
+    processed = []
+    emails = contacts.column('email') if isinstance(contacts, ContactTable) else [c['email'] for c in contacts]
+    domain_issues = {}
+    if domain_validator is not None:
+        undeliverable = domain_validator.undeliverable(recipient_domain(email) for email in emails)
+        domain_issues = {domain: domain_issue(domain, status) for domain, status in undeliverable.items()}
+    verifications = _iter_verifications(automation, contacts, render_settings, workers)
+    start = last_report = time.perf_counter()
+
+    use_html = render_settings.get('use_html', False)
+    for position, verification in enumerate(verifications):
+        # Tuples: entries holding only immutable values are not tracked by the garbage collector
+        if verification is None:
+            is_valid, issues, empty_fields = True, (), ()
+        else:
+            is_valid, issues, empty_fields = verification[0], tuple(verification[1]), tuple(verification[2])
+        if domain_issues:
+            issue = domain_issues.get(recipient_domain(emails[position]))
+            if issue is not None:
+                is_valid, issues = False, issues + (issue,)
+        processed.append({
+            'position': position,
+            'email': emails[position],
+            'is_valid': is_valid,
+            'issues': issues,
+            'empty_fields': empty_fields,
+            'use_html': use_html
+        })
+        if on_progress is not None and (position + 1) % batch_size == 0:
+            now = time.perf_counter()
+            if now - last_report >= progress_interval:
+                last_report = now
+                on_progress(position + 1, total, (position + 1) / (now - start))
+
+    seconds = time.perf_counter() - start
+    rows_per_second = len(processed) / seconds if seconds > 0 else 0.0
+    if on_progress is not None:
+        on_progress(len(processed), total, rows_per_second)
+    return processed, {'rows': len(processed), 'seconds': seconds, 'rows_per_second': rows_per_second,
+                       'workers': workers, 'undeliverable_domains': len(domain_issues)}
+
+def render_processed_email(entry: Dict, automation: 'EmailAutomation', contacts: List[Dict],
+                           render_settings: Dict) -> Dict:
+    """
+    Full email data for a compact processed entry: the contact fields plus the
+    personalized email, rendered again unless it was edited by hand.
+    """
+    contact = contacts[entry['position']]
+    personalized = entry.get('personalized_email')
+    plain_text = None
+    if personalized is None:
+        personalized = automation.personalize_email(contact, **render_settings)
+        plain_text = automation.personalize_plain_text(contact, **render_settings)
+    return {**contact, **entry, 'personalized_email': personalized, 'plain_text': plain_text}
+
+def build_send_job(email_data: Dict, sender_email: str, email_subject: str, cc_emails: str,
+                   skeleton: MessageSkeleton, message_id: Optional[str] = None) -> Dict:
+    """Splice one recipient's headers and HTML/plain parts into the campaign skeleton"""
+    # Plain text from the campaign template, or converted from this message's
+    # HTML when there is none (e.g. an email edited by hand)
+    plain_text = email_data.get('plain_text')
+    if plain_text is None:
+        import html2text
+        plain_text = html2text.html2text(email_data['personalized_email'])
+
+    headers = {
+        'From': sender_email,
+        'To': email_data['email'],
+        'Subject': email_subject,
+        # Add CC if specified
+        'Cc': cc_emails.strip() if cc_emails else '',
+        # Same Message-ID when a message is sent again after a crash
+        'Message-ID': message_id or ''
+    }
+
+    # Prepare recipient list (TO + CC)
+    recipients = [email_data['email']]
+    if cc_emails and cc_emails.strip():
+        cc_list = [email.strip() for email in cc_emails.split(',') if email.strip()]
+        recipients.extend(cc_list)
+
+    return {
+        'from_addr': sender_email,
+        'recipients': recipients,
+        'message': skeleton.render(headers, plain_text, email_data['personalized_email']),
+        'email_data': email_data
+    }
+
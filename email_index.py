@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Normalized email keys and suppression list for MERCI RAYMOND Email Automation.
+
+normalize_email() gives the key used to deduplicate contacts and to match
+the suppression list: surrounding whitespace (non-breaking and zero-width
+spaces included) removed, lower case, and an internationalized domain
+encoded in IDNA (café.fr -> xn--caf-dma.fr), so that 'Jean@X.fr' and
+' jean@x.fr' are the same recipient.
+
+The suppression list (unsubscribes, bounces, opt-outs) can hold millions of
+addresses. It is stored as a sorted array of 64-bit hashes of the normalized
+addresses (8 bytes each, 80 MB for 10 million) and memory-mapped: opening
+it reads nothing, and a batch of contacts is matched with one binary search
+per address over the mapped pages. A collision between two different
+addresses has a probability of about n / 2^64 per lookup.
+
+File layout: MAGIC (8 bytes), count (uint64 little-endian), then count
+sorted uint64 little-endian hashes.
+
+Build or extend a list from text/CSV files (one address per line or per
+first column):
+    python email_index.py add suppression.bin desinscrits.csv bounces.txt
+"""
+
+import argparse
+import csv
+import hashlib
+import mmap
+import os
+import re
+import struct
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+DEFAULT_SUPPRESSION_PATH = 'suppression.bin'
+
+MAGIC = b'MRSUPP01'
+_HEADER = struct.Struct('<8sQ')
+
+# Whitespace str.strip() keeps: zero-width spaces and BOM
+_INVISIBLE = '\u200b\u200c\u200d\u2060\ufeff'
+_NON_ASCII = re.compile(r'[^\x00-\x7f]')
+
+
+def _encode_domain(domain: str) -> str:
+    try:
+        return domain.encode('idna').decode('ascii')
+    except UnicodeError:
+        # Not a valid IDN: left as is, the address pattern will reject it
+        return domain
+
+
+def normalize_email(address: str) -> str:
+    """Comparison key of an address: trimmed, lower case, IDNA domain."""
+    address = address.strip().strip(_INVISIBLE).strip().lower()
+    local, at, domain = address.rpartition('@')
+    if at and _NON_ASCII.search(domain):
+        return f"{local}@{_encode_domain(domain)}"
+    return address
+
+
+def normalize_email_column(series: 'pd.Series') -> 'pd.Series':
+    """normalize_email() over a column of non-null strings, vectorized except for IDN domains."""
+    normalized = series.str.strip().str.lower()
+    # Invisible spaces are non-ASCII too: those rows go through normalize_email()
+    non_ascii = normalized.str.contains(_NON_ASCII)
+    if non_ascii.any():
+        normalized[non_ascii] = normalized[non_ascii].map(normalize_email)
+    return normalized
+
+
+def email_hash(normalized: str) -> int:
+    """64-bit hash of a normalized address, as stored in the suppression file."""
+    return int.from_bytes(hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class SuppressionList:
+    """Read-only memory-mapped suppression file."""
+
+    def __init__(self, path: str = DEFAULT_SUPPRESSION_PATH):
+        import numpy as np
+
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            magic, self.count = _HEADER.unpack(header) if len(header) == _HEADER.size else (None, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} n'est pas une liste de suppression")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._hashes = np.frombuffer(self._mmap, dtype='<u8', count=self.count, offset=_HEADER.size)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, address: str) -> bool:
+        return bool(self.contains_many([address])[0])
+
+    def contains_many(self, addresses: Iterable[str], normalized: bool = False) -> List[bool]:
+        """For each address, whether it is suppressed. `normalized`: the addresses are already keys."""
+        import numpy as np
+
+        keys = addresses if normalized else (normalize_email(address) for address in addresses)
+        hashes = np.fromiter((email_hash(key) for key in keys), dtype='<u8')
+        if not self.count or not len(hashes):
+            return [False] * len(hashes)
+        positions = np.searchsorted(self._hashes, hashes)
+        found = self._hashes[np.minimum(positions, self.count - 1)] == hashes
+        return found.tolist()
+
+    def close(self):
+        """Unmap the file (views on it must be gone)."""
+        self._hashes = None
+        self._mmap.close()
+
+    def __enter__(self) -> 'SuppressionList':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_suppression_file(path: str, addresses: Iterable[str], merge: bool = True) -> int:
+    """
+    Write the suppression file for these addresses, keeping the ones already
+    in it when `merge`. The file is replaced atomically, so open lists keep
+    reading the previous version. Returns the number of distinct hashes.
+    """
+    import numpy as np
+
+    hashes = np.fromiter((email_hash(normalize_email(address)) for address in addresses
+                          if address and address.strip()), dtype='<u8')
+    if merge and os.path.exists(path):
+        with SuppressionList(path) as existing:
+            hashes = np.concatenate([hashes, existing._hashes])
+    hashes = np.unique(hashes)
+
+    partial = path + '.tmp'
+    with open(partial, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(hashes)))
+        f.write(hashes.astype('<u8', copy=False).tobytes())
+    os.replace(partial, path)
+    return len(hashes)
+
+
+def iter_addresses(lines: Iterable[str]) -> Iterator[str]:
+    """Addresses of text or CSV lines: first column, lines without '@' (headers) skipped."""
+    for row in csv.reader(lines):
+        if row and '@' in row[0]:
+            yield row[0]
+
+
+def read_address_file(path: str) -> Iterator[str]:
+    """Addresses of a text or CSV file, see iter_addresses()."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        yield from iter_addresses(f)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Liste de suppression (désinscriptions, rebonds)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    add = subparsers.add_parser('add', help="Ajouter des adresses (fichiers texte ou CSV) à la liste")
+    add.add_argument('suppression', help="Fichier de la liste de suppression")
+    add.add_argument('files', nargs='+', help="Fichiers d'adresses, une par ligne ou en première colonne")
+    add.add_argument('--replace', action='store_true', help="Remplacer la liste au lieu de la compléter")
+    check = subparsers.add_parser('check', help="Vérifier si des adresses sont dans la liste")
+    check.add_argument('suppression')
+    check.add_argument('addresses', nargs='+')
+    args = parser.parse_args(argv)
+
+    if args.command == 'add':
+        addresses = (address for path in args.files for address in read_address_file(path))
+        count = write_suppression_file(args.suppression, addresses, merge=not args.replace)
+        print(f"{count} adresses dans {args.suppression}")
+        return 0
+
+    with SuppressionList(args.suppression) as suppression:
+        found = suppression.contains_many(args.addresses)
+    for address, suppressed in zip(args.addresses, found):
+        print(f"{address}: {'supprimée' if suppressed else 'autorisée'}")
+    return 1 if any(found) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
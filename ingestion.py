@@ -0,0 +1,135 @@
+"""
+Contact file ingestion for MERCI RAYMOND Email Automation.
+
+Several engines can load the contact list, all returning a DataFrame shaped
+like pd.read_excel() so that detect_column_mapping and the extraction work
+unchanged:
+
+    openpyxl            pandas default (whole workbook loaded in memory)
+    openpyxl-streaming  read-only openpyxl, rows streamed straight into columns
+    calamine            Rust parser (python-calamine), used when installed
+    csv                 pandas C parser
+    parquet             pandas/pyarrow
+
+Every read reports its parse time and throughput so the engine can be
+chosen per file.
+"""
+
+import importlib.util
+import io
+import os
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm', '.xls')
+SUPPORTED_EXTENSIONS = EXCEL_EXTENSIONS + ('.csv', '.parquet')
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def file_extension(filename: str) -> str:
+    return os.path.splitext(filename or '')[1].lower()
+
+
+def available_engines(filename: str) -> List[str]:
+    """Engines able to read this file, fastest first."""
+    extension = file_extension(filename)
+    if extension == '.csv':
+        return ['csv']
+    if extension == '.parquet':
+        return ['parquet']
+    if extension not in EXCEL_EXTENSIONS:
+        return []
+    engines = ['calamine'] if _installed('python_calamine') else []
+    if extension == '.xls':
+        return engines + ['xlrd']
+    return engines + ['openpyxl-streaming', 'openpyxl']
+
+
+def _unique_headers(header) -> List[str]:
+    """Column names like pd.read_excel: 'Unnamed: i' for blanks, '.1' suffixes for duplicates."""
+    names = []
+    seen: Dict[str, int] = {}
+    for i, value in enumerate(header):
+        name = f"Unnamed: {i}" if value is None or str(value).strip() == '' else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        names.append(name)
+    return names
+
+
+def read_excel_streaming(source) -> 'pd.DataFrame':
+    """First sheet through read-only openpyxl, one row at a time."""
+    import openpyxl
+    import pandas as pd
+
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        data = []
+        width = 0
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            # Trailing blank cells are dropped, like pd.read_excel
+            end = len(row)
+            while end and row[end - 1] is None:
+                end -= 1
+            data.append(row[:end])
+            width = max(width, end)
+    finally:
+        workbook.close()
+
+    # Trailing blank rows too
+    while data and not data[-1]:
+        data.pop()
+    if not data:
+        return pd.DataFrame()
+    data = [row if len(row) == width else row + (None,) * (width - len(row)) for row in data]
+    return pd.DataFrame(data[1:], columns=_unique_headers(data[0]))
+
+
+def read_contacts(source, filename: Optional[str] = None, engine: str = 'auto') -> Tuple['pd.DataFrame', Dict]:
+    """
+    Load a contact file (path or uploaded file) with the given engine.
+    Returns the DataFrame and the parse statistics:
+    {'engine', 'rows', 'columns', 'seconds', 'rows_per_second'}.
+    """
+    import pandas as pd
+
+    filename = filename or getattr(source, 'name', None) or str(source)
+    engines = available_engines(filename)
+    if not engines:
+        raise ValueError(f"Format de fichier non supporté: {file_extension(filename) or filename}")
+    if engine == 'auto':
+        engine = engines[0]
+    elif engine not in engines:
+        raise ValueError(f"Moteur '{engine}' indisponible pour {filename} (disponibles: {', '.join(engines)})")
+
+    # Uploaded files are read from an in-memory copy, paths directly
+    if hasattr(source, 'getvalue'):
+        source = io.BytesIO(source.getvalue())
+
+    start = time.perf_counter()
+    if engine == 'csv':
+        df = pd.read_csv(source)
+    elif engine == 'parquet':
+        df = pd.read_parquet(source)
+    elif engine == 'openpyxl-streaming':
+        df = read_excel_streaming(source)
+    else:
+        df = pd.read_excel(source, engine=engine)
+    seconds = time.perf_counter() - start
+
+    stats = {
+        'engine': engine,
+        'rows': len(df),
+        'columns': len(df.columns),
+        'seconds': seconds,
+        'rows_per_second': len(df) / seconds if seconds > 0 else 0.0
+    }
+    return df, stats
@@ -0,0 +1,96 @@
+"""
+Campaign-level MIME skeleton for MERCI RAYMOND Email Automation.
+
+Inline images and attachments are identical for every recipient, so they
+are encoded and serialized once per campaign. Each recipient only adds
+their headers and their plain-text/HTML parts, spliced between the
+pre-serialized bytes to produce the final wire message.
+
+Layout (same as the per-recipient MIMEMultipart tree it replaces):
+    multipart/mixed
+        multipart/alternative
+            text/plain
+            multipart/related
+                text/html
+                inline images (Content-ID)
+        attachments
+"""
+
+import base64
+import uuid
+from email import policy
+from email.message import Message
+from typing import Dict, List, Optional
+
+CRLF = b'\r\n'
+
+# Same header encoding as MIMEMultipart.as_string(), with SMTP line endings
+WIRE_POLICY = policy.compat32.clone(linesep='\r\n')
+
+
+def _boundary() -> bytes:
+    # '=_' never appears in base64 or quoted-printable bodies
+    return f"=_{uuid.uuid4().hex}".encode('ascii')
+
+
+def serialize_part(part: Message) -> bytes:
+    """Headers and encoded body of a MIME part, as sent on the wire."""
+    return part.as_bytes(policy=WIRE_POLICY)
+
+
+def encode_text_part(text: str, subtype: str) -> bytes:
+    """utf-8 text part encoded in base64, like MIMEText(text, subtype, 'utf-8')."""
+    body = base64.encodebytes(text.encode('utf-8')).replace(b'\n', CRLF)
+    return (
+        f'Content-Type: text/{subtype}; charset="utf-8"\r\n'
+        'MIME-Version: 1.0\r\n'
+        'Content-Transfer-Encoding: base64\r\n'
+        '\r\n'
+    ).encode('ascii') + body
+
+
+class MessageSkeleton:
+    """Pre-serialized shared parts of a campaign message."""
+
+    def __init__(self, inline_parts: Optional[List[Message]] = None,
+                 attachment_parts: Optional[List[Message]] = None):
+        mixed, alternative, related = _boundary(), _boundary(), _boundary()
+        self.content_type = f'multipart/mixed; boundary="{mixed.decode()}"'
+
+        # Everything between the top-level headers and the plain-text part
+        self._before_plain = b''.join([
+            CRLF, b'--', mixed, CRLF,
+            f'Content-Type: multipart/alternative; boundary="{alternative.decode()}"\r\n'.encode('ascii'),
+            b'MIME-Version: 1.0', CRLF, CRLF,
+            b'--', alternative, CRLF,
+        ])
+        # Between the plain-text part and the HTML part
+        self._before_html = b''.join([
+            CRLF, b'--', alternative, CRLF,
+            f'Content-Type: multipart/related; boundary="{related.decode()}"\r\n'.encode('ascii'),
+            b'MIME-Version: 1.0', CRLF, CRLF,
+            b'--', related, CRLF,
+        ])
+        # Inline images, closing boundaries and attachments, encoded once
+        tail = [CRLF + b'--' + related + CRLF + serialize_part(part) for part in inline_parts or []]
+        tail += [CRLF, b'--', related, b'--', CRLF, CRLF, b'--', alternative, b'--', CRLF]
+        tail += [CRLF + b'--' + mixed + CRLF + serialize_part(part) for part in attachment_parts or []]
+        tail += [CRLF, b'--', mixed, b'--', CRLF]
+        self._after_html = b''.join(tail)
+
+    def render(self, headers: Dict[str, str], plain_text: str, html: str) -> bytes:
+        """Final wire bytes for one recipient. Empty header values are skipped."""
+        header_lines = [
+            WIRE_POLICY.fold('Content-Type', self.content_type),
+            WIRE_POLICY.fold('MIME-Version', '1.0'),
+        ]
+        header_lines += [WIRE_POLICY.fold(name, value) for name, value in headers.items() if value]
+
+        return b''.join([
+            ''.join(header_lines).encode('ascii'),
+            self._before_plain,
+            encode_text_part(plain_text, 'plain'),
+            self._before_html,
+            encode_text_part(html, 'html'),
+            self._after_html,
+        ])
@@ -0,0 +1,272 @@
+"""
+Disk-backed store of processed contacts for MERCI RAYMOND Email Automation.
+
+Processing a list gives one compact status per contact (validity, issues,
+empty fields). Kept in the Streamlit session, the whole list stays in RAM
+for as long as the browser tab lives and the review page walked through it
+on every rerun. The statuses are written instead to a local SQLite file
+(WAL mode), together with each contact's fields and the text render
+settings, under a run id:
+
+    runs        one row per processing: counts and render settings
+    processed   one row per contact, indexed by (run, validity, position)
+                and (run, email); hand corrections are kept on the row
+
+The review page only counts with the indexes and loads the page it shows,
+so the session holds a run id whatever the size of the list. Runs belong
+to an owner token: the page reopens only its owner's last run, which is
+still there after a Streamlit restart (images and attachments are not
+stored: they are taken from the current session). A campaign being sent
+works on a snapshot of its contacts, not on the stored run.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_PROCESSED_STORE_PATH = 'processed_emails.db'
+
+# Older runs of the same owner, and runs of any owner older than RUN_RETENTION
+# seconds, are deleted when a new one is saved
+MAX_RUNS = 5
+RUN_RETENTION = 7 * 24 * 3600
+PAGE_SIZE = 20
+
+# Render settings that can be stored; images are file uploads
+STORED_SETTINGS = ('email_content', 'use_html', 'header_content', 'footer_content')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    total INTEGER NOT NULL,
+    valid INTEGER NOT NULL,
+    render_settings TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS processed (
+    run_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    email TEXT NOT NULL,
+    is_valid INTEGER NOT NULL,
+    issues TEXT NOT NULL,
+    empty_fields TEXT NOT NULL,
+    use_html INTEGER NOT NULL,
+    corrected INTEGER NOT NULL DEFAULT 0,
+    personalized_email TEXT,
+    contact TEXT NOT NULL,
+    PRIMARY KEY (run_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS processed_validity ON processed (run_id, is_valid, position);
+CREATE INDEX IF NOT EXISTS processed_email ON processed (run_id, email);
+CREATE INDEX IF NOT EXISTS runs_owner ON runs (owner, created_at);
+"""
+
+_ENTRY_COLUMNS = 'position, email, is_valid, issues, empty_fields, use_html, corrected, personalized_email'
+
+
+def _entry(row) -> Dict:
+    """Processed entry, in the shape returned by process_contacts()."""
+    position, email, is_valid, issues, empty_fields, use_html, corrected, personalized = row
+    entry = {
+        'position': position,
+        'email': email,
+        'is_valid': bool(is_valid),
+        'issues': tuple(json.loads(issues)),
+        'empty_fields': tuple(json.loads(empty_fields)),
+        'use_html': bool(use_html),
+        'corrected': bool(corrected)
+    }
+    if personalized is not None:
+        entry['personalized_email'] = personalized
+    return entry
+
+
+class ProcessedStore:
+    """Processed runs on disk, queried by page. Thread-safe."""
+
+    def __init__(self, path: str = DEFAULT_PROCESSED_STORE_PATH, max_runs: int = MAX_RUNS,
+                 retention: float = RUN_RETENTION):
+        self.path = path
+        self.max_runs = max_runs
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+
+    def __enter__(self) -> 'ProcessedStore':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def save_run(self, run_id: str, processed: Iterable[Dict], contacts, render_settings: Dict,
+                 owner: str = '') -> int:
+        """
+        Store the entries of process_contacts() with the contacts they point to,
+        replacing a run of the same id. Returns the number of entries.
+        """
+        rows = []
+        valid = 0
+        for entry in processed:
+            valid += bool(entry['is_valid'])
+            rows.append((run_id, entry['position'], entry['email'], int(bool(entry['is_valid'])),
+                         json.dumps(list(entry['issues']), ensure_ascii=False),
+                         json.dumps(list(entry['empty_fields']), ensure_ascii=False),
+                         int(bool(entry.get('use_html'))), entry.get('personalized_email'),
+                         json.dumps(dict(contacts[entry['position']]), ensure_ascii=False, default=str)))
+        settings = json.dumps({name: render_settings.get(name) for name in STORED_SETTINGS}, ensure_ascii=False)
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.execute("DELETE FROM processed WHERE run_id = ?", (run_id,))
+            self._conn.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?)",
+                               (run_id, owner, now, len(rows), valid, settings))
+            self._conn.executemany(
+                "INSERT INTO processed (run_id, position, email, is_valid, issues, empty_fields, use_html, "
+                "personalized_email, contact) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            # Other owners' recent runs are never touched
+            stale = [run for run, in self._conn.execute(
+                "SELECT run_id FROM runs WHERE owner = ? ORDER BY created_at DESC LIMIT -1 OFFSET ?",
+                (owner, self.max_runs))]
+            stale += [run for run, in self._conn.execute(
+                "SELECT run_id FROM runs WHERE created_at < ?", (now - self.retention,))]
+            for run in stale:
+                self._conn.execute("DELETE FROM processed WHERE run_id = ?", (run,))
+                self._conn.execute("DELETE FROM runs WHERE run_id = ?", (run,))
+            self._conn.execute('COMMIT')
+        return len(rows)
+
+    def run(self, run_id: str) -> Optional[Dict]:
+        """{'run_id', 'owner', 'created_at', 'total', 'valid', 'render_settings'} of a run, None if unknown."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        return self._run(row)
+
+    def latest_run(self, owner: str) -> Optional[Dict]:
+        """The last run saved by this owner, None if there is none."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM runs WHERE owner = ? ORDER BY created_at DESC LIMIT 1",
+                                     (owner,)).fetchone()
+        return self._run(row)
+
+    @staticmethod
+    def _run(row) -> Optional[Dict]:
+        if row is None:
+            return None
+        run_id, owner, created_at, total, valid, settings = row
+        return {'run_id': run_id, 'owner': owner, 'created_at': created_at, 'total': total, 'valid': valid,
+                'render_settings': json.loads(settings)}
+
+    def _filters(self, run_id: str, is_valid: Optional[bool], corrected: Optional[bool]):
+        where, params = ["run_id = ?"], [run_id]
+        if is_valid is not None:
+            where.append("is_valid = ?")
+            params.append(int(is_valid))
+        if corrected is not None:
+            where.append("corrected = ?")
+            params.append(int(corrected))
+        return ' AND '.join(where), params
+
+    def count(self, run_id: str, is_valid: Optional[bool] = None, corrected: Optional[bool] = None) -> int:
+        """Number of entries of a run, optionally only the (in)valid or corrected ones."""
+        where, params = self._filters(run_id, is_valid, corrected)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM processed WHERE {where}", params).fetchone()[0]
+
+    def page(self, run_id: str, is_valid: Optional[bool] = None, offset: int = 0, limit: Optional[int] = PAGE_SIZE,
+             corrected: Optional[bool] = None) -> List[Dict]:
+        """Entries of a run in contact order, from `offset`; all of them with limit=None."""
+        where, params = self._filters(run_id, is_valid, corrected)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_ENTRY_COLUMNS} FROM processed WHERE {where} ORDER BY position LIMIT ? OFFSET ?",
+                params + [-1 if limit is None else limit, offset]).fetchall()
+        return [_entry(row) for row in rows]
+
+    def find(self, run_id: str, email: str) -> List[Dict]:
+        """Entries of a run sent to this address."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_ENTRY_COLUMNS} FROM processed WHERE run_id = ? AND email = ? ORDER BY position",
+                (run_id, email)).fetchall()
+        return [_entry(row) for row in rows]
+
+    def contacts(self, run_id: str, positions: Iterable[int]) -> Dict[int, Dict]:
+        """Contact fields of these positions."""
+        positions = list(positions)
+        found = {}
+        with self._lock:
+            # Chunks stay below SQLite's bound parameter limit
+            for start in range(0, len(positions), 500):
+                chunk = positions[start:start + 500]
+                found.update((position, json.loads(contact)) for position, contact in self._conn.execute(
+                    f"SELECT position, contact FROM processed WHERE run_id = ? "
+                    f"AND position IN ({','.join('?' * len(chunk))})", [run_id] + chunk))
+        return found
+
+    def save_correction(self, run_id: str, position: int, personalized_email: str):
+        """Keep an email corrected by hand; the entry stays in the review list, marked corrected."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE processed SET personalized_email = ?, corrected = 1 WHERE run_id = ? AND position = ?",
+                (personalized_email, run_id, position))
+
+    def mark_valid(self, run_id: str, positions: Iterable[int]):
+        """Move corrected entries out of the review list (e.g. once submitted), keeping their content."""
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                "UPDATE processed SET is_valid = 1, issues = '[]' WHERE run_id = ? AND position = ?",
+                [(run_id, position) for position in positions])
+            self._conn.execute('COMMIT')
+
+    def close(self):
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.close()
+            self._conn = None
+
+
+class StoredContacts:
+    """
+    contacts[position] for a stored run, read from the store on access:
+    stands in for the contact list in render_processed_email(). The last
+    contacts read are kept in a small cache.
+    """
+
+    def __init__(self, store: ProcessedStore, run_id: str, cache_size: int = 256):
+        self.store = store
+        self.run_id = run_id
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getitem__(self, position: int) -> Dict:
+        with self._lock:
+            contact = self._cache.get(position)
+            if contact is not None:
+                self._cache.move_to_end(position)
+                return contact
+        contact = self.store.contacts(self.run_id, [position]).get(position)
+        if contact is None:
+            raise IndexError(position)
+        with self._lock:
+            self._cache[position] = contact
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return contact
+
+    def __len__(self) -> int:
+        return self.store.count(self.run_id)
+
+    def snapshot(self, positions: Iterable[int]) -> Dict[int, Dict]:
+        """contacts[position] for these positions, held in memory: independent of the stored run."""
+        return self.store.contacts(self.run_id, positions)
@@ -0,0 +1,170 @@
+"""
+Quota-aware pacing for MERCI RAYMOND Email Automation.
+
+Instead of a fixed gap between two emails, sends draw from token buckets
+sized on the account quotas (per minute, per hour, per day). A bucket
+holds at most `limit` tokens and refills continuously at limit / period,
+so a campaign goes as fast as every quota allows and slows down only when
+one of them runs out.
+
+Throttling replies from the server (421, 450, 451, 452) pause every send
+for an exponentially growing delay, reset by the next delivered message.
+
+Bucket levels and the pause are stored in a small SQLite file (WAL mode),
+read and updated in one transaction per send, so the limits hold across
+Streamlit sessions, CLI runs and restarts for the same account.
+"""
+
+import random
+import sqlite3
+import time
+from typing import Callable, Dict, Optional
+
+from smtp_policy import Pacer
+
+DEFAULT_QUOTA_PATH = 'send_quota.db'
+
+QUOTA_PERIODS = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Google Workspace sending limits, per account
+DEFAULT_QUOTAS = {'minute': 20, 'hour': 400, 'day': 2000}
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS buckets (
+        account TEXT NOT NULL,
+        period TEXT NOT NULL,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (account, period)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS backoff (
+        account TEXT PRIMARY KEY,
+        failures INTEGER NOT NULL,
+        blocked_until REAL NOT NULL
+    ) WITHOUT ROWID
+    """,
+)
+
+
+class QuotaLimiter(Pacer):
+    """
+    Pacer drawing one token per send from every quota bucket, with jitter
+    and exponential backoff on throttling replies. Thread-safe, and safe
+    to share between processes through the same state file.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None, account: str = 'default',
+                 path: str = ':memory:', jitter: float = 0.0, backoff_base: float = 30.0,
+                 backoff_max: float = 900.0, clock: Callable[[], float] = time.time):
+        super().__init__()
+        limits = DEFAULT_QUOTAS if limits is None else limits
+        unknown = set(limits) - set(QUOTA_PERIODS)
+        if unknown:
+            raise ValueError(f"Unknown quota period: {', '.join(sorted(unknown))}")
+        self.limits = {period: limit for period, limit in limits.items() if limit}
+        self.account = account
+        self.path = path
+        self.jitter = jitter
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Wall clock: the state outlives the process
+        self.clock = clock
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+
+    def __enter__(self) -> 'QuotaLimiter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _levels(self, now: float) -> Dict[str, float]:
+        """Current token count of every bucket, refilled up to now."""
+        stored = {period: (tokens, updated_at) for period, tokens, updated_at in self._conn.execute(
+            "SELECT period, tokens, updated_at FROM buckets WHERE account = ?", (self.account,))}
+        levels = {}
+        for period, limit in self.limits.items():
+            tokens, updated_at = stored.get(period, (limit, now))
+            rate = limit / QUOTA_PERIODS[period]
+            levels[period] = min(limit, tokens + max(0.0, now - updated_at) * rate)
+        return levels
+
+    def _blocked_until(self) -> float:
+        row = self._conn.execute("SELECT blocked_until FROM backoff WHERE account = ?", (self.account,)).fetchone()
+        return row[0] if row else 0.0
+
+    def reserve(self) -> float:
+        """
+        Take one token from every bucket and return how long to wait before
+        sending. Buckets may go negative: later reservations queue behind.
+        """
+        with self._lock:
+            now = self.clock()
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                wait = 0.0
+                rows = []
+                for period, tokens in self._levels(now).items():
+                    tokens -= 1
+                    rate = self.limits[period] / QUOTA_PERIODS[period]
+                    wait = max(wait, -tokens / rate)
+                    rows.append((self.account, period, tokens, now))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO buckets (account, period, tokens, updated_at) VALUES (?, ?, ?, ?)", rows)
+                wait = max(wait, self._blocked_until() - now)
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        if self.jitter:
+            wait += random.uniform(0, self.jitter)
+        return wait
+
+    def on_success(self):
+        """A delivered message ends the backoff sequence."""
+        with self._lock:
+            self._conn.execute("UPDATE backoff SET failures = 0 WHERE account = ? AND failures > 0", (self.account,))
+
+    def on_throttled(self, error: Exception) -> float:
+        """Pause every send for backoff_base * 2^(n-1) seconds (capped) after the n-th throttling reply."""
+        with self._lock:
+            now = self.clock()
+            self._conn.execute('BEGIN IMMEDIATE')
+            row = self._conn.execute("SELECT failures, blocked_until FROM backoff WHERE account = ?",
+                                     (self.account,)).fetchone()
+            failures, blocked_until = row if row else (0, 0.0)
+            failures += 1
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (failures - 1))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO backoff (account, failures, blocked_until) VALUES (?, ?, ?)",
+                (self.account, failures, max(blocked_until, now + delay)))
+            self._conn.execute('COMMIT')
+        return delay
+
+    def remaining(self) -> Dict[str, int]:
+        """Sends available right now in each bucket."""
+        with self._lock:
+            return {period: max(0, int(tokens)) for period, tokens in self._levels(self.clock()).items()}
+
+    def estimate_seconds(self, count: int) -> float:
+        """Time needed to send `count` emails from the current bucket levels, ignoring backoff."""
+        with self._lock:
+            levels = self._levels(self.clock())
+        seconds = 0.0
+        for period, tokens in levels.items():
+            rate = self.limits[period] / QUOTA_PERIODS[period]
+            seconds = max(seconds, (count - tokens) / rate)
+        return seconds + count * self.jitter / 2
+
+    def close(self):
+        """Close the state file."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
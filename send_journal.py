@@ -0,0 +1,184 @@
+"""
+Persistent send journal for MERCI RAYMOND Email Automation.
+
+Every recipient of a campaign has one row in a local SQLite file (WAL
+mode), keyed on its normalized address, with its state: queued -> sending
+-> sent | failed. If the Streamlit session or the process dies halfway,
+sending the same campaign again skips everyone already marked as sent.
+
+A campaign has two keys. The message key identifies what is sent (sender,
+subject, texts, images and attachments), the campaign id adds the contact
+list. A recipient already sent a message is skipped by every campaign of
+the same message key, so rows removed, added or reordered in the file
+between two runs never lead to a second send.
+
+Each message gets a deterministic Message-ID derived from the message key
+and the recipient, so a message re-sent after a crash (state still
+'sending') carries the same Message-ID as the first attempt.
+
+State changes are buffered and written in one transaction per batch. A
+batch is flushed when it is full or when flush_interval has elapsed since
+the last write, so at most the last fraction of a second of marks can be
+lost on a crash (those recipients are sent again on resume).
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from email_index import normalize_email
+
+DEFAULT_JOURNAL_PATH = 'send_journal.db'
+
+JOURNAL_STATES = ('queued', 'sending', 'sent', 'failed')
+
+# Journals of the previous layout (table 'sends', keyed by position) are left as they are
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries (
+    campaign_id TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    message_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    email TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (campaign_id, recipient)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS deliveries_message ON deliveries (message_key, state, recipient);
+"""
+
+
+def campaign_key(*parts: str) -> str:
+    """Stable identifier of a campaign from its settings (sender, subject, content...)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()[:24]
+
+
+def contacts_digest(addresses: Iterable[str]) -> str:
+    """Digest of a contact list: its distinct normalized addresses, whatever their order."""
+    return campaign_key(*sorted({normalize_email(address) for address in addresses}))
+
+
+def files_digest(*files) -> str:
+    """Digest of uploaded files (images, attachments): names and contents; None entries are skipped."""
+    digest = hashlib.sha256()
+    for file in files:
+        if file is None:
+            continue
+        digest.update(str(getattr(file, 'name', '')).encode('utf-8'))
+        digest.update(b'\x1f')
+        digest.update(hashlib.sha256(file.getvalue()).digest())
+    return digest.hexdigest()[:24]
+
+
+def make_message_id(message_key: str, recipient: str, domain: str = 'merciraymond.local') -> str:
+    """Deterministic Message-ID header value for one recipient of a message."""
+    token = hashlib.sha256(f"{message_key}:{normalize_email(recipient)}".encode('utf-8')).hexdigest()[:32]
+    return f"<{token}@{domain}>"
+
+
+class SendJournal:
+    """Crash-safe record of what was sent, with batched writes. Thread-safe."""
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH, batch_size: int = 100, flush_interval: float = 0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending: List[Tuple] = []
+        self._last_flush = time.monotonic()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+
+    def __enter__(self) -> 'SendJournal':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def open_campaign(self, campaign_id: str, recipients: Iterable[Tuple[int, str]],
+                      domain: str = 'merciraymond.local', message_key: Optional[str] = None) -> Dict[str, str]:
+        """
+        Register (position, email) recipients as queued, keeping the state of
+        existing rows (their position is updated). `message_key` defaults to the
+        campaign id. Returns the Message-ID of every normalized address of the campaign.
+        """
+        message_key = message_key or campaign_id
+        now = time.time()
+        rows = {}
+        for position, email in recipients:
+            recipient = normalize_email(email)
+            rows.setdefault(recipient, (campaign_id, recipient, message_key, position, email,
+                                        make_message_id(message_key, recipient, domain), now))
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany(
+                "INSERT INTO deliveries (campaign_id, recipient, message_key, position, email, message_id, "
+                "state, updated_at) VALUES (?, ?, ?, ?, ?, ?, 'queued', ?) "
+                "ON CONFLICT (campaign_id, recipient) DO UPDATE SET position = excluded.position",
+                list(rows.values()))
+            self._conn.execute('COMMIT')
+            return dict(self._conn.execute(
+                "SELECT recipient, message_id FROM deliveries WHERE campaign_id = ?", (campaign_id,)))
+
+    def sent_recipients(self, campaign_id: str) -> Set[str]:
+        """Normalized addresses already delivered this campaign's message, by any campaign."""
+        with self._lock:
+            return {recipient for recipient, in self._conn.execute(
+                "SELECT recipient FROM deliveries WHERE state = 'sent' AND message_key = "
+                "(SELECT message_key FROM deliveries WHERE campaign_id = ? LIMIT 1)", (campaign_id,))}
+
+    def mark(self, campaign_id: str, email: str, state: str, error: Optional[str] = None):
+        """Buffer a state change of a recipient; written with the next batch."""
+        if state not in JOURNAL_STATES:
+            raise ValueError(f"Unknown journal state: {state}")
+        with self._lock:
+            self._pending.append((state, error, 1 if state == 'sending' else 0, time.time(),
+                                  campaign_id, normalize_email(email)))
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush_locked()
+
+    def flush(self):
+        """Write every buffered state change."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        self._conn.execute('BEGIN')
+        self._conn.executemany(
+            "UPDATE deliveries SET state = ?, error = ?, attempts = attempts + ?, updated_at = ? "
+            "WHERE campaign_id = ? AND recipient = ?", self._pending)
+        self._conn.execute('COMMIT')
+        self._pending = []
+
+    def summary(self, campaign_id: str) -> Dict[str, int]:
+        """Number of recipients in each state."""
+        self.flush()
+        counts = dict.fromkeys(JOURNAL_STATES, 0)
+        with self._lock:
+            counts.update(self._conn.execute(
+                "SELECT state, COUNT(*) FROM deliveries WHERE campaign_id = ? GROUP BY state", (campaign_id,)))
+        return counts
+
+    def close(self):
+        """Flush pending marks and close the database."""
+        if self._conn is None:
+            return
+        self.flush()
+        with self._lock:
+            self._conn.close()
+            self._conn = None
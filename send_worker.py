@@ -0,0 +1,250 @@
+"""
+Background campaign sending for MERCI RAYMOND Email Automation.
+
+A campaign can run for hours. Instead of sending inside the Streamlit
+script run (interrupted by any widget interaction or browser disconnect,
+and freezing the page meanwhile), campaigns are submitted to a SendWorker:
+one daemon thread per process, fed by a queue, running each campaign's
+AsyncSendEngine in its own event loop.
+
+The page only polls status() for the progress, counters and last errors,
+and can pause, resume or cancel the campaign. A campaign given a
+CampaignMetrics gets its render and MIME stages timed here, and its
+Prometheus/JSON metrics written when it ends. Every send is recorded in
+the SendJournal, so a campaign cut short (cancelled, or process restart)
+is resumed by submitting it again.
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from async_sender import AsyncSendEngine
+from campaign_metrics import CampaignMetrics
+from email_index import normalize_email
+from send_journal import DEFAULT_JOURNAL_PATH, SendJournal
+from smtp_policy import CANCELLED_ERROR
+
+# Campaign states, in order
+CAMPAIGN_STATES = ('queued', 'running', 'paused', 'cancelled', 'done', 'error')
+ACTIVE_STATES = ('queued', 'running', 'paused')
+
+# Last send errors kept per campaign for display
+MAX_ERRORS = 50
+
+
+def _recipient(entry: Dict) -> str:
+    """Address an entry is journaled under."""
+    return entry.get('original_email', entry['email'])
+
+
+class SendWorker:
+    """
+    Sends queued campaigns one after the other on a background thread.
+
+    A campaign is a dict with:
+        campaign_id   journal key (same message and contacts -> same campaign, resumed)
+        message_key   what is sent: recipients already sent it by any campaign are skipped
+                      (optional, defaults to campaign_id)
+        emails        items to send, each with 'position' and 'email' (journaled under
+                      'original_email' when set, e.g. test sends to the sender's address)
+        render_email  item -> full email data for build_send_job
+        build_job     (email_data, message_id) -> send job
+        engine        AsyncSendEngine configured for the account
+        label         name shown in the page (optional)
+        display       email data -> name used in the error list (optional)
+        message_id_domain  domain of the Message-IDs (optional)
+        metrics       CampaignMetrics, shared with the engine (optional)
+        metrics_dir   where the metrics files are written at the end (optional)
+    """
+
+    def __init__(self, journal_path: str = DEFAULT_JOURNAL_PATH):
+        self.journal_path = journal_path
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._status: Dict[str, Dict] = {}
+        self._engines: Dict[str, AsyncSendEngine] = {}
+        self._metrics: Dict[str, CampaignMetrics] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, campaign: Dict) -> str:
+        """Queue a campaign; submitting one that is still active does nothing. Returns its id."""
+        campaign_id = campaign['campaign_id']
+        with self._lock:
+            current = self._status.get(campaign_id)
+            if current is not None and current['state'] in ACTIVE_STATES:
+                return campaign_id
+            self._status[campaign_id] = {
+                'campaign_id': campaign_id, 'label': campaign.get('label', ''), 'state': 'queued',
+                'total': len(campaign['emails']), 'sent': 0, 'failed': 0, 'already_sent': 0,
+                'bytes_sent': 0, 'errors': [], 'error': None,
+                'submitted_at': time.time(), 'started_at': None, 'finished_at': None
+            }
+            self._engines[campaign_id] = campaign['engine']
+            if campaign.get('metrics') is not None:
+                self._metrics[campaign_id] = campaign['metrics']
+            else:
+                self._metrics.pop(campaign_id, None)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='send-worker', daemon=True)
+                self._thread.start()
+        self._queue.put(campaign)
+        return campaign_id
+
+    def status(self, campaign_id: str) -> Optional[Dict]:
+        """Snapshot of a campaign: state, counters, throughput and last errors."""
+        with self._lock:
+            status = self._status.get(campaign_id)
+            if status is None:
+                return None
+            snapshot = {**status, 'errors': list(status['errors'])}
+        started, finished = snapshot['started_at'], snapshot['finished_at']
+        elapsed = ((finished or time.time()) - started) if started else 0.0
+        snapshot['elapsed'] = elapsed
+        snapshot['messages_per_second'] = snapshot['sent'] / elapsed if elapsed > 0 else 0.0
+        done = snapshot['sent'] + snapshot['failed'] + snapshot['already_sent']
+        snapshot['progress'] = done / snapshot['total'] if snapshot['total'] else 1.0
+        return snapshot
+
+    def metrics(self, campaign_id: str) -> Optional[Dict]:
+        """Per-stage metrics summary of a campaign submitted with a CampaignMetrics."""
+        with self._lock:
+            metrics = self._metrics.get(campaign_id)
+        return metrics.summary() if metrics is not None else None
+
+    def campaigns(self) -> List[Dict]:
+        """Status of every campaign submitted to this worker."""
+        with self._lock:
+            campaign_ids = list(self._status)
+        return [self.status(campaign_id) for campaign_id in campaign_ids]
+
+    def _set_state(self, campaign_id: str, state: str, **fields):
+        with self._lock:
+            self._status[campaign_id].update(state=state, **fields)
+
+    def pause(self, campaign_id: str):
+        """Hold the campaign once the sends in flight are done."""
+        with self._lock:
+            status = self._status.get(campaign_id)
+            if status is None or status['state'] not in ('queued', 'running'):
+                return
+            self._engines[campaign_id].pause()
+            if status['state'] == 'running':
+                status['state'] = 'paused'
+
+    def resume(self, campaign_id: str):
+        """Continue a paused campaign."""
+        with self._lock:
+            status = self._status.get(campaign_id)
+            if status is None or status['state'] not in ACTIVE_STATES:
+                return
+            self._engines[campaign_id].resume()
+            if status['state'] == 'paused':
+                status['state'] = 'running'
+
+    def cancel(self, campaign_id: str):
+        """Stop after the sends in flight; a queued campaign never starts."""
+        with self._lock:
+            status = self._status.get(campaign_id)
+            if status is None or status['state'] not in ACTIVE_STATES:
+                return
+            if status['state'] == 'queued':
+                status.update(state='cancelled', finished_at=time.time())
+            self._engines[campaign_id].cancel()
+
+    def _run(self):
+        while True:
+            campaign = self._queue.get()
+            campaign_id = campaign['campaign_id']
+            with self._lock:
+                status = self._status[campaign_id]
+                if status['state'] != 'queued':
+                    continue
+                engine = self._engines[campaign_id]
+                status.update(state='paused' if engine.paused else 'running', started_at=time.time())
+            if campaign.get('metrics') is not None:
+                # Rates are measured from here, not from the submission
+                campaign['metrics'].start()
+            try:
+                summary = self._send(campaign)
+                state = 'cancelled' if summary['cancelled'] else 'done'
+                self._set_state(campaign_id, state, finished_at=time.time())
+            except Exception as e:
+                self._set_state(campaign_id, 'error', error=str(e), finished_at=time.time())
+
+    def _record(self, campaign_id: str, result: Dict, display: Callable[[Dict], str]):
+        # Entry only, for a message that could not be built
+        email_data = result['job']['email_data'] if result['job'] is not None else result['item']
+        with self._lock:
+            status = self._status[campaign_id]
+            if result['success']:
+                status['sent'] += 1
+                status['bytes_sent'] += len(result['job']['message'])
+            elif result['error'] != CANCELLED_ERROR:
+                status['failed'] += 1
+                status['errors'].append((display(email_data), str(result['error'])))
+                del status['errors'][:-MAX_ERRORS]
+
+    def _send(self, campaign: Dict) -> Dict:
+        campaign_id = campaign['campaign_id']
+        engine: AsyncSendEngine = campaign['engine']
+        display = campaign.get('display', lambda email_data: email_data['email'])
+        metrics: Optional[CampaignMetrics] = campaign.get('metrics')
+        journal = SendJournal(self.journal_path)
+        try:
+            emails = campaign['emails']
+            message_ids = journal.open_campaign(
+                campaign_id, [(entry['position'], _recipient(entry)) for entry in emails],
+                domain=campaign.get('message_id_domain', 'merciraymond.local'),
+                message_key=campaign.get('message_key')
+            )
+            already_sent = journal.sent_recipients(campaign_id)
+            remaining = [entry for entry in emails if normalize_email(_recipient(entry)) not in already_sent]
+            with self._lock:
+                self._status[campaign_id]['already_sent'] = len(emails) - len(remaining)
+
+            def build_job(entry):
+                journal.mark(campaign_id, _recipient(entry), 'sending')
+                message_id = message_ids[normalize_email(_recipient(entry))]
+                try:
+                    if metrics is None:
+                        return campaign['build_job'](campaign['render_email'](entry), message_id)
+                    with metrics.timer('render'):
+                        email_data = campaign['render_email'](entry)
+                    with metrics.timer('mime'):
+                        return campaign['build_job'](email_data, message_id)
+                except Exception as e:
+                    # Reported by the engine as a failed result: journaled 'failed', listed in the errors
+                    raise RuntimeError(f"Préparation du message impossible: {e!r}") from e
+
+            def on_result(result):
+                recipient = _recipient(result['item'])
+                if result['success']:
+                    journal.mark(campaign_id, recipient, 'sent')
+                elif result['error'] == CANCELLED_ERROR:
+                    # Never attempted: sent on resume
+                    journal.mark(campaign_id, recipient, 'queued')
+                else:
+                    journal.mark(campaign_id, recipient, 'failed', str(result['error']))
+                self._record(campaign_id, result, display)
+
+            if not remaining:
+                return {'sent': 0, 'failed': 0, 'cancelled': False}
+            return asyncio.run(engine.run(remaining, build_job=build_job, on_result=on_result))
+        finally:
+            journal.close()
+            engine.pacer.close()
+            if metrics is not None:
+                self._export_metrics(campaign_id, metrics, campaign.get('metrics_dir'))
+
+    def _export_metrics(self, campaign_id: str, metrics: CampaignMetrics, directory: Optional[str]):
+        metrics.finish()
+        if not directory:
+            return
+        try:
+            metrics.write(directory)
+        except OSError as e:
+            with self._lock:
+                self._status[campaign_id]['errors'].append(('Métriques', f"Écriture impossible: {e}"))
@@ -0,0 +1,126 @@
+"""
+Shared SMTP sending rules for MERCI RAYMOND Email Automation.
+
+The number of sends in flight follows an AIMD rule (additive increase,
+multiplicative decrease): it grows after fast successful sends and is
+halved on slow replies or temporary 4xx refusals. The anti-spam delay is
+applied once for the whole campaign by a Pacer, not by each connection.
+The send engine (async_sender.AsyncSendEngine) and the rate limiter build
+on these, together with the classification of SMTP failures.
+"""
+
+import random
+import smtplib
+import threading
+import time
+from typing import List, Optional
+
+# Error of the jobs dropped by a cancellation (never attempted)
+CANCELLED_ERROR = 'Envoi annulé'
+
+
+class Pacer:
+    """Global pacing between consecutive sends, shared by every connection."""
+
+    def __init__(self, delay: float = 0, min_delay: Optional[int] = None, max_delay: Optional[int] = None):
+        self.delay = delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def next_delay(self) -> float:
+        """Gap to leave after a send: fixed, or random between min and max like the 'Délai aléatoire' mode."""
+        if self.min_delay is not None and self.max_delay is not None:
+            return random.randint(self.min_delay, self.max_delay)
+        return self.delay
+
+    def reserve(self) -> float:
+        """Reserve the next send slot and return how long to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.next_delay()
+            return slot - now
+
+    def wait(self, stop_event: Optional[threading.Event] = None) -> bool:
+        """Block until the next slot. Returns False if stop_event was set meanwhile."""
+        wait_time = self.reserve()
+        if stop_event is not None:
+            return not stop_event.wait(wait_time)
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return True
+
+    def on_success(self):
+        """Called after each delivered message."""
+
+    def on_throttled(self, error: Exception) -> float:
+        """Called after a throttling reply (421/450/451/452). Returns the pause applied."""
+        return 0.0
+
+    def close(self):
+        """Release what the pacer holds (state files)."""
+
+
+class AIMDController:
+    """Adaptive concurrency limit: +1 per window of fast sends, halved on congestion."""
+
+    def __init__(self, initial: int = 1, minimum: int = 1, maximum: int = 4,
+                 latency_target: float = 2.0, decrease_factor: float = 0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self._lock = threading.Lock()
+        self._last_decrease = 0.0
+
+    @property
+    def concurrency(self) -> int:
+        """Number of connections currently allowed to send."""
+        return int(self.limit)
+
+    def on_success(self, latency: float):
+        """Record a successful send and its SMTP round-trip time."""
+        if latency > self.latency_target:
+            self.on_congestion()
+            return
+        with self._lock:
+            # Spread the +1 over a full window of `limit` sends
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_congestion(self):
+        """Slow reply or 4xx response: back off multiplicatively."""
+        with self._lock:
+            now = time.monotonic()
+            # Sends already in flight report the same congestion, only react once per window
+            if now - self._last_decrease < self.latency_target:
+                return
+            self._last_decrease = now
+            self.limit = max(self.minimum, self.limit * self.decrease_factor)
+
+
+# Replies meaning "slow down" rather than a problem with one message
+THROTTLE_CODES = (421, 450, 451, 452)
+
+
+def smtp_reply_codes(error: Exception) -> List[int]:
+    """SMTP reply codes carried by an smtplib exception."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return [code for code, _ in error.recipients.values()]
+    if isinstance(error, smtplib.SMTPResponseException):
+        return [error.smtp_code]
+    return []
+
+
+def is_throttling_reply(error: Exception) -> bool:
+    """True when the server asks to slow down (rate limit, too many connections)."""
+    return any(code in THROTTLE_CODES for code in smtp_reply_codes(error))
+
+
+def is_temporary_failure(error: Exception) -> bool:
+    """True for 4xx SMTP replies (throttling, greylisting, mailbox busy)."""
+    codes = smtp_reply_codes(error)
+    return bool(codes) and all(400 <= code < 500 for code in codes)
+
@@ -0,0 +1,148 @@
+"""
+Local SMTP sink for MERCI RAYMOND Email Automation.
+
+A small asyncio SMTP server that accepts every message and keeps it in
+memory. It stands in for Gmail in tests and benchmarks and can simulate
+slow relays (latency) and temporary 4xx refusals.
+"""
+
+import asyncio
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+class SMTPSink:
+    """In-memory SMTP server running its own event loop in a background thread."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 temporary_failures: int = 0, failure_code: int = 451):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.temporary_failures = temporary_failures
+        self.failure_code = failure_code
+        self.messages: List[Dict[str, object]] = []
+        self.connections = 0
+
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    # Server lifecycle -------------------------------------------------
+
+    def start(self) -> 'SMTPSink':
+        """Start the server thread and wait until it is listening."""
+        self._thread = threading.Thread(target=self._run, name='smtp-sink', daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def stop(self):
+        """Stop the server and its event loop."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(5)
+
+    def __enter__(self) -> 'SMTPSink':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(self.start_server())
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+    async def start_server(self):
+        """Listen on host/port from the current event loop (usable directly from asyncio code)."""
+        server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        return server
+
+    # SMTP dialogue ------------------------------------------------------
+
+    def _take_failure(self) -> bool:
+        with self._lock:
+            if self.temporary_failures > 0:
+                self.temporary_failures -= 1
+                return True
+            return False
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        with self._lock:
+            self.connections += 1
+
+        def reply(line: str):
+            writer.write(f"{line}\r\n".encode())
+
+        reply("220 localhost SMTP sink ready")
+        sender, recipients = None, []
+        try:
+            while True:
+                await writer.drain()
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('utf-8', 'replace').strip()
+                verb = command[:4].upper()
+
+                if verb in ('EHLO', 'HELO'):
+                    reply("250-localhost")
+                    reply("250-8BITMIME")
+                    reply("250 SMTPUTF8")
+                elif verb == 'MAIL':
+                    if self._take_failure():
+                        reply(f"{self.failure_code} 4.7.0 Try again later")
+                        continue
+                    sender, recipients = command[10:].strip().strip('<>').split('>')[0], []
+                    reply("250 OK")
+                elif verb == 'RCPT':
+                    recipients.append(command[8:].strip().strip('<>').split('>')[0])
+                    reply("250 OK")
+                elif verb == 'DATA':
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    lines = []
+                    while True:
+                        data_line = await reader.readline()
+                        if not data_line or data_line in (b'.\r\n', b'.\n'):
+                            break
+                        if data_line.startswith(b'..'):
+                            data_line = data_line[1:]
+                        lines.append(data_line)
+                    if self.latency:
+                        await asyncio.sleep(self.latency)
+                    with self._lock:
+                        self.messages.append({
+                            'from': sender,
+                            'recipients': recipients,
+                            'data': b''.join(lines),
+                            'received_at': time.monotonic(),
+                        })
+                    sender, recipients = None, []
+                    reply("250 OK queued")
+                elif verb in ('RSET', 'NOOP'):
+                    sender, recipients = None, []
+                    reply("250 OK")
+                elif verb == 'QUIT':
+                    reply("221 Bye")
+                    await writer.drain()
+                    break
+                else:
+                    reply("502 Command not implemented")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,113 @@
+"""
+Compiled email templates for MERCI RAYMOND Email Automation.
+
+A campaign template is parsed once into literal segments and placeholder
+slots, so that each contact is rendered with a single join instead of one
+str.replace pass per column over the whole body.
+"""
+
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Any {...} token without nested braces is a placeholder slot
+PLACEHOLDER_PATTERN = re.compile(r'\{([^{}]*)\}')
+
+# What verification flags in a finished email
+LEFTOVER_PATTERN = re.compile(r'\{[^}]*\}')
+
+# Contact keys that are never substituted into the email
+RESERVED_KEYS = frozenset({'email', 'index'})
+
+_MISSING = object()
+
+
+class CompiledTemplate:
+    """Template split into literals and slots, rendered in one pass per contact."""
+
+    __slots__ = ('literals', 'slots', 'value_filter', 'literal_braces')
+
+    def __init__(self, text: str, value_filter: Optional[Callable[[str], str]] = None):
+        literals: List[str] = []
+        slots: List[str] = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            literals.append(text[position:match.start()])
+            slots.append(match.group(1))
+            position = match.end()
+        literals.append(text[position:])
+
+        # literals always has one more entry than slots
+        self.literals: Tuple[str, ...] = tuple(literals)
+        self.slots: Tuple[str, ...] = tuple(slots)
+        self.value_filter = value_filter
+        # A brace left in the text ({{Nom}}) can frame a value into a {placeholder}
+        self.literal_braces = any('{' in literal for literal in self.literals)
+
+    @property
+    def placeholders(self) -> List[str]:
+        """Distinct placeholder names used by the template, in order of appearance."""
+        return list(dict.fromkeys(self.slots))
+
+    @property
+    def source(self) -> str:
+        """The template text, with every slot written back as {name}."""
+        parts = [self.literals[0]]
+        for name, literal in zip(self.slots, self.literals[1:]):
+            parts.append(f"{{{name}}}")
+            parts.append(literal)
+        return ''.join(parts)
+
+    def render(self, contact_data: Dict[str, str], fallbacks: Optional[Dict[str, str]] = None) -> str:
+        """
+        Render the template for one contact.
+        Slots missing from the contact fall back to `fallbacks`, otherwise the
+        original {placeholder} is kept so that verification can flag it.
+        """
+        return self._render(contact_data, fallbacks, None)
+
+    def render_with_report(self, contact_data: Dict[str, str],
+                           fallbacks: Optional[Dict[str, str]] = None) -> Tuple[str, Dict[str, List[str]]]:
+        """
+        Render like render() and report, per slot name, what could not be filled:
+            'missing': no such column for this contact (the {placeholder} is kept)
+            'empty':   the column exists but the cell is empty
+            'braces':  the value itself contains a {
+        and, under 'leftover', the {...} tokens of the rendered text that come
+        from braces of the template text itself (e.g. {{Nom}} -> {Marie}).
+        """
+        report = {'missing': [], 'empty': [], 'braces': [], 'leftover': []}
+        rendered = self._render(contact_data, fallbacks, report)
+        if self.literal_braces:
+            # Rare: scanned like a finished email, minus the tokens already reported as missing
+            missing = {f"{{{name}}}" for name in report['missing']}
+            report['leftover'] = [token for token in LEFTOVER_PATTERN.findall(rendered) if token not in missing]
+        return rendered, report
+
+    def _render(self, contact_data: Dict[str, str], fallbacks: Optional[Dict[str, str]],
+                report: Optional[Dict[str, List[str]]]) -> str:
+        literals = self.literals
+        value_filter = self.value_filter
+        parts = [literals[0]]
+
+        for i, name in enumerate(self.slots, 1):
+            # One lookup per slot: contacts may be dicts or ContactTable row views
+            value = _MISSING if name in RESERVED_KEYS else contact_data.get(name, _MISSING)
+            if value is not _MISSING:
+                value = str(value) if value else ""
+                if report is not None:
+                    if not value:
+                        report['empty'].append(name)
+                    elif '{' in value:
+                        report['braces'].append(name)
+                if value_filter is not None and value:
+                    value = value_filter(value)
+            elif fallbacks and name in fallbacks:
+                value = fallbacks[name]
+            else:
+                value = f"{{{name}}}"
+                if report is not None:
+                    report['missing'].append(name)
+            parts.append(value)
+            parts.append(literals[i])
+
+        return ''.join(parts)
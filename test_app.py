@@ -38,10 +38,9 @@ def test_email_automation():
         print("-" * 40)
 
         # Test simple personalization
-        personalized = automation.personalize_email_simple(
-            contact['contact'],
-            contact['site'],
-            contact['company']
+        personalized = automation.personalize_email(
+            {**contact, 'contact_name': contact['contact']},
+            automation.base_email_content_text
         )
 
         print("📧 Email personnalisé:")
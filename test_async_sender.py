@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+End-to-end tests for the asyncio send engine against the local SMTP sink
+"""
+
+import asyncio
+import threading
+import time
+
+from async_sender import AsyncSendEngine
+from smtp_policy import Pacer
+from smtp_sink import SMTPSink
+
+
+def _build_job(i):
+    return {
+        'from_addr': 'equipe@merciraymond.fr',
+        'recipients': [f'contact{i}@example.com'],
+        'message': f'Subject: Test {i}\n\n.ligne avec un point\nBonjour {i}',
+    }
+
+
+def test_engine_sends_and_scales_on_one_loop():
+    """Messages arrive intact and more sessions send faster on the same loop"""
+    async def scenario():
+        sink = SMTPSink(latency=0.05)
+        server = await sink.start_server()
+        timings = {}
+        try:
+            for connections in (1, 4):
+                engine = AsyncSendEngine(sink.host, sink.port, max_connections=connections,
+                                         initial_connections=connections, use_starttls=False)
+                start = time.perf_counter()
+                summary = await engine.run(range(16), build_job=_build_job)
+                timings[connections] = time.perf_counter() - start
+                assert summary['sent'] == 16 and summary['failed'] == 0
+        finally:
+            server.close()
+        return sink, timings
+
+    sink, timings = asyncio.run(scenario())
+
+    assert len(sink.messages) == 32
+    assert sink.messages[0]['data'] == b'Subject: Test 0\r\n\r\n.ligne avec un point\r\nBonjour 0\r\n'
+    assert timings[4] < timings[1] / 2
+
+
+def test_two_campaigns_and_cancellation():
+    """Two engines share a loop; a cancelled one stops during its pacing wait"""
+    async def scenario():
+        sink = SMTPSink()
+        server = await sink.start_server()
+        try:
+            fast = AsyncSendEngine(sink.host, sink.port, use_starttls=False)
+            slow = AsyncSendEngine(sink.host, sink.port, use_starttls=False, pacer=Pacer(0.2))
+            asyncio.get_running_loop().call_later(0.5, slow.cancel)
+            return await asyncio.gather(fast.run(range(5), _build_job), slow.run(range(100), _build_job))
+        finally:
+            server.close()
+
+    fast_summary, slow_summary = asyncio.run(scenario())
+
+    assert fast_summary['sent'] == 5 and not fast_summary['cancelled']
+    assert slow_summary['cancelled']
+    assert slow_summary['sent'] < 10
+
+
+def test_pacing_is_global_and_temporary_failures_back_off():
+    """The anti-spam delay bounds all sessions together; 4xx replies are retried and halve the limit"""
+    async def scenario():
+        sink = SMTPSink(temporary_failures=2)
+        server = await sink.start_server()
+        try:
+            engine = AsyncSendEngine(sink.host, sink.port, max_connections=4, initial_connections=4,
+                                     use_starttls=False, latency_target=5, pacer=Pacer(0.1))
+            results = []
+            start = time.perf_counter()
+            summary = await engine.run(range(3), _build_job, on_result=results.append)
+            return engine, summary, results, time.perf_counter() - start
+        finally:
+            server.close()
+
+    engine, summary, results, elapsed = asyncio.run(scenario())
+
+    assert summary['sent'] == 3 and summary['failed'] == 0
+    assert sum(result['attempts'] for result in results) == 3 + 2
+    assert engine.controller.limit < 4
+    # Five paced attempts, whatever the number of sessions
+    assert elapsed >= 0.4
+
+
+def test_failing_build_or_callback_does_not_stop_the_campaign():
+    """A message that cannot be built fails alone, and a raising on_result does not hang run()"""
+    def build_job(i):
+        if i == 2:
+            raise KeyError('site')
+        return _build_job(i)
+
+    results = []
+
+    def on_result(result):
+        results.append(result)
+        if result['item'] == 4:
+            raise RuntimeError('journal indisponible')
+
+    async def scenario():
+        sink = SMTPSink()
+        server = await sink.start_server()
+        try:
+            engine = AsyncSendEngine(sink.host, sink.port, use_starttls=False)
+            return await asyncio.wait_for(engine.run(range(6), build_job=build_job, on_result=on_result), 10)
+        finally:
+            server.close()
+
+    summary = asyncio.run(scenario())
+
+    assert (summary['sent'], summary['failed'], summary['callback_errors']) == (5, 1, 1)
+    failed = [result for result in results if not result['success']]
+    assert [(result['item'], result['job']) for result in failed] == [(2, None)]
+    assert isinstance(failed[0]['error'], KeyError)
+
+
+def test_items_are_pulled_off_the_loop_and_none_jobs_left_out():
+    """A lazy iterable is pulled in the executor; items build_job returns None for get no result"""
+    threads = set()
+
+    def items():
+        for i in range(6):
+            threads.add(threading.get_ident())
+            yield i
+
+    results = []
+
+    async def scenario():
+        sink = SMTPSink()
+        server = await sink.start_server()
+        try:
+            engine = AsyncSendEngine(sink.host, sink.port, use_starttls=False)
+            summary = await engine.run(items(), build_job=lambda i: None if i % 2 else _build_job(i),
+                                       on_result=results.append)
+            return summary, threading.get_ident()
+        finally:
+            server.close()
+
+    summary, loop_thread = asyncio.run(scenario())
+
+    assert (summary['sent'], summary['failed']) == (3, 0)
+    assert sorted(result['item'] for result in results) == [0, 2, 4]
+    assert threads and loop_thread not in threads
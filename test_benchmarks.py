@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Smoke test for the pipeline benchmark, so it keeps working as the code changes
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+from bench_pipeline import STAGES, compare, run_benchmark  # noqa: E402
+
+
+def test_every_stage_runs_on_a_small_workbook(tmp_path):
+    """French columns are mapped, invalid and duplicate rows dropped, every message reaches the sink"""
+    results = run_benchmark(200, repeat=1, cache_dir=str(tmp_path), send_limit=20)
+
+    assert list(results) == STAGES
+    assert results['parse']['items'] == 200
+    assert 180 < results['extraction']['items'] < 200
+    assert results['personalize']['items'] == results['mime']['items'] == results['extraction']['items']
+    assert results['send']['items'] == 20
+    assert all(measures['seconds'] > 0 and measures['peak_mb'] >= 0 for measures in results.values())
+
+    slower = {'sizes': {'200': {stage: {**m, 'seconds': m['seconds'] * 2} for stage, m in results.items()}}}
+    assert compare({'sizes': {'200': results}}, {'sizes': {'200': results}}, 0.25) == []
+    assert len(compare(slower, {'sizes': {'200': results}}, 0.25)) == len(STAGES)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tests for the headless campaign runner against the local SMTP sink
+"""
+
+import email
+import json
+
+import pandas as pd
+
+from campaign_cli import main
+from smtp_sink import SMTPSink
+
+
+def _write_campaign(tmp_path):
+    workbook = tmp_path / 'contacts.xlsx'
+    pd.DataFrame({
+        'Email': ['marie@test.com', 'jean@test.com', 'paul@test.com', 'invalide'],
+        'Prénom': ['Marie', 'Jean', 'Paul', 'X'],
+        'Nom': ['Dupont', 'Martin', 'Durand', 'Y'],
+        'Entreprise': ['Raymond SA', 'Jardins & Co', '{à compléter}', 'Z'],
+    }).to_excel(workbook, index=False)
+    template = tmp_path / 'email.txt'
+    template.write_text("Votre entreprise {Entreprise} mérite un jardin.", encoding='utf-8')
+    return workbook, template
+
+
+def _events(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_dry_run_reports_invalid_contacts(tmp_path, capsys):
+    """Contacts whose email still contains a placeholder are reported and not counted as valid"""
+    workbook, template = _write_campaign(tmp_path)
+
+    assert main([str(workbook), '--template', str(template), '--dry-run']) == 0
+    events = _events(capsys)
+
+    assert events[0]['event'] == 'parsed' and events[0]['rows'] == 4
+    assert events[1]['event'] == 'loaded' and events[1]['valid_emails'] == 3
+    assert [e['email'] for e in events if e['event'] == 'invalid'] == ['paul@test.com']
+    assert events[-1] == {**events[-1], 'event': 'summary', 'valid': 2, 'invalid': 1}
+
+
+def test_campaign_is_sent_to_sink(tmp_path, capsys):
+    """Valid emails go through the send path with progress lines and a throughput summary"""
+    workbook, template = _write_campaign(tmp_path)
+
+    with SMTPSink() as sink:
+        code = main([str(workbook), '--template', str(template), '--sender', 'equipe@merciraymond.fr',
+                     '--smtp-host', sink.host, '--smtp-port', str(sink.port), '--no-starttls',
+                     '--delay', '0', '--connections', '2', '--header', 'Bonjour {Prénom},'])
+    events = _events(capsys)
+
+    assert code == 0
+    assert sorted(e['email'] for e in events if e['event'] == 'sent') == ['jean@test.com', 'marie@test.com']
+    summary = events[-1]
+    assert summary['event'] == 'summary' and summary['sent'] == 2 and summary['failed'] == 0
+    assert summary['invalid'] == 1 and summary['bytes_sent'] > 0
+
+    messages = {m['recipients'][0]: email.message_from_bytes(m['data']) for m in sink.messages}
+    html = [part for part in messages['marie@test.com'].walk() if part.get_content_type() == 'text/html'][0]
+    body = html.get_payload(decode=True).decode('utf-8')
+    assert 'Bonjour Marie,' in body and 'Raymond SA' in body
+
+
+def test_campaign_metrics_are_exported(tmp_path, capsys):
+    """Render, MIME, pacing and SMTP stages are timed and written as Prometheus and JSON files"""
+    workbook, template = _write_campaign(tmp_path)
+
+    with SMTPSink() as sink:
+        assert main([str(workbook), '--template', str(template), '--sender', 'equipe@merciraymond.fr',
+                     '--smtp-host', sink.host, '--smtp-port', str(sink.port), '--no-starttls',
+                     '--delay', '0', '--metrics-dir', str(tmp_path / 'metriques')]) == 0
+    metrics = [e for e in _events(capsys) if e['event'] == 'metrics'][0]
+
+    assert metrics['sent'] == 2 and metrics['bytes_sent'] == sum(len(m['data']) for m in sink.messages)
+    assert all(metrics['stages'][stage]['count'] == 2 for stage in ('mime', 'pacing', 'smtp'))
+    assert metrics['stages']['render']['count'] >= 3
+    assert json.load(open(metrics['json_file'], encoding='utf-8'))['sent'] == 2
+    assert 'merci_raymond_messages_total' in open(metrics['prometheus_file'], encoding='utf-8').read()
+
+
+def test_journal_resumes_campaign(tmp_path, capsys):
+    """Running the same campaign again with its journal sends nothing twice"""
+    workbook, template = _write_campaign(tmp_path)
+    journal = str(tmp_path / 'journal.db')
+
+    with SMTPSink() as sink:
+        argv = [str(workbook), '--template', str(template), '--sender', 'equipe@merciraymond.fr',
+                '--smtp-host', sink.host, '--smtp-port', str(sink.port), '--no-starttls',
+                '--delay', '0', '--journal', journal]
+        assert main(argv + ['--limit', '1']) == 0
+        assert main(argv) == 0
+    events = _events(capsys)
+
+    resumes = [e for e in events if e['event'] == 'resume']
+    assert resumes[0]['already_sent'] == 0 and resumes[1]['already_sent'] == 1
+    assert sorted(m['recipients'][0] for m in sink.messages) == ['jean@test.com', 'marie@test.com']
+    message_ids = [email.message_from_bytes(m['data'])['Message-ID'] for m in sink.messages]
+    assert all(mid.endswith('@merciraymond.fr>') for mid in message_ids)
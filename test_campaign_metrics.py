@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for the per-stage campaign metrics and their exports
+"""
+
+import asyncio
+import json
+
+from async_sender import AsyncSendEngine
+from campaign_metrics import CampaignMetrics, percentile
+from smtp_policy import Pacer
+from smtp_sink import SMTPSink
+
+
+def test_percentiles_and_prometheus_histogram(tmp_path):
+    """Stage percentiles are exact, histogram buckets are cumulative and the files are written"""
+    metrics = CampaignMetrics('campagne-noel', buckets=(0.01, 0.1, 1.0))
+    for latency in [0.005] * 50 + [0.05] * 45 + [0.5] * 4 + [2.0]:
+        metrics.observe('smtp', latency)
+    metrics.record_result(True, 1000)
+    metrics.record_result(False)
+    metrics.finish()
+
+    summary = metrics.summary()
+    assert summary['smtp_latency'] == {'p50': 0.005, 'p95': 0.05, 'p99': 0.5}
+    assert summary['stages']['smtp']['count'] == 100 and summary['stages']['render']['count'] == 0
+    assert summary['sent'] == 1 and summary['failed'] == 1 and summary['bytes_sent'] == 1000
+    assert percentile([], 99) == 0.0
+
+    text = metrics.prometheus()
+    labels = 'campaign="campagne-noel",stage="smtp"'
+    assert f'merci_raymond_stage_seconds_bucket{{{labels},le="0.01"}} 50' in text
+    assert f'merci_raymond_stage_seconds_bucket{{{labels},le="1.0"}} 99' in text
+    assert f'merci_raymond_stage_seconds_bucket{{{labels},le="+Inf"}} 100' in text
+    assert 'merci_raymond_smtp_latency_seconds{campaign="campagne-noel",quantile="0.95"} 0.05' in text
+    assert 'merci_raymond_messages_total{campaign="campagne-noel",result="failed"} 1' in text
+
+    prometheus_path, json_path = metrics.write(str(tmp_path))
+    assert open(prometheus_path, encoding='utf-8').read() == text
+    assert json.load(open(json_path, encoding='utf-8'))['smtp_latency']['p99'] == 0.5
+
+
+def test_engine_records_pacing_smtp_and_bytes():
+    """Every send is timed, paced waits included, and the delivered bytes add up"""
+    jobs = [{'from_addr': 'equipe@merciraymond.fr', 'recipients': [f'c{i}@example.com'],
+             'message': f'Subject: Test {i}\r\n\r\nBonjour'} for i in range(4)]
+    metrics = CampaignMetrics('campagne-test')
+
+    with SMTPSink(latency=0.02) as sink:
+        engine = AsyncSendEngine(sink.host, sink.port, use_starttls=False, pacer=Pacer(0.05), metrics=metrics)
+        asyncio.run(engine.run(jobs))
+
+    summary = metrics.summary()
+    assert summary['sent'] == 4 and summary['bytes_sent'] == sum(len(job['message']) for job in jobs)
+    assert summary['stages']['smtp']['count'] == 4 and summary['smtp_latency']['p50'] >= 0.02
+    assert summary['stages']['pacing']['count'] == 4 and summary['stages']['pacing']['total_seconds'] >= 0.14
+    assert summary['messages_per_second'] > 0 and summary['bytes_per_second'] > 0
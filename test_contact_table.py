@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tests for the columnar contact table and its row views
+"""
+
+import pickle
+
+import pandas as pd
+
+from contact_table import ContactRow, ContactTable
+from email_core import EmailAutomation
+
+
+def test_rows_read_like_contact_dicts():
+    """Absent cells are missing keys; rows compare, copy and pickle as plain dicts"""
+    table = ContactTable({
+        'email': ['marie@test.com', 'jean@test.com'],
+        'Nom': ['Marie Dupont', 'Jean'],
+        'Nom_last': ['Dupont', None],
+    })
+    marie, jean = table
+
+    assert marie == {'email': 'marie@test.com', 'Nom': 'Marie Dupont', 'Nom_last': 'Dupont'}
+    assert 'Nom_last' not in jean and jean.get('Nom_last', '?') == '?' and len(jean) == 2
+    assert {**jean, 'position': 1} == {'email': 'jean@test.com', 'Nom': 'Jean', 'position': 1}
+    assert table[-1].position == 1 and isinstance(table[0], ContactRow)
+    assert type(pickle.loads(pickle.dumps(jean))) is dict
+    assert pickle.loads(pickle.dumps(table)) == table == ContactTable.from_records(table.to_records())
+
+    assert table.project(['Nom', 'Nom_last']) == [('Marie Dupont', 'Dupont'), {'Nom': 'Jean'}]
+    assert table.project(['Ville']) == [{}, {}]
+    assert table[1:].project(['email']) == [('jean@test.com',)]
+
+
+def test_extraction_returns_a_table_with_the_same_contacts():
+    """Column storage keeps the per-contact keys, including absent first/last names"""
+    df = pd.DataFrame({
+        'Email': ['marie@test.com', 'jean@test.com', 'invalide'],
+        'Nom': ['Marie Dupont', None, 'X Y'],
+        'Ville': ['Lyon', 'Paris', 'Nice'],
+    })
+
+    contacts = EmailAutomation().get_valid_emails_from_df(df)
+
+    assert isinstance(contacts, ContactTable) and len(contacts) == 2
+    assert contacts == [
+        {'index': 0, 'email': 'marie@test.com', 'Nom': 'Marie Dupont', 'Ville': 'Lyon',
+         'Nom_first': 'Marie', 'Nom_last': 'Dupont'},
+        {'index': 1, 'email': 'jean@test.com', 'Nom': '', 'Ville': 'Paris'},
+    ]
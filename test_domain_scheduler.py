@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Tests for the recipient-domain interleaving and spacing
+"""
+
+import asyncio
+import time
+
+from async_sender import AsyncSendEngine
+from domain_scheduler import interleave_by_domain, recipient_domain
+from smtp_sink import SMTPSink
+
+
+def test_domains_are_spread_over_the_queue():
+    """A file sorted by company no longer sends a run to one domain; order is kept within a domain"""
+    emails = ([f'c{i}@jardins.fr' for i in range(5)] + [f'c{i}@raymond.fr' for i in range(3)]
+              + ['paul@Mairie-Lyon.FR'])
+    items = [{'email': email} for email in emails]
+
+    ordered = [item['email'] for item in interleave_by_domain(items)]
+
+    assert sorted(ordered) == sorted(emails)
+    assert [e for e in ordered if e.endswith('@jardins.fr')] == emails[:5]
+    domains = [recipient_domain(e) for e in ordered]
+    assert all(a != b for a, b in zip(domains, domains[1:]))
+    assert domains[0] == domains[-1] == 'jardins.fr' and 'mairie-lyon.fr' in domains
+
+
+def test_engine_spaces_sends_to_the_same_domain():
+    """Two messages for one domain are spaced even with several connections; other domains are not held"""
+    jobs = [{'from_addr': 'equipe@merciraymond.fr', 'recipients': [address],
+             'message': 'Subject: Test\r\n\r\nBonjour'}
+            for address in ('a@jardins.fr', 'b@jardins.fr', 'c@raymond.fr', 'd@mairie.fr')]
+    sent_at = {}
+
+    with SMTPSink() as sink:
+        engine = AsyncSendEngine(sink.host, sink.port, use_starttls=False, max_connections=4,
+                                 initial_connections=4, domain_spacing=0.3)
+        summary = asyncio.run(engine.run(
+            jobs, on_result=lambda result: sent_at.setdefault(result['job']['recipients'][0], time.monotonic())))
+
+    assert summary['sent'] == 4
+    assert sent_at['b@jardins.fr'] - sent_at['a@jardins.fr'] >= 0.29
+    # c is not held behind the spacing of jardins.fr
+    assert sent_at['c@raymond.fr'] < sent_at['b@jardins.fr']
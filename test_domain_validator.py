@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for the cached recipient domain validation
+"""
+
+import socket
+
+from domain_validator import DomainValidator, StubResolver, SystemResolver
+from email_core import EmailAutomation, process_contacts
+
+
+def test_domains_are_resolved_once_and_cached_for_ttl():
+    """Each distinct domain is looked up once; answers expire after the TTL, errors sooner"""
+    resolver = StubResolver({'nexiste-pas.fr': 'none', 'refuse.fr': 'null_mx', 'panne.fr': 'error'},
+                            delay=0.01)
+    now = [0.0]
+    validator = DomainValidator(resolver, ttl=3600, error_ttl=60, max_workers=4, clock=lambda: now[0])
+    domains = ['test.com', 'nexiste-pas.fr', 'refuse.fr', 'panne.fr', '', 'test.com'] * 50
+
+    assert validator.undeliverable(domains) == {'nexiste-pas.fr': 'none', 'refuse.fr': 'null_mx'}
+    assert validator.check('test.com') == 'mx' and validator.check('panne.fr') == 'error'
+    assert resolver.lookups == {'test.com': 1, 'nexiste-pas.fr': 1, 'refuse.fr': 1, 'panne.fr': 1}
+
+    now[0] = 120
+    validator.check_domains(domains)
+    assert resolver.lookups['panne.fr'] == 2 and resolver.lookups['test.com'] == 1
+
+    now[0] = 3601
+    validator.check_domains(domains)
+    assert resolver.lookups['test.com'] == 2
+
+
+def test_resolver_answering_none_for_everything_flags_nothing():
+    """When every domain and the probe domain are unknown, the DNS is unusable: lookup errors"""
+    validator = DomainValidator(StubResolver(default='none'))
+
+    assert validator.check_domains(['test.com', 'x.fr']) == {'test.com': 'error', 'x.fr': 'error'}
+    assert validator.undeliverable(['test.com', 'x.fr']) == {}
+
+
+def test_contacts_of_undeliverable_domains_are_invalid():
+    """process_contacts flags contacts whose domain cannot receive mail, lookup errors are not flagged"""
+    automation = EmailAutomation()
+    settings = {'email_content': "Bonjour {contact_name}", 'use_html': False}
+    contacts = [{'index': i, 'email': email, 'contact_name': 'Jean'} for i, email in
+                enumerate(['jean@test.com', 'paul@nexiste-pas.fr', 'marie@panne.fr', 'luc@nexiste-pas.fr'])]
+    resolver = StubResolver({'nexiste-pas.fr': 'none', 'panne.fr': 'error'})
+
+    processed, stats = process_contacts(automation, contacts, settings, workers=1,
+                                        domain_validator=DomainValidator(resolver))
+
+    assert [entry['is_valid'] for entry in processed] == [True, False, True, False]
+    assert processed[1]['issues'] == ("Domaine inexistant ou sans serveur mail: nexiste-pas.fr",)
+    assert stats['undeliverable_domains'] == 1 and resolver.lookups['nexiste-pas.fr'] == 1
+
+
+def test_system_resolver_never_flags_a_domain(monkeypatch):
+    """Without MX lookups, a domain with no address may still receive mail: not flagged"""
+    def no_address(*args, **kwargs):
+        raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+
+    monkeypatch.setattr(socket, 'getaddrinfo', no_address)
+
+    assert SystemResolver().resolve('mx-seulement.fr') == 'error'
+    assert DomainValidator(SystemResolver()).undeliverable(['mx-seulement.fr']) == {}
+
+
+def test_cache_keeps_the_most_recently_checked_domains():
+    """The cache is bounded: the least recently checked domain is dropped and looked up again"""
+    resolver = StubResolver()
+    validator = DomainValidator(resolver, cache_size=2)
+
+    validator.check_domains(['a.fr', 'b.fr'])
+    validator.check('a.fr')
+    validator.check('c.fr')
+    assert len(validator._cache) == 2
+
+    validator.check_domains(['a.fr', 'c.fr'])
+    assert resolver.lookups['a.fr'] == 1 and resolver.lookups['c.fr'] == 1
+    validator.check('b.fr')
+    assert resolver.lookups['b.fr'] == 2
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Tests for the side-effect-free core module
+"""
+
+import subprocess
+import sys
+
+import pandas as pd
+
+from email_core import DEFAULT_EMAIL_FOOTER, EmailAutomation, process_contacts
+
+
+def test_import_has_no_heavy_dependencies():
+    """Importing the core loads neither Streamlit nor pandas, Pillow or html2text"""
+    probe = "import sys, email_core; print(','.join(m for m in ('streamlit', 'pandas', 'PIL', 'html2text') if m in sys.modules))"
+    result = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == ''
+
+
+def test_core_runs_without_session_state():
+    """Duplicates are returned and header/footer default without Streamlit"""
+    df = pd.DataFrame({
+        'Email': ['marie@test.com', 'marie@test.com', 'jean@test.com'],
+        'Nom': ['Marie Dupont', 'Marie Dupont', 'Jean Martin'],
+    })
+    automation = EmailAutomation()
+
+    contacts, duplicates_removed = automation.extract_valid_contacts(df)
+    assert [c['email'] for c in contacts] == ['marie@test.com', 'jean@test.com']
+    assert duplicates_removed == 1
+
+    html = automation.personalize_email(contacts[0], "Bonjour {Nom_first}", use_html=True)
+    assert 'Bonjour Marie' in html
+    assert DEFAULT_EMAIL_FOOTER.split('\n')[1] in html
+
+
+def test_verification_comes_from_the_renderer():
+    """Issues name the missing column; empty cells are reported without invalidating"""
+    automation = EmailAutomation()
+    settings = {'email_content': "Votre site {site} à {Ville}", 'use_html': True,
+                'header_content': 'Bonjour {contact_name}', 'footer_content': 'Merci'}
+    contacts = [{'index': 0, 'email': 'marie@test.com', 'contact_name': 'Marie', 'site': ''}]
+
+    (contact, html, verification), = automation.iter_verified_emails(contacts, **settings)
+
+    assert html == automation.personalize_email(contact, **settings)
+    assert verification == {
+        'is_valid': False,
+        'issues': ["Placeholder trouvé: {Ville} (colonne 'Ville' absente du fichier)"],
+        'empty_fields': ['site'],
+    }
+    assert automation.verify_email_content(html)[0] is verification['is_valid']
+
+
+def test_plain_text_comes_from_the_template():
+    """The text/plain part is filled from the same slots as the HTML, not converted per message"""
+    import html2text
+
+    automation = EmailAutomation()
+    settings = {'email_content': "Votre site <b>{site}</b>\nà {Ville}", 'use_html': True,
+                'header_content': 'Bonjour {contact_name}', 'footer_content': 'Merci'}
+    contact = {'index': 0, 'email': 'marie@test.com', 'contact_name': 'Marie',
+               'site': 'Parc_du_Nord', 'Ville': 'Lyon'}
+    converter = html2text.HTML2Text()
+    converter.body_width = 0
+
+    plain = automation.personalize_plain_text(contact, **settings)
+
+    assert 'Bonjour Marie' in plain and '**Parc_du_Nord**' in plain and 'Lyon' in plain
+    assert '<' not in plain
+    # Same text as converting the message; values are kept as written (no markdown escaping)
+    expected = converter.handle(automation.personalize_email(contact, **settings))
+    assert plain == expected.replace('Parc\\_du\\_Nord', 'Parc_du_Nord')
+
+
+def test_processing_throttles_progress():
+    """Progress is reported per batch at most every interval, and once at the end with the throughput"""
+    automation = EmailAutomation()
+    settings = {'email_content': "Votre site {site}", 'use_html': True,
+                'header_content': 'Bonjour {contact_name}', 'footer_content': 'Merci'}
+    contacts = [{'index': i, 'email': f'contact{i}@test.com', 'contact_name': f'Contact {i}',
+                 'site': '' if i == 3 else f'Site {i}'} for i in range(25)]
+    calls = []
+
+    processed, stats = process_contacts(automation, contacts, settings, batch_size=10, progress_interval=0,
+                                        on_progress=lambda *args: calls.append(args))
+
+    assert [entry['position'] for entry in processed] == list(range(25))
+    assert processed[3]['empty_fields'] == ('site',) and all(entry['is_valid'] for entry in processed)
+    assert [(done, total) for done, total, _ in calls] == [(10, 25), (20, 25), (25, 25)]
+    assert stats['rows'] == 25 and stats['rows_per_second'] > 0
+
+    calls.clear()
+    process_contacts(automation, contacts, settings, batch_size=10, progress_interval=3600,
+                     on_progress=lambda *args: calls.append(args))
+    assert [(done, total) for done, total, _ in calls] == [(25, 25)]
+
+
+def test_parallel_processing_matches_sequential():
+    """Chunks rendered by a process pool give the same entries, in contact order"""
+    automation = EmailAutomation()
+    settings = {'email_content': "Votre site {site}", 'use_html': True, 'logo_file': object(),
+                'header_content': 'Bonjour {contact_name}', 'footer_content': 'Merci'}
+    contacts = [{'index': i, 'email': f'contact{i}@test.com', 'contact_name': f'Contact {i}',
+                 'site': ['', '{à compléter}', 'Parc'][i % 3]} for i in range(450)]
+
+    sequential, _ = process_contacts(automation, contacts, settings, workers=1)
+    parallel, stats = process_contacts(automation, contacts, settings, workers=2)
+
+    assert stats['workers'] == 2
+    assert parallel == sequential
+    assert [entry['is_valid'] for entry in parallel[:3]] == [True, False, True]
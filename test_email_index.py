@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Tests for email normalization and the memory-mapped suppression list
+"""
+
+import pandas as pd
+
+from email_core import EmailAutomation, filter_suppressed
+from email_index import SuppressionList, main, normalize_email, write_suppression_file
+
+
+def test_same_recipient_written_differently_is_one_contact():
+    """Case, surrounding (invisible) spaces and IDN domains are normalized before deduplication"""
+    assert normalize_email('\u200b Jean.Dupont@Café.FR\xa0') == 'jean.dupont@xn--caf-dma.fr'
+
+    df = pd.DataFrame({
+        'Email': ['Jean@X.fr', 'jean@x.fr ', 'marie@café.fr', 'MARIE@xn--caf-dma.fr', 'paul@test.com'],
+        'Nom': ['Jean Martin', 'Jean Martin', 'Marie Dupont', 'Marie Dupont', 'Paul Durand'],
+    })
+    contacts, duplicates_removed = EmailAutomation().extract_valid_contacts(df)
+
+    assert contacts.column('email') == ['jean@x.fr', 'marie@xn--caf-dma.fr', 'paul@test.com']
+    assert contacts.column('index') == [0, 2, 4] and duplicates_removed == 2
+
+
+def test_suppression_list_is_merged_and_filters_contacts(tmp_path):
+    """Addresses are matched whatever their spelling; adding addresses keeps the previous ones"""
+    path = str(tmp_path / 'suppression.bin')
+    assert write_suppression_file(path, ['Jean@X.fr', 'inconnu@nulle-part.fr']) == 2
+    assert write_suppression_file(path, [' PAUL@test.com', 'jean@x.fr', '']) == 3
+
+    df = pd.DataFrame({'Email': ['jean@x.fr', 'marie@test.com', 'paul@test.com']})
+    contacts, _ = EmailAutomation().extract_valid_contacts(df)
+    with SuppressionList(path) as suppression:
+        assert len(suppression) == 3 and 'JEAN@x.fr ' in suppression and 'marie@test.com' not in suppression
+        kept, suppressed = filter_suppressed(contacts, suppression)
+
+    assert suppressed == 2 and kept == [{'index': 1, 'email': 'marie@test.com', 'contact_name': 'Contact'}]
+
+    addresses = tmp_path / 'desinscrits.csv'
+    addresses.write_text("email,date\nmarie@test.com,2024-11-02\n", encoding='utf-8')
+    assert main(['add', path, str(addresses), '--replace']) == 0
+    with SuppressionList(path) as suppression:
+        assert suppression.contains_many(['marie@test.com', 'jean@x.fr']) == [True, False]
@@ -42,6 +42,28 @@ def test_column_detection():
 
     return len(valid_contacts) > 0
 
+def test_contact_extraction_dedup_and_names():
+    """Test columnar extraction: stripping, validation, name split and dedup"""
+    print("\n📇 Testing Contact Extraction...")
+
+    df = pd.DataFrame({
+        'Nom du Contact': ['Marie Dupont', ' Jean  Pierre Martin ', None, 'Sophie'],
+        'Email': [' marie@test.com ', 'jean@company.fr', 'invalide', 'marie@test.com'],
+        'Site': ['Bureau Paris', None, 'Site Lyon', 'Usine Marseille'],
+    })
+    automation = EmailAutomation()
+
+    contacts = automation.get_valid_emails_from_df(df)
+    print(f"✅ Contacts extracted: {[c['email'] for c in contacts]}")
+
+    assert [c['email'] for c in contacts] == ['marie@test.com', 'jean@company.fr']
+    assert contacts[0]['Nom du Contact_first'] == 'Marie'
+    assert contacts[1]['Nom du Contact_last'] == 'Pierre Martin'
+    assert contacts[1]['Site'] == ''
+    assert contacts[1]['index'] == 1
+
+    return True
+
 def test_personalization():
     """Test the improved personalization system"""
     print("\n✏️ Testing Personalization...")
@@ -80,6 +102,72 @@ L'équipe MERCI RAYMOND"""
 
     return "Marie" in text_result and "<!DOCTYPE html" in html_result
 
+def test_compress_image_cache():
+    """Test that the same image is compressed once and then served from cache"""
+    print("\n🖼️ Testing Image Compression Cache...")
+    import io
+    from PIL import Image
+    import email_core
+
+    class UploadedImage:
+        def __init__(self, data, name):
+            self._data = data
+            self.name = name
+
+        def getvalue(self):
+            return self._data
+
+    buffer = io.BytesIO()
+    Image.new('RGBA', (2400, 1200), (46, 125, 50, 200)).save(buffer, format='PNG')
+    image = UploadedImage(buffer.getvalue(), 'logo.png')
+    automation = EmailAutomation()
+
+    first = automation.compress_image(image)
+    cache_size = len(email_core._compressed_image_cache)
+    second = EmailAutomation().compress_image(UploadedImage(buffer.getvalue(), 'autre.png'))
+    print(f"✅ Compressed size: {len(first.getvalue())} bytes, cache entries: {cache_size}")
+
+    assert second.getvalue() is first.getvalue()
+    assert second.name == 'autre.png'
+    assert len(email_core._compressed_image_cache) == cache_size
+    assert Image.open(io.BytesIO(first.getvalue())).size == (1600, 800)
+
+    return True
+
+def test_lazy_rendering():
+    """Test that processed entries re-render the same email from the compiled template"""
+    print("\n💤 Testing Lazy Rendering...")
+    import types
+    from email_automation_app import render_processed_email
+
+    automation = EmailAutomation()
+    contacts = [
+        {'index': 0, 'email': 'marie@test.com', 'contact_name': 'Marie Dupont', 'site': 'Bureau Paris'},
+        {'index': 1, 'email': 'jean@test.com', 'contact_name': 'Jean Martin', 'site': 'Site Lyon'},
+    ]
+    settings = {
+        'email_content': "Votre {site}\n\nMerci",
+        'use_html': True,
+        'logo_file': None,
+        'decorative_image_file': None,
+        'header_content': "Bonjour {contact_name},",
+        'footer_content': "Cordialement"
+    }
+
+    messages = automation.iter_personalized_emails(contacts, **settings)
+    assert isinstance(messages, types.GeneratorType)
+    rendered = [personalized for _, personalized in messages]
+
+    entry = {'position': 1, 'email': 'jean@test.com', 'is_valid': True, 'issues': []}
+    email_data = render_processed_email(entry, automation, contacts, settings)
+    print(f"✅ Re-rendered email for {email_data['email']}")
+
+    assert email_data['personalized_email'] == rendered[1]
+    assert 'Site Lyon' in email_data['personalized_email']
+    assert email_data['contact_name'] == 'Jean Martin'
+
+    return True
+
 def test_verification():
     """Test email content verification"""
     print("\n🔍 Testing Verification...")
@@ -105,7 +193,10 @@ def main():
 
     tests = [
         ("Column Detection", test_column_detection),
+        ("Contact Extraction", test_contact_extraction_dedup_and_names),
         ("Personalization", test_personalization),
+        ("Image Compression Cache", test_compress_image_cache),
+        ("Lazy Rendering", test_lazy_rendering),
         ("Verification", test_verification)
     ]
 
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Tests for the contact file ingestion engines
+"""
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from email_core import EmailAutomation
+from ingestion import available_engines, read_contacts
+
+
+def _workbook(path):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['Nom du Contact', 'Email', None, 'Email', 'Ville'])
+    sheet.append(['Marie Dupont', 'marie@test.com', 'x', 'marie2@test.com', 'Paris'])
+    sheet.append(['Jean Martin', 'jean@test.com', None, None, None])
+    sheet.append(['Sophie', 'sophie@test.com', None, None, 75])
+    sheet.cell(row=8, column=9, value=None)  # blank cells past the data
+    workbook.save(path)
+
+
+def test_streaming_matches_read_excel(tmp_path):
+    """Read-only openpyxl gives the same frame, mapping and contacts as pd.read_excel"""
+    path = tmp_path / 'contacts.xlsx'
+    _workbook(path)
+    expected = pd.read_excel(path)
+
+    df, stats = read_contacts(str(path), engine='openpyxl-streaming')
+
+    assert list(df.columns) == list(expected.columns) == ['Nom du Contact', 'Email', 'Unnamed: 2', 'Email.1', 'Ville']
+    pd.testing.assert_frame_equal(df.fillna(-1), expected.fillna(-1), check_dtype=False)
+    automation = EmailAutomation()
+    assert automation.detect_column_mapping(df) == automation.detect_column_mapping(expected)
+    assert automation.get_valid_emails_from_df(df) == automation.get_valid_emails_from_df(expected)
+    assert stats['engine'] == 'openpyxl-streaming' and stats['rows'] == 3 and stats['rows_per_second'] > 0
+
+
+def test_flat_files_and_engine_choice(tmp_path):
+    """CSV and Parquet load natively; unknown formats and engines are refused"""
+    frame = pd.DataFrame({'Email': ['marie@test.com', 'jean@test.com'], 'Société': ['ABC', 'XYZ']})
+    frame.to_csv(tmp_path / 'contacts.csv', index=False)
+    frame.to_parquet(tmp_path / 'contacts.parquet', index=False)
+
+    for name in ('contacts.csv', 'contacts.parquet'):
+        df, stats = read_contacts(str(tmp_path / name))
+        pd.testing.assert_frame_equal(df, frame)
+        assert stats['engine'] == name.split('.')[1]
+
+    assert available_engines('contacts.xlsx')[-2:] == ['openpyxl-streaming', 'openpyxl']
+    with pytest.raises(ValueError):
+        read_contacts(str(tmp_path / 'contacts.csv'), engine='openpyxl')
+    with pytest.raises(ValueError):
+        read_contacts('contacts.txt')
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Tests for the campaign-level MIME skeleton
+"""
+
+import email
+from email.mime.application import MIMEApplication
+from email.mime.image import MIMEImage
+
+from mime_skeleton import MessageSkeleton
+
+# Smallest valid GIF, enough for MIMEImage to detect the image type
+GIF_BYTES = b'GIF89a\x01\x00\x01\x00\x00\x00\x00;'
+
+
+def _skeleton():
+    logo = MIMEImage(GIF_BYTES)
+    logo.add_header('Content-ID', '<logo>')
+    logo.add_header('Content-Disposition', 'inline', filename='logo.jpg')
+    pdf = MIMEApplication(b'%PDF-1.4 catalogue de Noel')
+    pdf.add_header('Content-Disposition', 'attachment', filename='catalogue.pdf')
+    return MessageSkeleton([logo], [pdf])
+
+
+def test_rendered_message_structure():
+    """Recipient parts are spliced into the same tree as the per-recipient MIME build"""
+    raw = _skeleton().render(
+        {'From': 'equipe@merciraymond.fr', 'To': 'marie@test.com', 'Subject': 'Offre de Noël', 'Cc': ''},
+        'Bonjour Marie', '<p>Bonjour <strong>Marie</strong></p>'
+    )
+    message = email.message_from_bytes(raw)
+
+    assert [part.get_content_type() for part in message.walk()] == [
+        'multipart/mixed', 'multipart/alternative', 'text/plain',
+        'multipart/related', 'text/html', 'image/gif', 'application/octet-stream'
+    ]
+    assert message['To'] == 'marie@test.com'
+    assert message['Cc'] is None
+    assert str(email.header.make_header(email.header.decode_header(message['Subject']))) == 'Offre de Noël'
+
+    parts = list(message.walk())
+    assert parts[2].get_payload(decode=True).decode('utf-8') == 'Bonjour Marie'
+    assert parts[4].get_payload(decode=True).decode('utf-8') == '<p>Bonjour <strong>Marie</strong></p>'
+    assert parts[5]['Content-ID'] == '<logo>'
+    assert parts[6].get_filename() == 'catalogue.pdf'
+    assert not any(part.defects for part in parts)
+
+
+def test_shared_parts_are_serialized_once():
+    """Two recipients share the exact same pre-encoded attachment bytes"""
+    skeleton = _skeleton()
+    first = skeleton.render({'To': 'a@test.com'}, 'A', '<p>A</p>')
+    second = skeleton.render({'To': 'b@test.com'}, 'B', '<p>B</p>')
+
+    assert first.endswith(skeleton._after_html) and second.endswith(skeleton._after_html)
+    assert b'\r\n' in first and b'\n' not in first.replace(b'\r\n', b'')
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for the disk-backed store of processed contacts
+"""
+
+from email_core import EmailAutomation, process_contacts, render_processed_email
+from processed_store import ProcessedStore, StoredContacts
+
+
+def _process(count=50):
+    automation = EmailAutomation()
+    settings = {'email_content': "Votre site {site}", 'use_html': False, 'logo_file': None,
+                'header_content': 'Bonjour {contact_name}', 'footer_content': 'Merci'}
+    contacts = [{'index': i, 'email': f'contact{i}@test.com', 'contact_name': f'Contact {i}',
+                 'site': '{à compléter}' if i % 10 == 3 else f'Site {i}'} for i in range(count)]
+    processed, _ = process_contacts(automation, contacts, settings, workers=1)
+    return automation, settings, contacts, processed
+
+
+def test_runs_are_paged_by_validity_and_survive_reopening(tmp_path):
+    """Entries come back page by page in contact order, as process_contacts returned them"""
+    automation, settings, contacts, processed = _process()
+    path = str(tmp_path / 'processed.db')
+    with ProcessedStore(path) as store:
+        assert store.save_run('run-1', processed, contacts, settings, owner='page-a') == 50
+
+    with ProcessedStore(path) as store:
+        assert store.latest_run('page-b') is None
+        run = store.latest_run('page-a')
+        assert (run['run_id'], run['total'], run['valid']) == ('run-1', 50, 45)
+        assert run['render_settings']['email_content'] == "Votre site {site}"
+        assert store.count('run-1', is_valid=False) == 5
+
+        invalid = store.page('run-1', is_valid=False, offset=2, limit=2)
+        assert [entry['position'] for entry in invalid] == [23, 33]
+        assert {**invalid[0], 'corrected': None} == {**processed[23], 'corrected': None}
+        assert [entry['position'] for entry in store.page('run-1', is_valid=True, limit=None)][:4] == [0, 1, 2, 4]
+        assert [entry['position'] for entry in store.find('run-1', 'contact7@test.com')] == [7]
+
+        stored_contacts = StoredContacts(store, 'run-1')
+        assert stored_contacts[7] == contacts[7] and len(stored_contacts) == 50
+        assert (render_processed_email(processed[7], automation, stored_contacts, settings)
+                == render_processed_email(processed[7], automation, contacts, settings))
+
+
+def test_corrections_are_kept_and_old_runs_pruned(tmp_path):
+    """A hand correction replaces the rendering of its entry; only each owner's last runs are kept"""
+    automation, settings, contacts, processed = _process(20)
+    with ProcessedStore(str(tmp_path / 'processed.db'), max_runs=2) as store:
+        store.save_run('autre', processed, contacts, settings, owner='page-b')
+        sending = StoredContacts(store, 'autre').snapshot([3, 13])
+        for run_id in ('run-1', 'run-2', 'run-3'):
+            store.save_run(run_id, processed, contacts, settings, owner='page-a')
+        assert store.run('run-1') is None and store.count('run-1') == 0 and store.count('run-3') == 20
+        assert store.count('autre') == 20
+
+        # Runs past the retention are pruned whoever they belong to; a snapshot does not depend on them
+        store.retention = 0
+        store.save_run('run-4', processed, contacts, settings, owner='page-a')
+        assert store.run('autre') is None and sending[13] == contacts[13]
+
+        store.save_correction('run-4', 13, 'Bonjour, votre site Parc')
+        corrected = store.page('run-4', is_valid=False, corrected=True)
+        assert [entry['position'] for entry in corrected] == [13]
+        email = render_processed_email(corrected[0], automation, StoredContacts(store, 'run-4'), settings)
+        assert email['personalized_email'] == 'Bonjour, votre site Parc'
+
+        store.mark_valid('run-4', [13])
+        assert store.count('run-4', is_valid=False) == 1
+        moved = store.page('run-4', is_valid=True, offset=12, limit=1)[0]
+        assert moved['position'] == 13 and moved['personalized_email'] == 'Bonjour, votre site Parc'
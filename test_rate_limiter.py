@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for the quota token buckets and the SMTP backoff
+"""
+
+import asyncio
+import time
+
+from async_sender import AsyncSendEngine
+from rate_limiter import QuotaLimiter
+from smtp_sink import SMTPSink
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_buckets_limit_sends_and_persist_across_sessions(tmp_path):
+    """Every bucket must have a token; levels survive a new limiter on the same file"""
+    path = str(tmp_path / 'quota.db')
+    clock = FakeClock()
+    limiter = QuotaLimiter({'minute': 2, 'day': 3}, account='equipe@merciraymond.fr', path=path, clock=clock)
+
+    assert [limiter.reserve() for _ in range(2)] == [0, 0]
+    assert limiter.reserve() == 30  # minute bucket empty: one token every 30 s
+    clock.now += 120
+    assert limiter.remaining() == {'minute': 2, 'day': 0}
+    limiter.close()
+
+    with QuotaLimiter({'minute': 2, 'day': 3}, account='equipe@merciraymond.fr', path=path, clock=clock) as again:
+        # The daily quota is spent: one token every 8 hours, 2 minutes already elapsed
+        assert again.reserve() == 86400 / 3 - 120
+    with QuotaLimiter({'minute': 2, 'day': 3}, account='autre@merciraymond.fr', path=path, clock=clock) as other:
+        assert other.reserve() == 0
+
+
+def test_throttling_replies_back_off_exponentially():
+    """421/450/452-style replies pause every send, doubling up to the cap, until a message goes through"""
+    clock = FakeClock()
+    limiter = QuotaLimiter({}, clock=clock, backoff_base=10, backoff_max=25)
+
+    assert [limiter.on_throttled(None) for _ in range(3)] == [10, 20, 25]
+    assert limiter.reserve() == 25
+    limiter.on_success()
+    clock.now += 25
+    assert limiter.reserve() == 0
+    assert limiter.on_throttled(None) == 10
+
+
+def test_engine_reports_throttling_to_the_limiter():
+    """A 451 from the server delays the retry by the backoff instead of the fixed delay"""
+    limiter = QuotaLimiter({'minute': 600}, backoff_base=0.3)
+    jobs = [{'from_addr': 'equipe@merciraymond.fr', 'recipients': [f'contact{i}@example.com'],
+             'message': f'Subject: Test {i}\r\n\r\nBonjour'} for i in range(3)]
+
+    with SMTPSink(temporary_failures=1) as sink:
+        engine = AsyncSendEngine(sink.host, sink.port, use_starttls=False, pacer=limiter)
+        start = time.perf_counter()
+        summary = asyncio.run(engine.run(jobs))
+        elapsed = time.perf_counter() - start
+
+    assert summary['sent'] == 3 and summary['failed'] == 0
+    assert elapsed >= 0.3
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for the persistent send journal
+"""
+
+import sqlite3
+
+from send_journal import SendJournal, campaign_key, contacts_digest, files_digest
+
+
+def test_resume_after_crash(tmp_path):
+    """A new journal on the same file sees the sent recipients and keeps Message-IDs"""
+    path = str(tmp_path / 'journal.db')
+    campaign = campaign_key('equipe@merciraymond.fr', 'Offre de Noël', 'Bonjour {contact_name}')
+    recipients = [(0, 'a@test.com'), (1, 'b@test.com'), (2, 'c@test.com')]
+
+    first = SendJournal(path, flush_interval=0)
+    message_ids = first.open_campaign(campaign, recipients, domain='merciraymond.fr')
+    first.mark(campaign, 'a@test.com', 'sending')
+    first.mark(campaign, 'a@test.com', 'sent')
+    first.mark(campaign, 'b@test.com', 'sending')
+    # Process dies here: no close()
+
+    second = SendJournal(path)
+    assert second.open_campaign(campaign, recipients, domain='merciraymond.fr') == message_ids
+    assert second.sent_recipients(campaign) == {'a@test.com'}
+    assert second.summary(campaign) == {'queued': 1, 'sending': 1, 'sent': 1, 'failed': 0}
+    assert message_ids['a@test.com'].endswith('@merciraymond.fr>') and len(set(message_ids.values())) == 3
+    second.close()
+    first.close()
+
+    with sqlite3.connect(path) as conn:
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+
+def test_marks_are_batched(tmp_path):
+    """State changes reach the database only when a batch is full"""
+    path = str(tmp_path / 'journal.db')
+    journal = SendJournal(path, batch_size=3, flush_interval=3600)
+    journal.open_campaign('c1', [(i, f'{i}@test.com') for i in range(5)])
+
+    def sent_on_disk():
+        with sqlite3.connect(path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM deliveries WHERE state = 'sent'").fetchone()[0]
+
+    journal.mark('c1', '0@test.com', 'sent')
+    journal.mark('c1', '1@test.com', 'sent')
+    assert sent_on_disk() == 0
+    journal.mark('c1', '2@test.com', 'sent')
+    assert sent_on_disk() == 3
+    journal.mark('c1', '3@test.com', 'failed', '550 Mailbox unavailable')
+    journal.close()
+    assert sent_on_disk() == 3
+
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT error FROM deliveries WHERE position = 3").fetchone()[0] == '550 Mailbox unavailable'
+
+
+def test_edited_contact_list_does_not_resend(tmp_path):
+    """Rows removed or reordered between two runs: recipients already reached are still skipped"""
+    path = str(tmp_path / 'journal.db')
+    message = campaign_key('equipe@merciraymond.fr', 'Offre de Noël', 'Bonjour', files_digest(None))
+    first_list = ['a@test.com', 'b@test.com', 'c@test.com']
+    edited_list = ['C@test.com ', 'a@test.com']
+    first = campaign_key(message, contacts_digest(first_list))
+    edited = campaign_key(message, contacts_digest(edited_list))
+    assert first != edited and first == campaign_key(message, contacts_digest(reversed(first_list)))
+
+    with SendJournal(path, flush_interval=0) as journal:
+        first_ids = journal.open_campaign(first, enumerate(first_list), message_key=message)
+        journal.mark(first, 'a@test.com', 'sent')
+        journal.mark(first, 'c@test.com', 'sending')
+
+    with SendJournal(path) as journal:
+        edited_ids = journal.open_campaign(edited, enumerate(edited_list), message_key=message)
+        assert journal.sent_recipients(edited) == {'a@test.com'}
+        # Sent again after the crash with the same Message-ID
+        assert edited_ids['c@test.com'] == first_ids['c@test.com']
+        # Another message goes to everyone
+        other = campaign_key('equipe@merciraymond.fr', 'Offre de Noël', 'Bonjour', 'piece-jointe')
+        journal.open_campaign(other, enumerate(edited_list))
+        assert journal.sent_recipients(other) == set()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for the background send worker against the local SMTP sink
+"""
+
+import time
+
+from async_sender import AsyncSendEngine
+from campaign_metrics import CampaignMetrics
+from send_journal import SendJournal
+from send_worker import ACTIVE_STATES, SendWorker
+from smtp_policy import Pacer
+from smtp_sink import SMTPSink
+
+
+def _campaign(sink, count, delay=0.0):
+    return {
+        'campaign_id': 'campagne-test',
+        'emails': [{'position': i, 'email': f'contact{i}@example.com'} for i in range(count)],
+        'render_email': lambda entry: entry,
+        'build_job': lambda email_data, message_id: {
+            'from_addr': 'equipe@merciraymond.fr', 'recipients': [email_data['email']],
+            'message': f'Message-ID: {message_id}\r\nSubject: Test\r\n\r\nBonjour', 'email_data': email_data
+        },
+        'engine': AsyncSendEngine(sink.host, sink.port, use_starttls=False, pacer=Pacer(delay)),
+    }
+
+
+def _wait(worker, campaign_id, states=ACTIVE_STATES, timeout=10):
+    deadline = time.monotonic() + timeout
+    while worker.status(campaign_id)['state'] in states and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return worker.status(campaign_id)
+
+
+def test_campaign_runs_in_the_background(tmp_path):
+    """submit() returns at once; the status reports the counters and throughput when done"""
+    worker = SendWorker(str(tmp_path / 'journal.db'))
+
+    with SMTPSink() as sink:
+        campaign_id = worker.submit(_campaign(sink, 4, delay=0.05))
+        assert worker.status(campaign_id)['state'] in ('queued', 'running')
+        status = _wait(worker, campaign_id)
+
+    assert status['state'] == 'done' and status['sent'] == 4 and status['failed'] == 0
+    assert status['progress'] == 1.0 and status['messages_per_second'] > 0
+    assert len(sink.messages) == 4
+
+
+def test_pause_cancel_and_resume(tmp_path):
+    """Pause holds new sends; a cancelled campaign submitted again only sends the rest"""
+    worker = SendWorker(str(tmp_path / 'journal.db'))
+
+    with SMTPSink() as sink:
+        campaign_id = worker.submit(_campaign(sink, 6, delay=0.1))
+        _wait(worker, campaign_id, states=('queued',))
+        worker.pause(campaign_id)
+        time.sleep(0.4)
+        held = len(sink.messages)
+        time.sleep(0.3)
+        assert worker.status(campaign_id)['state'] == 'paused' and len(sink.messages) == held < 6
+
+        worker.cancel(campaign_id)
+        status = _wait(worker, campaign_id)
+        assert status['state'] == 'cancelled' and status['failed'] == 0
+
+        worker.submit(_campaign(sink, 6))
+        status = _wait(worker, campaign_id)
+
+    assert status['state'] == 'done' and status['already_sent'] == held and status['sent'] == 6 - held
+    assert sorted(m['recipients'][0] for m in sink.messages) == [f'contact{i}@example.com' for i in range(6)]
+
+
+def test_failing_render_does_not_block_the_worker(tmp_path):
+    """A message that cannot be rendered fails alone and the next campaign still runs"""
+    worker = SendWorker(str(tmp_path / 'journal.db'))
+
+    def render_email(entry):
+        if entry['position'] == 1:
+            raise KeyError('site')
+        return entry
+
+    with SMTPSink() as sink:
+        first = worker.submit({**_campaign(sink, 3), 'campaign_id': 'a', 'render_email': render_email})
+        second = worker.submit({**_campaign(sink, 2), 'campaign_id': 'b'})
+        first_status = _wait(worker, first)
+        second_status = _wait(worker, second)
+
+    assert (first_status['state'], first_status['sent'], first_status['failed']) == ('done', 2, 1)
+    assert first_status['errors'][0][0] == 'contact1@example.com' and 'KeyError' in first_status['errors'][0][1]
+    assert (second_status['state'], second_status['sent']) == ('done', 2)
+
+    journal = SendJournal(str(tmp_path / 'journal.db'))
+    assert journal.summary('a')['failed'] == 1
+    journal.close()
+
+
+def test_metrics_clock_starts_when_the_campaign_runs(tmp_path):
+    """Time spent queued behind another campaign is not counted in the rates"""
+    worker = SendWorker(str(tmp_path / 'journal.db'))
+    metrics = CampaignMetrics('b')
+
+    with SMTPSink() as sink:
+        first = worker.submit({**_campaign(sink, 3, delay=0.1), 'campaign_id': 'a'})
+        second = worker.submit({**_campaign(sink, 2), 'campaign_id': 'b', 'metrics': metrics})
+        _wait(worker, second)
+
+    summary = metrics.summary()
+    assert summary['started_at'] >= worker.status(first)['finished_at']
+    assert worker.status(second)['sent'] == 2
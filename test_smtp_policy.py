@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared pacing and concurrency rules
+"""
+
+from smtp_policy import AIMDController
+
+
+def test_aimd_controller():
+    """Additive increase per window, multiplicative decrease on congestion"""
+    controller = AIMDController(initial=2, maximum=4, latency_target=1.0)
+
+    for _ in range(3):
+        controller.on_success(0.1)
+    assert controller.concurrency == 3
+
+    controller.on_congestion()
+    assert controller.concurrency == 1
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Tests for the compiled template renderer
+"""
+
+from email_core import EmailAutomation
+from template_renderer import CompiledTemplate
+
+
+def test_render_replaces_slots_in_one_pass():
+    """Each placeholder is filled from the contact, unknown ones are kept"""
+    template = CompiledTemplate("Bonjour {contact_name}, votre {site} {inconnu} {}")
+
+    rendered = template.render({'contact_name': 'Marie', 'site': 'Bureau Paris'})
+
+    assert rendered == "Bonjour Marie, votre Bureau Paris {inconnu} {}"
+    assert template.placeholders == ['contact_name', 'site', 'inconnu', '']
+
+
+def test_render_fallbacks_and_reserved_keys():
+    """Reserved keys are never substituted and fallbacks fill missing slots"""
+    template = CompiledTemplate("{contact_name} <{email}> {site}")
+
+    rendered = template.render({'email': 'marie@test.com', 'site': ''},
+                               {'contact_name': 'Madame/Monsieur'})
+
+    assert rendered == "Madame/Monsieur <{email}> "
+
+
+def test_value_filter_applies_to_contact_values():
+    """Contact values go through the filter, literals do not"""
+    template = CompiledTemplate("Adresse:\n{site}", value_filter=lambda v: v.replace('\n', '<br>'))
+
+    assert template.render({'site': 'Bâtiment A\nParis'}) == "Adresse:\nBâtiment A<br>Paris"
+
+
+def test_render_with_report_names_unfilled_slots():
+    """Missing, empty and brace-containing values are reported per slot name"""
+    template = CompiledTemplate("{contact_name} {site} {ville} {societe} {site}")
+
+    rendered, report = template.render_with_report(
+        {'site': '', 'societe': '{à compléter}'}, {'contact_name': 'Madame/Monsieur'})
+
+    assert rendered == template.render({'site': '', 'societe': '{à compléter}'}, {'contact_name': 'Madame/Monsieur'})
+    assert report == {'missing': ['ville'], 'empty': ['site', 'site'], 'braces': ['societe'], 'leftover': []}
+
+
+def test_braces_of_the_template_text_are_flagged():
+    """{{Nom}} renders {Marie}: the email is invalid, as when the whole result was scanned"""
+    automation = EmailAutomation()
+    contact = {'email': 'marie@test.com', 'Nom': 'Marie', 'contact_name': 'Marie'}
+
+    for use_html in (False, True):
+        personalized, verification = automation.personalize_and_verify(contact, "Bonjour {{Nom}} {ville}",
+                                                                       use_html=use_html)
+        assert '{Marie}' in personalized and not verification['is_valid']
+        assert verification['issues'] == [
+            "Placeholder trouvé: {ville} (colonne 'ville' absente du fichier)", "Placeholder trouvé: {Marie}"]
+
+    rendered, report = CompiledTemplate("Bonjour {{Nom}}").render_with_report({'Nom': 'Marie'})
+    assert rendered == "Bonjour {Marie}" and report['leftover'] == ['{Marie}']